@@ -98,6 +98,7 @@ mkdir -p %{buildroot}/srv/pulp
 mkdir -p %{buildroot}/%{_usr}/lib/pulp/plugins/types
 mkdir -p %{buildroot}/%{_var}/lib/pulp/published/puppet/http
 mkdir -p %{buildroot}/%{_var}/lib/pulp/published/puppet/https
+mkdir -p %{buildroot}/%{_var}/lib/pulp/published/puppet/master
 
 cp -R pulp_puppet_plugins/etc/httpd %{buildroot}/%{_sysconfdir}
 cp pulp_puppet_plugins/etc/pulp/vhosts80/puppet.conf %{buildroot}/%{_sysconfdir}/pulp/vhosts80/
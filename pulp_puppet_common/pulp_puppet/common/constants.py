@@ -57,10 +57,60 @@ REPO_NOTE_PUPPET = 'puppet-repo'
 # Name of the hosted file describing the contents of the repository
 REPO_METADATA_FILENAME = 'modules.json'
 
+# Suffixes of the hosted files, published beside the metadata file, holding a
+# gzip compressed copy of it and its SHA-256 checksum
+REPO_METADATA_GZIP_SUFFIX = '.gz'
+REPO_METADATA_CHECKSUM_SUFFIX = '.sha256'
+
 # Name of the file that holds dependency data, which is required by the WSGI
 # app that implements puppet forge's API
 REPO_DEPDATA_FILENAME = '.dependency_db'
 
+# Name of the file that holds the same data as the dependency database in a
+# memory-mappable, read-optimized form, which the WSGI app prefers
+REPO_DEPINDEX_FILENAME = '.dependency_index'
+
+# Key in the dependency database holding the format of the database. Module
+# keys never start with a ".", so this can never collide with one. Databases
+# without this key were published before each module's releases were stored
+# in ascending semantic version order.
+REPO_DEPDATA_FORMAT_KEY = '.format'
+REPO_DEPDATA_FORMAT_VERSION = '5'
+
+# First database formats in which each module's releases are sorted, in which
+# the dependency closure of each module is stored, and in which each release
+# holds its version's sort key and the latest release of each module is stored,
+# and in which the module search index is stored
+REPO_DEPDATA_SORTED_FORMAT = 2
+REPO_DEPDATA_CLOSURE_FORMAT = 3
+REPO_DEPDATA_LATEST_FORMAT = 4
+REPO_DEPDATA_SEARCH_FORMAT = 5
+
+# Prefix of the key, followed by the module's "author/name", under which the
+# names of all modules a module depends on directly or indirectly are stored
+REPO_DEPDATA_CLOSURE_KEY_PREFIX = '.closure/'
+
+# Prefix of the key, followed by the module's "author/name", under which the
+# latest release of a module is stored
+REPO_DEPDATA_LATEST_KEY_PREFIX = '.latest/'
+
+# Key under which the sorted names, in the form "author/name", of all modules in
+# the repository are stored
+REPO_DEPDATA_MODULES_KEY = '.modules'
+
+# Prefix of the key, followed by the module's "author/name", under which the
+# metadata of the latest release of a module that is shown in search results
+# is stored
+REPO_DEPDATA_MODULE_KEY_PREFIX = '.module/'
+
+# Prefix of the key, followed by a search term, under which the sorted names of
+# the modules whose metadata contains the term are stored
+REPO_DEPDATA_SEARCH_KEY_PREFIX = '.search/'
+
+# Name of the file, kept in the repository's working directory, that records
+# which modules were in the build directory as of the last successful publish
+PUBLISH_MANIFEST_FILENAME = 'publish_manifest.json'
+
 # File name inside of a module where its metadata is found
 MODULE_METADATA_FILENAME = 'metadata.json'
 
@@ -68,6 +118,10 @@ MODULE_METADATA_FILENAME = 'metadata.json'
 # Substitutions: author first character, author
 HOSTED_MODULE_FILE_RELATIVE_PATH = 'system/releases/%s/%s/'
 
+# Location in the repository of the pre-rendered forge API responses; the
+# response for a module is in "<author>/<name>.json" beneath it
+STATIC_RELEASES_RELATIVE_PATH = 'api/v1/releases'
+
 # Name template for a module
 # Substitutions: author, name, version
 MODULE_FILENAME = '%s-%s-%s.tar.gz'
@@ -80,6 +134,9 @@ STORAGE_MODULE_RELATIVE_PATH = '%s'
 #Default hashlib encoder to user
 DEFAULT_HASHLIB = 'sha256'
 
+# Hashlib encoder used for the module file checksum served by the forge API
+FILE_MD5_HASHLIB = 'md5'
+
 # -- progress states ----------------------------------------------------------
 
 STATE_NOT_STARTED = 'not-started'
@@ -114,6 +171,16 @@ DEFAULT_SERVE_HTTP = True
 CONFIG_SERVE_HTTPS = 'serve_https'
 DEFAULT_SERVE_HTTPS = False
 
+# Controls if the forge API responses for each module will be pre-rendered
+# into static files when publishing
+CONFIG_STATIC_RELEASES = 'static_releases'
+DEFAULT_STATIC_RELEASES = False
+
+# Controls if the forge API only returns the versions of a module's dependencies
+# that can satisfy all version requirements, rather than all of their versions
+CONFIG_PRUNED_DEPENDENCIES = 'pruned_dependencies'
+DEFAULT_PRUNED_DEPENDENCIES = False
+
 # Local directory the web server will serve for HTTP repositories
 CONFIG_HTTP_DIR = 'http_dir'
 DEFAULT_HTTP_DIR = '/var/lib/pulp/published/puppet/http/repos'
@@ -126,6 +193,15 @@ DEFAULT_HTTPS_DIR = '/var/lib/pulp/published/puppet/https/repos'
 CONFIG_FILE_HTTPS_DIR = 'https_files_dir'
 DEFAULT_FILE_HTTPS_DIR = '/var/lib/pulp/published/puppet/files'
 
+# Local directory holding the timestamped builds of each published repository.
+# The entries in the HTTP and HTTPS directories are symlinks to a build here.
+CONFIG_MASTER_DIR = 'master_dir'
+DEFAULT_MASTER_DIR = '/var/lib/pulp/published/puppet/master'
+
+# Number of threads used to create module symlinks while publishing
+CONFIG_SYMLINK_THREADS = 'symlink_threads'
+DEFAULT_SYMLINK_THREADS = 1
+
 # Default absolute path component of URL where repos are stored
 CONFIG_ABSOLUTE_PATH = 'absolute_path'
 DEFAULT_ABSOLUTE_PATH = '/pulp/puppet/'
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Contains the read-optimized form of a repository's dependency database that
+is published beside it.
+
+The index is an immutable file holding the same keys and values as the
+dependency database. It is laid out as a header, a directory with one
+fixed-size entry per key sorted by key, and the keys and values themselves.
+Readers memory map the file and binary search the directory, so opening it
+is cheap and every process serving the repository shares the same pages of
+the page cache.
+
+Header: magic, format version, number of keys
+Directory entry: key offset, key length, value offset, value length
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = 'PPDI'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sII')
+_ENTRY = struct.Struct('<QIQI')
+
+
+def write_index(path, db):
+    """
+    Writes the index for the given dependency database. The index is written
+    to a temporary file that is then renamed into place, so readers never see
+    a partially written index.
+
+    :param path: full path to which the index is written
+    :type  path: str
+    :param db: dependency database to index
+    :type  db: gdbm database
+    """
+    keys = sorted(db.keys())
+    data_offset = _HEADER.size + _ENTRY.size * len(keys)
+
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'wb')
+    try:
+        # the keys and values are written first, since their offsets are
+        # needed for the directory
+        f.seek(data_offset)
+        entries = []
+        offset = data_offset
+        for key in keys:
+            value = db[key]
+            f.write(key)
+            f.write(value)
+            entries.append(_ENTRY.pack(offset, len(key), offset + len(key), len(value)))
+            offset += len(key) + len(value)
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(keys)))
+        f.write(''.join(entries))
+    finally:
+        f.close()
+
+    os.rename(tmp_path, path)
+
+
+class DependencyIndex(object):
+    """
+    Read-only view of a published dependency index. It supports the subset of
+    the gdbm interface used to read the dependency database.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: full path to the index
+        :type  path: str
+
+        :raise IOError: if the index cannot be read
+        :raise ValueError: if the file is not an index in a supported format
+        """
+        f = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            # the mapping stays valid after the file is closed
+            f.close()
+
+        try:
+            magic, version, self._count = _HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            self._map.close()
+            raise ValueError('%s is not a dependency index' % path)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError('%s is not a dependency index in a supported format' % path)
+
+    def __getitem__(self, key):
+        entry = self._find(key)
+        if entry is None:
+            raise KeyError(key)
+        value_offset, value_length = entry
+        return self._map[value_offset:value_offset + value_length]
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def has_key(self, key):
+        return key in self
+
+    def keys(self):
+        """
+        :return: all keys in the index, in sorted order
+        :rtype:  list of str
+        """
+        keys = []
+        for i in range(self._count):
+            key_offset, key_length, value_offset, value_length = self._entry(i)
+            keys.append(self._map[key_offset:key_offset + key_length])
+        return keys
+
+    def close(self):
+        self._map.close()
+
+    def _entry(self, i):
+        """
+        :return: key offset, key length, value offset and value length of the
+                 i-th directory entry
+        :rtype:  tuple
+        """
+        return _ENTRY.unpack_from(self._map, _HEADER.size + _ENTRY.size * i)
+
+    def _find(self, key):
+        """
+        Binary searches the directory for the given key.
+
+        :return: value offset and value length of the key; None if the key is
+                 not in the index
+        :rtype:  tuple or None
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, value_offset, value_length = self._entry(middle)
+            middle_key = self._map[key_offset:key_offset + key_length]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return value_offset, value_length
+        return None
@@ -17,6 +17,7 @@ and methods to serialize and deserialize them.
 """
 
 import copy
+from cStringIO import StringIO
 
 from pulp.common.compat import json
 
@@ -25,17 +26,30 @@ from pulp_puppet.common import constants
 
 class RepositoryMetadata(object):
 
+    # Fields of each module included in the repository metadata document
+    METADATA_FIELDS = ('name', 'author', 'version', 'tag_list')
+
     def __init__(self):
         self.modules = []
 
+        # Unit keys of every module already merged into this instance. Used to
+        # collapse modules returned by more than one query into a single entry.
+        self._module_keys = set()
+
     def update_from_json(self, metadata_json):
         """
         Updates this metadata instance with modules found in the given JSON
         document. This can be called multiple times to merge multiple
-        repository metadata JSON documents into this instance.
+        repository metadata JSON documents into this instance. Modules whose
+        unit key was already merged by a previous call are skipped without
+        being converted again.
+
+        :param metadata_json: repository metadata document
+        :type  metadata_json: str
 
-        :return: object representing the repository and all of its modules
-        :rtype:  RepositoryMetadata
+        :return: number of modules listed in the given document, including
+                 those that were already present in this instance
+        :rtype:  int
         """
 
         parsed = json.loads(metadata_json)
@@ -43,29 +57,48 @@ class RepositoryMetadata(object):
         # The contents of the metadata document is a list of dictionaries,
         # each represnting a single module.
         for module_dict in parsed:
+            key = tuple(module_dict.get(k) for k in Module.UNIT_KEY_NAMES)
+            if key in self._module_keys:
+                continue
+
             module = Module.from_dict(module_dict)
             self.modules.append(module)
+            self._module_keys.add(key)
+
+        return len(parsed)
 
     def to_json(self):
         """
         Serializes the repository metadata into its JSON representation.
         """
+        output = StringIO()
+        self.write_json((m.to_dict() for m in self.modules), output)
+        return output.getvalue()
 
-        # Assemble all of the modules in dictionary form
-        module_dicts = [m.to_dict() for m in self.modules]
-
-        # For each module, we only want a small subset of data that goes in the
-        # repo metadata document
-        limited_module_dicts = []
-        included_fields = ('name', 'author', 'version', 'tag_list')
-        for m in module_dicts:
-            clean_module = dict([(k, v) for k, v in m.items() if k in included_fields])
-            limited_module_dicts.append(clean_module)
-
-        # Serialize the dictionaries into a single JSON document
-        serialized = json.dumps(limited_module_dicts)
-
-        return serialized
+    @classmethod
+    def write_json(cls, module_dicts, output):
+        """
+        Writes the JSON representation of the repository metadata for the given
+        modules to a file-like object. Each module is serialized and written as
+        soon as it is read from the iterable, so memory use does not grow with
+        the number of modules.
+
+        :param module_dicts: modules in the dict form returned by
+                             Module.to_dict; only the fields in
+                             METADATA_FIELDS are written
+        :type  module_dicts: iterable of dict
+        :param output: object to which the document is written
+        :type  output: file
+        """
+        output.write('[')
+        for i, module_dict in enumerate(module_dicts):
+            if i:
+                output.write(', ')
+            # Only a small subset of each module's data goes in the repo
+            # metadata document
+            clean_module = dict([(k, module_dict.get(k)) for k in cls.METADATA_FIELDS])
+            output.write(json.dumps(clean_module))
+        output.write(']')
 
 
 class Module(object):
@@ -170,6 +203,7 @@ class Module(object):
         self.checksums = None  # dict of file name (with relative path) to checksum
         self.checksum = None  # checksum for the .tgz of the unit itself
         self.checksum_type = constants.DEFAULT_HASHLIB
+        self.file_md5 = None  # md5 of the .tgz, served by the forge API
 
     def to_dict(self):
         """
@@ -214,6 +248,7 @@ class Module(object):
         self.checksums = module_dict.get('checksums', {})
         self.checksum = module_dict.get('checksum', None)
         self.checksum_type = module_dict.get('checksum_type', constants.DEFAULT_HASHLIB)
+        self.file_md5 = module_dict.get('file_md5', None)
 
         # Special handling of the DB-safe checksum to rebuild it
         if isinstance(self.checksums, list):
@@ -241,7 +276,8 @@ class Module(object):
             'types': self.types,
             'dependencies': self.dependencies,
             'checksum': self.checksum,
-            'checksum_type': self.checksum_type
+            'checksum_type': self.checksum_type,
+            'file_md5': self.file_md5,
         }
 
         # Checksums is expressed as a dict of file to checksum. This causes
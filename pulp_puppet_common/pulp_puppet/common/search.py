@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Splits module metadata and search queries into the terms of the module search
+index that is published with a repository's dependency data. Publishing and
+searching must split text the same way, so both use this module.
+"""
+
+import re
+
+# A term is a run of letters and digits; everything else separates terms
+_TERM = re.compile(r'[a-z0-9]+')
+
+
+def terms(text):
+    """
+    :param text: text to split, such as a search query
+    :type  text: basestring or None
+
+    :return: the distinct terms in the text, lower cased
+    :rtype:  set of str
+    """
+    if not text:
+        return set()
+    return set(str(term) for term in _TERM.findall(text.lower()))
+
+
+def module_terms(entry):
+    """
+    :param entry: search entry of a module, with keys "author", "name",
+                  "summary", "description" and "tag_list"
+    :type  entry: dict
+
+    :return: the terms under which the module is found, which are those in its
+             author, name, summary, description and tags
+    :rtype:  set of str
+    """
+    found = set()
+    for text in [entry.get('author'), entry.get('name'), entry.get('summary'),
+                 entry.get('description')] + list(entry.get('tag_list') or []):
+        found.update(terms(text))
+    return found
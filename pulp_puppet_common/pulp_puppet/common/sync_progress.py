@@ -55,6 +55,7 @@ class SyncProgressReport(object):
         r.metadata_current_query = m['current_query']
         r.metadata_query_finished_count = m['query_finished_count']
         r.metadata_query_total_count = m['query_total_count']
+        r.metadata_query_result_counts = m.get('query_result_counts', [])
         r.metadata_error_message = m['error_message']
         r.metadata_exception = m['error']
         r.metadata_traceback = m['traceback']
@@ -80,6 +81,10 @@ class SyncProgressReport(object):
         self.metadata_query_finished_count = None
         self.metadata_query_total_count = None
         self.metadata_current_query = None
+        # list of dictionaries, one per query in the order the queries were
+        # run. The keys are result_count (modules returned by the query) and
+        # new_count (modules not already returned by an earlier query).
+        self.metadata_query_result_counts = []
         self.metadata_execution_time = None
         self.metadata_error_message = None
         self.metadata_exception = None
@@ -176,6 +181,7 @@ class SyncProgressReport(object):
             'current_query' : self.metadata_current_query,
             'query_finished_count' : self.metadata_query_finished_count,
             'query_total_count' : self.metadata_query_total_count,
+            'query_result_counts' : self.metadata_query_result_counts,
             'error_message' : self.metadata_error_message,
             'error' : reporting.format_exception(self.metadata_exception),
             'traceback' : reporting.format_traceback(self.metadata_traceback),
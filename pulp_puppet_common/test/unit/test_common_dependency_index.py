@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp_puppet.common import dependency_index
+from pulp_puppet.common.dependency_index import DependencyIndex
+
+
+class DependencyIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='pulp-puppet-dep-index')
+        self.path = os.path.join(self.tmp_dir, '.dependency_index')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        # Setup
+        db = dict(('author%d/module%d' % (i, i), '[{"version": "%d.0.0"}]' % i)
+                  for i in range(100))
+        db['.format'] = '3'
+
+        # Test
+        dependency_index.write_index(self.path, db)
+        index = DependencyIndex(self.path)
+
+        # Verify
+        try:
+            for key, value in db.items():
+                self.assertEqual(index[key], value)
+                self.assertTrue(index.has_key(key))
+            self.assertEqual(index.keys(), sorted(db.keys()))
+            self.assertFalse('author1000/module1000' in index)
+            self.assertFalse(index.has_key('a'))
+            self.assertRaises(KeyError, index.__getitem__, 'zzz/zzz')
+            self.assertEqual(index[u'author1/module1'], db['author1/module1'])
+        finally:
+            index.close()
+
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_empty(self):
+        # Test
+        dependency_index.write_index(self.path, {})
+        index = DependencyIndex(self.path)
+
+        # Verify
+        self.assertEqual(index.keys(), [])
+        self.assertRaises(KeyError, index.__getitem__, 'me/foo')
+        index.close()
+
+    def test_missing(self):
+        self.assertRaises(IOError, DependencyIndex, self.path)
+
+    def test_not_an_index(self):
+        # Setup
+        for content in ('', 'GDBM', 'x' * 100):
+            f = open(self.path, 'w')
+            f.write(content)
+            f.close()
+
+            # Test
+            self.assertRaises(ValueError, DependencyIndex, self.path)
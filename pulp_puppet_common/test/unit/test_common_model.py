@@ -11,6 +11,7 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+from cStringIO import StringIO
 import unittest
 
 from pulp.common.compat import json
@@ -109,6 +110,19 @@ class RepositoryMetadataTests(unittest.TestCase):
         self.assertEqual(sorted_modules[1].checksum, 'foo')
         self.assertEqual(sorted_modules[1].checksum_type, 'foo_type')
 
+    def test_update_from_json_merges_duplicates(self):
+        # Setup
+        metadata = RepositoryMetadata()
+        first_count = metadata.update_from_json(VALID_REPO_METADATA_JSON)
+
+        # Test
+        second_count = metadata.update_from_json(VALID_REPO_METADATA_JSON)
+
+        # Verify
+        self.assertEqual(first_count, 2)
+        self.assertEqual(second_count, 2)
+        self.assertEqual(2, len(metadata.modules))
+
     def test_to_json(self):
         # Setup
         metadata = RepositoryMetadata()
@@ -137,6 +151,36 @@ class RepositoryMetadataTests(unittest.TestCase):
         self.assertEqual(sorted_modules[1]['tag_list'], ['postfix', 'applications'])
 
 
+    def test_write_json(self):
+        # Setup
+        module_dicts = [
+            {'name' : 'common', 'author' : 'lab42', 'version' : '0.0.1',
+             'tag_list' : [], 'description' : 'not written'},
+            {'name' : 'postfix', 'author' : 'lab42', 'version' : '0.0.2'},
+        ]
+        output = StringIO()
+
+        # Test
+        RepositoryMetadata.write_json(iter(module_dicts), output)
+
+        # Verify
+        parsed = json.loads(output.getvalue())
+        self.assertEqual(parsed, [
+            {'name' : 'common', 'author' : 'lab42', 'version' : '0.0.1', 'tag_list' : []},
+            {'name' : 'postfix', 'author' : 'lab42', 'version' : '0.0.2', 'tag_list' : None},
+        ])
+
+    def test_write_json_empty(self):
+        # Setup
+        output = StringIO()
+
+        # Test
+        RepositoryMetadata.write_json([], output)
+
+        # Verify
+        self.assertEqual(json.loads(output.getvalue()), [])
+
+
 class ModuleTests(unittest.TestCase):
 
     def test_update_from_json(self):
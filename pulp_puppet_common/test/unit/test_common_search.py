@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+from pulp_puppet.common import search
+
+
+class SearchTests(unittest.TestCase):
+
+    def test_terms(self):
+        self.assertEqual(search.terms('Manages the Apache2 web-server, apache2'),
+                         set(['manages', 'the', 'apache2', 'web', 'server']))
+
+    def test_terms_type(self):
+        found = search.terms(u'Apache')
+
+        self.assertEqual(found, set(['apache']))
+        self.assertTrue(isinstance(list(found)[0], str))
+
+    def test_terms_empty(self):
+        self.assertEqual(search.terms(None), set())
+        self.assertEqual(search.terms(''), set())
+        self.assertEqual(search.terms(' - '), set())
+
+    def test_module_terms(self):
+        entry = {'author': 'puppetlabs', 'name': 'apache', 'summary': 'Web server',
+                 'description': None, 'tag_list': ['httpd', 'Web']}
+
+        self.assertEqual(search.module_terms(entry),
+                         set(['puppetlabs', 'apache', 'web', 'server', 'httpd']))
+
+    def test_module_terms_missing(self):
+        self.assertEqual(search.module_terms({'author': 'me', 'name': 'mymodule'}),
+                         set(['me', 'mymodule']))
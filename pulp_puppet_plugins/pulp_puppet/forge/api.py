@@ -19,20 +19,23 @@ import urllib
 from pulp.server.db import connection
 import web
 
-from pulp_puppet.forge import releases
+from pulp_puppet.forge import encoding, releases, requirements
 
 # This is all that is required to start using Manager classes
 connection.initialize()
 
 pre_33_urls = (
     '/releases.json', 'Releases',
+    '/resolve.json', 'Resolve',
 )
 post_33_urls = (
     '/([^/]+)/([^/]+)/api/v1/releases.json', 'Releases',
+    '/([^/]+)/([^/]+)/api/v1/resolve.json', 'Resolve',
 )
 
 post_36_urls = (
     '/releases', 'ReleasesPost36',
+    '/modules', 'Modules',
 )
 
 pre_33_app = web.application(pre_33_urls, globals())
@@ -41,6 +44,14 @@ post_36_app = web.application(post_36_urls, globals())
 
 MODULE_PATTERN = re.compile('(^[a-zA-Z0-9]+)(/|-)([a-zA-Z0-9_]+)$')
 
+# Environment variable, such as one set with Apache's SetEnv directive, whose
+# value is sent as the Cache-Control header of the responses to GET requests
+CACHE_CONTROL_ENV = 'PULP_PUPPET_FORGE_CACHE_CONTROL'
+
+# Environment variable whose value, from 0 to 9, is the level at which
+# responses are compressed for clients that accept it; 0 disables compression
+COMPRESSION_LEVEL_ENV = 'PULP_PUPPET_FORGE_COMPRESSION_LEVEL'
+
 
 class Releases(object):
     REPO_RESOURCE = 'repository'
@@ -58,18 +69,10 @@ class Releases(object):
         command has hard-coded absolute paths, so we cannot put consumer or
         repository IDs in the URL's path.
         """
-        if resource_type is not None:
-            if resource_type == self.REPO_RESOURCE:
-                credentials = ('.', resource)
-            elif resource_type == self.CONSUMER_RESOURCE:
-                credentials = (resource, '.')
-            else:
-                return web.notfound()
-
-        else:
-            credentials = self._get_credentials()
-            if not credentials:
-                return web.unauthorized()
+        try:
+            credentials = self._get_request_credentials(resource_type, resource)
+        except web.HTTPError, e:
+            return e
 
         module_name = self._get_module_name()
         if not module_name:
@@ -78,29 +81,184 @@ class Releases(object):
             return web.badrequest()
         version = web.input().get('version')
 
+        compression = self._negotiate_compression()
+        etag = self._get_etag(credentials, compression)
+        if self._not_modified(etag):
+            return self._not_modified_response(etag)
+
         data = self.get_releases(*credentials, module_name=module_name, version=version)
-        return self.format_results(data)
+        self._set_caching_headers(etag)
+        return self.format_results(data, compression)
 
     def get_releases(self, *args, **kwargs):
         """
-        Get the list of matching releases
+        Get the list of matching releases. The "pruned" query parameter, if
+        given, overrides whether the repositories' distributors are configured
+        to only return the dependency versions that can satisfy all version
+        requirements.
 
         :return: The matching modules
         :rtype: dict
         """
+        pruned = self._get_pruned()
+        if pruned is not None:
+            kwargs['pruned'] = pruned
         return releases.view(*args, **kwargs)
 
-    def format_results(self, data):
+    def format_results(self, data, compression=None):
         """
         Format the results and begin streaming out to the caller
 
-        :param data: The module data to stream back to the caller
+        :param data: The module data to stream back to the caller. It may be
+                     shared with other requests.
         :type data: dict
-        :return: the body of what should be streamed out to the caller
-        :rtype: str
+        :param compression: content coding and level with which to compress the
+                            results, as returned by _negotiate_compression
+        :type compression: tuple
+        :return: the chunks of the body of what should be streamed out to the caller
+        :rtype: iterator of str
         """
         web.header('Content-Type', 'application/json')
-        return json.dumps(data)
+        self._set_content_encoding(compression)
+        return encoding.shared_json_chunks(data, compression=compression)
+
+    def _get_request_credentials(self, resource_type, resource):
+        """
+        :param resource_type: type of the resource named in the URL's path, if any
+        :type  resource_type: str
+        :param resource:      ID of the resource named in the URL's path, if any
+        :type  resource:      str
+
+        :return: consumer ID and repository ID identified by the URL's path,
+                 or else by the basic auth credentials
+        :rtype:  str, str
+
+        :raise web.HTTPError: if the resource type is not known, or if no
+                              resource is named and no credentials were provided
+        """
+        if resource_type is not None:
+            if resource_type == self.REPO_RESOURCE:
+                return '.', resource
+            elif resource_type == self.CONSUMER_RESOURCE:
+                return resource, '.'
+            else:
+                raise web.notfound()
+
+        credentials = self._get_credentials()
+        if not credentials:
+            raise web.unauthorized()
+        return credentials
+
+    def _get_etag(self, credentials, compression=None):
+        """
+        :param credentials: consumer ID and repository ID of the request
+        :type  credentials: tuple
+        :param compression: content coding and level with which the response
+                            is compressed, as returned by _negotiate_compression
+        :type  compression: tuple
+
+        :return: ETag of the response to a GET request, which changes whenever
+                 a repository the response is built from is published. Each
+                 content coding of a response has its own ETag. None if it
+                 cannot be computed.
+        :rtype:  str or None
+        """
+        return releases.get_etag(credentials[0], credentials[1], web.ctx.host, web.ctx.fullpath,
+                                 compression)
+
+    @staticmethod
+    def _not_modified(etag):
+        """
+        Only the computed ETag is compared; "*" is not taken to match, since
+        it would also match requests for modules or repositories that do not
+        exist.
+
+        :param etag: ETag of the response, as returned by _get_etag
+        :type  etag: str or None
+
+        :return: True if the ETag matches the If-None-Match header of the
+                 request, so the client's copy of the response is current
+        :rtype:  bool
+        """
+        if etag is None:
+            return False
+        if_none_match = web.ctx.env.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            # GET requests are compared weakly, which ignores the weakness flag
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    @staticmethod
+    def _set_caching_headers(etag):
+        """
+        Sets the caching headers of a successful response to a GET request:
+        the configured Cache-Control header and the ETag header. They are not
+        set on error responses, which must not be cached as the resource.
+
+        :param etag: ETag of the response, as returned by _get_etag
+        :type  etag: str or None
+        """
+        cache_control = web.ctx.env.get(CACHE_CONTROL_ENV)
+        if cache_control:
+            web.header('Cache-Control', cache_control)
+        if etag is not None:
+            web.header('ETag', etag)
+
+    @staticmethod
+    def _negotiate_compression():
+        """
+        Chooses how to compress the response from the Accept-Encoding header of
+        the request and the configured compression level. Unless compression
+        is disabled, the response varies with the Accept-Encoding header, so
+        a Vary header saying so is set.
+
+        :return: content coding and level with which to compress the response;
+                 None if it is not compressed
+        :rtype:  tuple or None
+        """
+        try:
+            level = int(web.ctx.env.get(COMPRESSION_LEVEL_ENV,
+                                        encoding.DEFAULT_COMPRESSION_LEVEL))
+        except ValueError:
+            level = encoding.DEFAULT_COMPRESSION_LEVEL
+        level = min(level, 9)
+        if level <= 0:
+            return None
+
+        web.header('Vary', 'Accept-Encoding')
+        coding = encoding.negotiate(web.ctx.env.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return None
+        return coding, level
+
+    @staticmethod
+    def _set_content_encoding(compression):
+        """
+        :param compression: content coding and level with which the response is
+                            compressed, as returned by _negotiate_compression
+        :type  compression: tuple
+        """
+        if compression is not None:
+            web.header('Content-Encoding', compression[0])
+
+    @classmethod
+    def _not_modified_response(cls, etag):
+        """
+        :param etag: ETag of the response, as returned by _get_etag
+        :type  etag: str
+
+        :return: body of a 304 Not Modified response, which must be empty
+        :rtype:  str
+        """
+        cls._set_caching_headers(etag)
+        web.ctx.status = '304 Not Modified'
+        return ''
 
     @staticmethod
     def _get_credentials():
@@ -123,17 +281,151 @@ class Releases(object):
         """
         :return: name of the module being requested, or None if not found or invalid
         """
-        module_name = web.input().get('module', '')
+        return Releases._normalize_module_name(web.input().get('module', ''))
+
+    @staticmethod
+    def _normalize_module_name(module_name):
+        """
+        :param module_name: module name in form "author/title" or "author-title"
+        :type  module_name: basestring
+
+        :return: module name in form "author/title", or None if invalid
+        """
         match = MODULE_PATTERN.match(module_name)
         if match:
             normalized_name = u'%s/%s' % (match.group(1), match.group(3))
             return normalized_name
 
+    @staticmethod
+    def _get_pruned():
+        """
+        :return: value of the "pruned" query parameter as a boolean, or None if
+                 it was not given
+        :rtype:  bool or None
+        """
+        pruned = web.input().get('pruned')
+        if pruned is not None:
+            return pruned.lower() in ('true', '1', 'yes')
+
+
+class Resolve(Releases):
+    """
+    Resolves several modules at once, such as all of those in a repository or
+    in a Puppetfile, returning a single document in the form of releases.json
+    that lists every release only once.
+
+    The modules are requested either with a GET request that names each of
+    them in a "module" query parameter, to resolve their latest releases, or
+    with a POST request whose JSON body is a list of modules. Each is either a
+    name or an object with key "name" and optionally "version" or
+    "version_requirement".
+    """
+
+    def GET(self, resource_type=None, resource=None):
+        modules = [{'name': name} for name in web.input(module=[]).module]
+        return self._resolve(resource_type, resource, modules, conditional=True)
+
+    def POST(self, resource_type=None, resource=None):
+        try:
+            modules = json.loads(web.data())
+        except ValueError:
+            return web.badrequest()
+        return self._resolve(resource_type, resource, modules)
+
+    def _resolve(self, resource_type, resource, modules, conditional=False):
+        """
+        :param resource_type: type of the resource named in the URL's path, if any
+        :type  resource_type: str
+        :param resource:      ID of the resource named in the URL's path, if any
+        :type  resource:      str
+        :param modules:       requested modules, as given in the body of a POST request
+        :type  modules:       list
+        :param conditional:   whether the request may be answered with 304 Not
+                              Modified, which is only the case for GET requests
+        :type  conditional:   bool
+
+        :return: the chunks of the body of what should be streamed out to the caller
+        :rtype:  iterator of str
+        """
+        try:
+            credentials = self._get_request_credentials(resource_type, resource)
+        except web.HTTPError, e:
+            return e
+
+        modules = self._parse_modules(modules)
+        if not modules:
+            return web.badrequest()
+
+        compression = self._negotiate_compression()
+        if conditional:
+            etag = self._get_etag(credentials, compression)
+            if self._not_modified(etag):
+                return self._not_modified_response(etag)
+
+        kwargs = {}
+        pruned = self._get_pruned()
+        if pruned is not None:
+            kwargs['pruned'] = pruned
+        data = releases.resolve(*credentials, modules=modules, **kwargs)
+        if conditional:
+            self._set_caching_headers(etag)
+        return self.format_results(data, compression)
+
+    @classmethod
+    def _parse_modules(cls, modules):
+        """
+        :param modules: requested modules, as given in the body of a POST request
+        :type  modules: list
+
+        :return: the requested modules as tuples of their name in form
+                 "author/title", version and version requirement, the latter
+                 two of which may be None; None if the request is invalid
+        :rtype:  list of tuple
+        """
+        if not isinstance(modules, list):
+            return None
+
+        parsed = []
+        for module in modules:
+            if isinstance(module, basestring):
+                module = {'name': module}
+            elif not isinstance(module, dict):
+                return None
+
+            name, version, version_requirement = [
+                module.get(key) for key in ('name', 'version', 'version_requirement')]
+            for value in (name, version, version_requirement):
+                if value is not None and not isinstance(value, basestring):
+                    return None
+
+            name = cls._normalize_module_name(name or '')
+            if not name:
+                return None
+            if version_requirement and requirements.get(version_requirement) is None:
+                return None
+            parsed.append((name, version, version_requirement))
+        return parsed
+
 
 class ReleasesPost36(Releases):
+    """
+    Lists a page of the releases of a module in the v3 API. The "order"
+    parameter lists them in the order they are stored, oldest first, when it
+    is "asc", which is the default, or in the reverse order when it is "desc".
+    """
+
+    ORDER_ASCENDING = 'asc'
+    ORDER_DESCENDING = 'desc'
+
+    def GET(self, resource_type=None, resource=None):
+        if self._get_valid_page() is None or \
+                self._get_order() not in (self.ORDER_ASCENDING, self.ORDER_DESCENDING):
+            return web.badrequest()
+        return super(ReleasesPost36, self).GET(resource_type, resource)
 
     @staticmethod
-    def _format_query_string(base_url, module_name, module_version, offset, limit):
+    def _format_query_string(base_url, module_name, module_version, offset, limit,
+                             order=None):
         """
         Build the query string to be used for creating
 
@@ -147,6 +439,8 @@ class ReleasesPost36(Releases):
         :type offset: int
         :param limit: The max number of items to show on a page
         :type limit: int
+        :param order: The order of the items to encode, if it is not the default
+        :type order: str
         :return: The encoded URL for the specified query arguments
         :rtype: str
         """
@@ -155,41 +449,82 @@ class ReleasesPost36(Releases):
                       'limit': limit}
         if module_version:
             query_args['version'] = module_version
+        if order and order != ReleasesPost36.ORDER_ASCENDING:
+            query_args['order'] = order
 
         return '%s?%s' % (base_url, urllib.urlencode(query_args))
 
+    @staticmethod
+    def _get_page():
+        """
+        :return: offset and limit of the requested page
+        :rtype:  int, int
+        """
+        return int(web.input().get('offset', 0)), int(web.input().get('limit', 20))
+
+    @classmethod
+    def _get_valid_page(cls):
+        """
+        :return: offset and limit of the requested page; None if either is not
+                 a number, the offset is negative or the limit is not positive
+        :rtype:  tuple or None
+        """
+        try:
+            offset, limit = cls._get_page()
+        except ValueError:
+            return None
+        if offset < 0 or limit < 1:
+            return None
+        return offset, limit
+
+    @classmethod
+    def _get_order(cls):
+        """
+        :return: requested order of the releases
+        :rtype:  str
+        """
+        return web.input().get('order', cls.ORDER_ASCENDING)
+
     def get_releases(self, *args, **kwargs):
         """
-        Get the list of matching releases
+        Get the requested page of the matching releases
 
-        :return: The matching modules
-        :rtype: dict
+        :return: The matching modules on the page and the total number of matching modules
+        :rtype: tuple
         """
-        return releases.view(*args, recurse_deps=False, view_all_matching=True, **kwargs)
+        offset, limit = self._get_page()
+        reverse = self._get_order() == self.ORDER_DESCENDING
+        return releases.view_page(*args, offset=offset, limit=limit, reverse=reverse, **kwargs)
 
-    def format_results(self, data):
+    def format_results(self, data, compression=None):
         """
         Format the results and begin streaming out to the caller for the v3 API
 
-        :param data: The module data to stream back to the caller
-        :type data: dict
-        :return: the body of what should be streamed out to the caller
-        :rtype: str
+        :param data: The module data on the requested page to stream back to the
+                     caller, and the total number of matching modules
+        :type data: tuple
+        :param compression: content coding and level with which to compress the
+                            results, as returned by _negotiate_compression
+        :type compression: tuple
+        :return: the chunks of the body of what should be streamed out to the caller
+        :rtype: iterator of str
         """
         web.header('Content-Type', 'application/json')
-        limit = int(web.input().get('limit', 20))
-        current_offset = int(web.input().get('offset', 0))
+        self._set_content_encoding(compression)
+        current_offset, limit = self._get_page()
+        order = self._get_order()
         module_name = web.input().get('module', '')
         module_version = web.input().get('version', None)
         base_url_string = '/v3%s' % web.ctx.path
 
         first_path = self._format_query_string(base_url_string, module_name, module_version,
-                                               0, limit)
+                                               0, limit, order)
         current_path = self._format_query_string(base_url_string, module_name, module_version,
-                                                 current_offset, limit)
+                                                 current_offset, limit, order)
         if current_offset > 0:
             previous_path = self._format_query_string(base_url_string, module_name, module_version,
-                                                      current_offset - limit, limit)
+                                                      max(current_offset - limit, 0), limit,
+                                                      order)
         else:
             previous_path = None
 
@@ -205,10 +540,9 @@ class ReleasesPost36(Releases):
             },
             'results': []
         }
-        module_list = data.get(self._get_module_name())
-        total_count = len(module_list)
+        module_list, total_count = data
 
-        for module in module_list[current_offset: (current_offset + limit)]:
+        for module in module_list:
             formatted_dependencies = []
             for dep in module.get('dependencies', []):
                 formatted_dependencies.append({
@@ -231,10 +565,132 @@ class ReleasesPost36(Releases):
 
         if total_count > (current_offset + limit):
             next_path = self._format_query_string(base_url_string, module_name, module_version,
-                                                  current_offset + limit, limit)
+                                                  current_offset + limit, limit, order)
             formatted_results['pagination']['next'] = next_path
 
-        return json.dumps(formatted_results)
+        return encoding.compressed_chunks(encoding.json_chunks(formatted_results), compression)
+
+
+class Modules(ReleasesPost36):
+    """
+    Search for modules in the v3 API, as used by "puppet module search". The
+    modules whose author, name, summary, description or tags contain every
+    word of the "query" parameter are listed, each with its latest release.
+    """
+
+    def GET(self, resource_type=None, resource=None):
+        try:
+            credentials = self._get_request_credentials(resource_type, resource)
+        except web.HTTPError, e:
+            return e
+        page = self._get_valid_page()
+        if page is None:
+            return web.badrequest()
+        offset, limit = page
+        query = web.input().get('query', '')
+
+        compression = self._negotiate_compression()
+        etag = self._get_etag(credentials, compression)
+        if self._not_modified(etag):
+            return self._not_modified_response(etag)
+
+        data = releases.search_modules(*credentials, query=query, offset=offset, limit=limit)
+        self._set_caching_headers(etag)
+        return self.format_results(data, compression)
+
+    @staticmethod
+    def _format_search_query_string(base_url, query, offset, limit):
+        """
+        :param base_url: The context root to use when generating a search query.
+        :type base_url: str
+        :param query: The search query to encode in the query string
+        :type query: str
+        :param offset: The offset to encode for pagination
+        :type offset: int
+        :param limit: The max number of items to show on a page
+        :type limit: int
+        :return: The encoded URL for the specified query arguments
+        :rtype: str
+        """
+        query_args = {'offset': offset,
+                      'limit': limit}
+        if query:
+            query_args['query'] = query
+
+        return '%s?%s' % (base_url, urllib.urlencode(query_args))
+
+    def format_results(self, data, compression=None):
+        """
+        Format the search results and begin streaming out to the caller for the
+        v3 API
+
+        :param data: The search entries of the modules on the requested page
+                     and the total number of matching modules
+        :type data: tuple
+        :param compression: content coding and level with which to compress the
+                            results, as returned by _negotiate_compression
+        :type compression: tuple
+        :return: the chunks of the body of what should be streamed out to the caller
+        :rtype: iterator of str
+        """
+        web.header('Content-Type', 'application/json')
+        self._set_content_encoding(compression)
+        current_offset, limit = self._get_page()
+        query = web.input().get('query', '')
+        base_url_string = '/v3%s' % web.ctx.path
+        module_list, total_count = data
+
+        if current_offset > 0:
+            previous_path = self._format_search_query_string(base_url_string, query,
+                                                             max(current_offset - limit, 0), limit)
+        else:
+            previous_path = None
+        if total_count > (current_offset + limit):
+            next_path = self._format_search_query_string(base_url_string, query,
+                                                         current_offset + limit, limit)
+        else:
+            next_path = None
+
+        formatted_results = {
+            'pagination': {
+                'limit': limit,
+                'offset': current_offset,
+                'first': self._format_search_query_string(base_url_string, query, 0, limit),
+                'previous': previous_path,
+                'current': self._format_search_query_string(base_url_string, query,
+                                                            current_offset, limit),
+                'next': next_path,
+                'total': total_count
+            },
+            'results': []
+        }
+
+        for module in module_list:
+            slug = '%s-%s' % (module['author'], module['name'])
+            formatted_results['results'].append({
+                'name': module['name'],
+                'slug': slug,
+                'owner': {
+                    'username': module['author'],
+                    'slug': module['author']
+                },
+                'homepage_url': module.get('project_page'),
+                'current_release': {
+                    'version': module['version'],
+                    'slug': '%s-%s' % (slug, module['version']),
+                    'tags': module.get('tag_list', []),
+                    'metadata': {
+                        'name': slug,
+                        'version': module['version'],
+                        'author': module['author'],
+                        'summary': module.get('summary'),
+                        'description': module.get('description'),
+                        'project_page': module.get('project_page')
+                    }
+                }
+            })
+
+        return encoding.compressed_chunks(encoding.json_chunks(formatted_results), compression)
 
 if __name__ == '__main__':
     # run this app stand-alone, useful for testing
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Caches kept by each process serving the forge API, so that work done for one
+request can be reused by the ones that follow.
+"""
+
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    Dictionary-like cache holding at most a fixed number of entries. When it is
+    full, adding an entry evicts the one that was least recently used. It is
+    safe to share between the threads of a process.
+
+    The number of lookups that found and did not find their key are counted in
+    the "hits" and "misses" attributes.
+    """
+
+    # positions in the list that is the node of an entry
+    _PREVIOUS, _NEXT, _KEY, _VALUE = range(4)
+
+    def __init__(self, max_size):
+        """
+        :param max_size: maximum number of entries held by the cache
+        :type  max_size: int
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # maps each key to its node in a circular doubly linked list, which
+        # orders the entries from least to most recently used after the root
+        self._nodes = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def get(self, key, default=None):
+        """
+        :return: value cached for the key, which becomes the most recently
+                 used; the default if the key is not cached
+        """
+        self._lock.acquire()
+        try:
+            node = self._nodes.get(key)
+            if node is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(node)
+            self._append(node)
+            return node[self._VALUE]
+        finally:
+            self._lock.release()
+
+    def __setitem__(self, key, value):
+        self._lock.acquire()
+        try:
+            node = self._nodes.get(key)
+            if node is not None:
+                self._unlink(node)
+            else:
+                if len(self._nodes) >= self.max_size:
+                    oldest = self._root[self._NEXT]
+                    self._unlink(oldest)
+                    del self._nodes[oldest[self._KEY]]
+                node = [None, None, key, None]
+                self._nodes[key] = node
+            node[self._VALUE] = value
+            self._append(node)
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def pop(self, key, default=None):
+        """
+        Removes a key from the cache.
+
+        :return: value that was cached for the key; the default if the key was
+                 not cached
+        """
+        self._lock.acquire()
+        try:
+            node = self._nodes.pop(key, None)
+            if node is None:
+                return default
+            self._unlink(node)
+            return node[self._VALUE]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._nodes.clear()
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
+
+    def _unlink(self, node):
+        """
+        Removes a node from the linked list. The caller must hold the lock.
+        """
+        node[self._PREVIOUS][self._NEXT] = node[self._NEXT]
+        node[self._NEXT][self._PREVIOUS] = node[self._PREVIOUS]
+
+    def _append(self, node):
+        """
+        Adds a node to the linked list as the most recently used. The caller
+        must hold the lock.
+        """
+        last = self._root[self._PREVIOUS]
+        node[self._PREVIOUS] = last
+        node[self._NEXT] = self._root
+        last[self._NEXT] = node
+        self._root[self._PREVIOUS] = node
+
+
+class TTLCache(LRUCache):
+    """
+    LRU cache whose entries also expire a fixed number of seconds after they
+    were added, for data that may change without notice.
+    """
+
+    def __init__(self, max_size, ttl):
+        """
+        :param max_size: maximum number of entries held by the cache
+        :type  max_size: int
+        :param ttl: number of seconds for which an entry is kept
+        :type  ttl: int or float
+        """
+        LRUCache.__init__(self, max_size)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        """
+        :return: value cached for the key, which becomes the most recently
+                 used; the default if the key is not cached or has expired
+        """
+        self._lock.acquire()
+        try:
+            node = self._nodes.get(key)
+            if node is not None and node[self._VALUE][0] <= time.time():
+                self._unlink(node)
+                del self._nodes[key]
+        finally:
+            self._lock.release()
+
+        entry = LRUCache.get(self, key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        LRUCache.__setitem__(self, key, (time.time() + self.ttl, value))
+
+    def pop(self, key, default=None):
+        """
+        Removes a key from the cache.
+
+        :return: value that was cached for the key; the default if the key was
+                 not cached
+        """
+        entry = LRUCache.pop(self, key)
+        if entry is None:
+            return default
+        return entry[1]
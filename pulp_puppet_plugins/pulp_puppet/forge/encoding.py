@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Encodes forge API responses as JSON in chunks that can be streamed to the
+client as they are produced, so a large response is never held in memory as
+one string. The chunks can be compressed with a content coding negotiated
+with the client.
+"""
+
+import json
+import zlib
+
+from pulp_puppet.forge.cache import LRUCache
+
+# Approximate size in bytes of the chunks a response is streamed in
+CHUNK_SIZE = 16384
+
+# Number of encoded responses kept by each process serving the API
+BODY_CACHE_SIZE = 256
+
+# Maps the id of a response shared between requests, along with the content
+# coding and compression level it was encoded with, to a tuple of the response
+# and the chunks it was encoded to. The response is kept so that its id cannot
+# be taken by another object while the entry exists.
+_body_cache = LRUCache(BODY_CACHE_SIZE)
+
+# Level at which responses are compressed unless configured otherwise
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Supported content codings, in order of preference, and the window bits
+# argument with which zlib produces each
+CONTENT_CODINGS = ('gzip', 'deflate')
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def json_chunks(data, depth=2):
+    """
+    Encodes data as JSON in chunks. Dictionaries, whose keys must be strings,
+    and lists are encoded one item at a time down to the given depth, and the
+    values below it whole. Joined, the chunks are identical to
+    json.dumps(data).
+
+    :param data: data to encode
+    :param depth: number of levels of dictionaries and lists to encode one
+                  item at a time. For the releases views, the default encodes
+                  each release whole.
+    :type  depth: int
+
+    :return: chunks of about CHUNK_SIZE bytes
+    :rtype:  generator of str
+    """
+    pieces = []
+    size = 0
+    for piece in _encode(data, depth):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(pieces)
+            pieces = []
+            size = 0
+    if pieces:
+        yield ''.join(pieces)
+
+
+def shared_json_chunks(data, depth=2, compression=None):
+    """
+    Encodes data that is shared between requests, such as a response from the
+    releases response cache, as JSON in chunks. The chunks are kept, so data
+    that is served repeatedly is only encoded and compressed once. The data
+    must not be modified afterwards.
+
+    :param data: data to encode
+    :param depth: see json_chunks
+    :type  depth: int
+    :param compression: content coding and compression level with which the
+                        chunks are compressed; None if they are not
+    :type  compression: tuple
+
+    :return: chunks of about CHUNK_SIZE bytes before compression
+    :rtype:  iterator of str
+    """
+    key = (id(data), compression)
+    entry = _body_cache.get(key)
+    if entry is not None and entry[0] is data:
+        return iter(entry[1])
+    return _cache_chunks(data, key, compressed_chunks(json_chunks(data, depth), compression))
+
+
+def compressed_chunks(chunks, compression):
+    """
+    :param chunks: chunks to compress
+    :type  chunks: iterable of str
+    :param compression: content coding and compression level with which the
+                        chunks are compressed; None if they are not
+    :type  compression: tuple
+
+    :return: the compressed chunks, omitting those for which the compressor
+             has no output yet
+    :rtype:  iterator of str
+    """
+    if compression is None:
+        return iter(chunks)
+    return _compress(chunks, *compression)
+
+
+def negotiate(accept_encoding):
+    """
+    Chooses the content coding of a response from the Accept-Encoding header
+    of the request, preferring the supported codings in the order of
+    CONTENT_CODINGS among those the client accepts equally. The response is
+    only left uncompressed if the client accepts no supported coding or
+    explicitly prefers the identity coding.
+
+    :param accept_encoding: value of the Accept-Encoding header; None if the
+                            request did not have one
+    :type  accept_encoding: str
+
+    :return: the chosen content coding; None if the response should not be
+             compressed
+    :rtype:  str or None
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        parts = [part.strip() for part in item.split(';')]
+        coding = parts[0].lower()
+        quality = 1.0
+        for parameter in parts[1:]:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    best = None
+    best_quality = 0.0
+    for coding in CONTENT_CODINGS:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    if best_quality < qualities.get('identity', 0.0):
+        return None
+    return best
+
+
+def _compress(chunks, coding, level):
+    """
+    :return: the chunks compressed with the given content coding and level
+    :rtype:  generator of str
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[coding])
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _cache_chunks(data, key, chunks):
+    """
+    Passes on chunks, adding them to the body cache under the given key once
+    they have all been produced.
+
+    :return: the chunks
+    :rtype:  generator of str
+    """
+    produced = []
+    for chunk in chunks:
+        produced.append(chunk)
+        yield chunk
+    _body_cache[key] = (data, produced)
+
+
+def _encode(data, depth):
+    """
+    :return: pieces of the JSON encoding of the data
+    :rtype:  generator of str
+    """
+    if depth > 0 and isinstance(data, dict):
+        yield '{'
+        first = True
+        for key, value in data.iteritems():
+            if first:
+                first = False
+            else:
+                yield ', '
+            yield json.dumps(key)
+            yield ': '
+            for piece in _encode(value, depth - 1):
+                yield piece
+        yield '}'
+    elif depth > 0 and isinstance(data, (list, tuple)):
+        yield '['
+        first = True
+        for value in data:
+            if first:
+                first = False
+            else:
+                yield ', '
+            for piece in _encode(value, depth - 1):
+                yield piece
+        yield ']'
+    else:
+        yield json.dumps(data)
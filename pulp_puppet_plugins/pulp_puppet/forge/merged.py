@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Combines the dependency data of the repositories a consumer is bound to, so
+that the dependencies of a module are found in whichever of those repositories
+they were published to.
+"""
+
+import json
+
+from pulp_puppet.common import constants
+from pulp_puppet.forge.cache import LRUCache
+from pulp_puppet.forge.unit import version_sort_key
+
+# Number of modules whose combined releases, and separately whose dependency
+# closures, are kept by each view
+MODULE_CACHE_SIZE = 1000
+
+
+class MergedDependencyData(object):
+    """
+    Read-only view of the dependency data of several repositories as if they
+    were one. It is looked up like a dependency database by the units whose
+    dependencies it holds:
+
+    - the key of a module holds the releases of the module in all of the
+      repositories, in ascending version order. A version in more than one
+      repository is listed once, as in the first of them in order of their
+      IDs.
+    - the closure key of a module holds the names of all modules that any of
+      its releases depend on directly or indirectly, following dependencies
+      from one repository into another.
+
+    Entries are built the first time they are looked up and then kept, up to
+    MODULE_CACHE_SIZE of each kind, so a view can be shared by the requests of
+    all consumers bound to the same repositories until one of them is
+    published again. It is safe to share between the threads of a process;
+    threads that look up the same missing entry at once each build it.
+    """
+
+    def __init__(self, dbs):
+        """
+        :param dbs: repo data as returned by
+                    pulp_puppet.forge.releases.get_repo_data
+        :type  dbs: dict
+        """
+        self.repo_dbs = [(repo_id, data['db']) for repo_id, data in sorted(dbs.iteritems())]
+        # maps a module name to a tuple of its JSON serialized releases and
+        # the names of the modules they depend on; the releases are None if
+        # the module is in none of the repositories
+        self._releases = LRUCache(MODULE_CACHE_SIZE)
+        # maps a module name to its JSON serialized dependency closure
+        self._closures = LRUCache(MODULE_CACHE_SIZE)
+
+    def __getitem__(self, key):
+        """
+        :param key: name of a module in form "author/title", or the name
+                    prefixed with constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+        :type  key: str
+
+        :return: JSON serialized releases or dependency closure of the module
+        :rtype:  str
+
+        :raise KeyError: if the module is in none of the repositories
+        """
+        prefix = constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+        if key.startswith(prefix):
+            return self._closure(key[len(prefix):])
+        if key.startswith('.'):
+            raise KeyError(key)
+        json_data = self._get_releases(key)[0]
+        if json_data is None:
+            raise KeyError(key)
+        return json_data
+
+    def has_key(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _get_releases(self, name):
+        """
+        :return: tuple of the JSON serialized releases of the module in all
+                 repositories, or None if it is in none of them, and the
+                 names of the modules its releases depend on
+        :rtype:  tuple
+        """
+        cached = self._releases.get(name)
+        if cached is not None:
+            return cached
+
+        releases = []
+        versions = set()
+        for repo_id, db in self.repo_dbs:
+            try:
+                json_data = db[name]
+            except KeyError:
+                continue
+            for release in json.loads(json_data):
+                if release['version'] in versions:
+                    continue
+                versions.add(release['version'])
+                if release.get('version_key') is None:
+                    release['version_key'] = version_sort_key(release['version'])
+                releases.append(release)
+
+        if releases:
+            releases.sort(key=lambda release: release['version_key'])
+            cached = (json.dumps(releases),
+                      frozenset(dep['name'] for release in releases
+                                for dep in release['dependencies']))
+        else:
+            cached = (None, frozenset())
+        self._releases[name] = cached
+        return cached
+
+    def _closure(self, name):
+        """
+        :return: JSON serialized sorted names of all modules the module's
+                 releases depend on directly or indirectly
+        :rtype:  str
+
+        :raise KeyError: if the module is in none of the repositories
+        """
+        closure = self._closures.get(name)
+        if closure is not None:
+            return closure
+        json_data, deps = self._get_releases(name)
+        if json_data is None:
+            raise KeyError(constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX + name)
+
+        seen = set()
+        pending = list(deps)
+        while pending:
+            dep = pending.pop()
+            if dep not in seen:
+                seen.add(dep)
+                pending.extend(self._get_releases(dep)[1])
+        seen.discard(name)
+
+        closure = json.dumps(sorted(seen))
+        self._closures[name] = closure
+        return closure
@@ -12,46 +12,172 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import gdbm
+import hashlib
 import json
 import logging
-import os.path
+import os
 
 from pulp.server.managers.consumer.bind import BindManager
 from pulp.server.managers.repo.distributor import RepoDistributorManager
 import web
 
-from pulp_puppet.common import constants
+from pulp_puppet.common import constants, search
+from pulp_puppet.common.dependency_index import DependencyIndex
+from pulp_puppet.forge import requirements
+from pulp_puppet.forge.cache import LRUCache, TTLCache
+from pulp_puppet.forge.merged import MergedDependencyData
 from pulp_puppet.forge.unit import Unit
 
 _LOGGER = logging.getLogger(__name__)
 
+# Number of open dependency databases kept by each process serving the API
+DEPENDENCY_DATA_CACHE_SIZE = 64
 
-def unit_generator(dbs, module_name):
+# Maps the path of a published dependency database or index to a tuple of the
+# identity of the file it was opened from and the open handle
+_dependency_data_cache = LRUCache(DEPENDENCY_DATA_CACHE_SIZE)
+
+# Number of responses of the releases view kept by each process serving the API
+RESPONSE_CACHE_SIZE = 1024
+
+# Maps the parameters of a releases view request, including the publish
+# generation of each queried repo, to its response
+_response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+# Number of combined views of the dependency data of several repos kept by
+# each process serving the API
+MERGED_DATA_CACHE_SIZE = 64
+
+# Maps the IDs and publish generations of a set of repos to the
+# MergedDependencyData combining their dependency data
+_merged_data_cache = LRUCache(MERGED_DATA_CACHE_SIZE)
+
+# Number of consumers, and separately of repos, whose bindings or distributors
+# read from the database are kept by each process serving the API, and the
+# number of seconds for which they are used. Bindings and distributors are
+# changed by the Pulp server's processes, which cannot reach these caches, so
+# the time limit alone bounds how long a change can go unnoticed.
+LOOKUP_CACHE_SIZE = 10000
+LOOKUP_CACHE_TTL = 30
+
+# Maps a consumer ID to the IDs of the repos it is bound to
+_bindings_cache = TTLCache(LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL)
+
+# Maps a repo ID to the list of its distributors
+_distributors_cache = TTLCache(LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL)
+
+
+def unit_generator(dbs, module_name, offset=0, limit=None, reverse=False):
     """
-    Generator to produce all units visible to the API caller
+    Generator to produce all units visible to the API caller. Repos are
+    visited in order of their IDs and the releases of each repo in the order
+    they are stored, so a window given by offset and limit always holds the
+    same units. Units are only built for the releases in the window.
 
     :param dbs: The list of repo gdm files available to query for data
     :type dbs: dict
     :param module_name: The module name to search for
     :type module_name: str
+    :param offset: number of units to skip
+    :type offset: int
+    :param limit: maximum number of units to produce; all if None
+    :type limit: int
+    :param reverse: whether to produce the units in the reverse order, which
+                    is newest first within each repo
+    :type reverse: bool
     """
-    host = get_host_and_protocol()['host']
-    for repo_id, data in dbs.iteritems():
-        protocol = data['protocol']
-        db = data['db']
+    repo_releases = _module_releases(dbs, module_name, reverse)
+    for unit in _window_units(repo_releases, module_name, offset, limit):
+        yield unit
+
+
+def _module_releases(dbs, module_name, reverse=False):
+    """
+    Generator to decode the releases of a module in each repo that has it, in
+    the order in which unit_generator visits them. Each repo's releases are
+    only decoded when they are reached.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+    :param reverse: whether to visit the repos and their releases in reverse
+                    order
+    :type  reverse: bool
+
+    :return: tuples of a repo ID, its repo data and its releases of the module
+    :rtype:  generator of tuple
+    """
+    for repo_id, data in sorted(dbs.iteritems(), reverse=reverse):
         try:
-            json_data = db[module_name]
+            json_data = data['db'][module_name]
         except KeyError:
             _LOGGER.debug('module %s not found in repo %s' % (module_name, repo_id))
             continue
-        units = json.loads(json_data)
-        for unit in units:
-            yield Unit(name=module_name, db=db, repo_id=repo_id, host=host, protocol=protocol,
-                       **unit)
+        module_releases = json.loads(json_data)
+        if reverse:
+            module_releases.reverse()
+        yield repo_id, data, module_releases
+
+
+def _window_units(repo_releases, module_name, offset=0, limit=None):
+    """
+    Generator to produce the units for a window of the releases of a module.
+
+    :param repo_releases: releases of the module in each repo, as produced by
+                          _module_releases
+    :type  repo_releases: iterable of tuple
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+    :param offset: number of units to skip
+    :type  offset: int
+    :param limit: maximum number of units to produce; all if None
+    :type  limit: int
+    """
+    host = get_host_and_protocol()['host']
+    for repo_id, data, module_releases in repo_releases:
+        if limit is not None and limit <= 0:
+            return
+        window = module_releases[offset:]
+        offset = max(offset - len(module_releases), 0)
+        if limit is not None:
+            window = window[:limit]
+            limit -= len(window)
+        dep_db, dep_closures = _dependency_source(data)
+        for unit in window:
+            yield Unit(name=module_name, db=dep_db, repo_id=repo_id, host=host,
+                       protocol=data['protocol'], dep_closures=dep_closures, **unit)
+
+
+def count_releases(dbs, module_name, version=None):
+    """
+    Counts the releases of a module visible to the API caller, without
+    building a unit for each of them.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+    :param version: optional version; if specified, only a release with that
+                    version is counted
+    :type  version: str
+
+    :return: number of releases
+    :rtype:  int
+    """
+    count = 0
+    for repo_id, data, module_releases in _module_releases(dbs, module_name):
+        if version:
+            if [r for r in module_releases if r['version'] == version]:
+                # only the first release with the version is ever returned
+                return 1
+        else:
+            count += len(module_releases)
+    return count
 
 
 def view(consumer_id, repo_id, module_name, version=None, recurse_deps=True,
-         view_all_matching=False):
+         view_all_matching=False, pruned=None):
     """
     produces data for the "releases.json" view
 
@@ -69,70 +195,528 @@ def view(consumer_id, repo_id, module_name, version=None, recurse_deps=True,
     :param view_all_matching: whether or not all matching modules should be returned or just
                               just the first one
     :type view_all_matching: bool
+    :param pruned: whether only the versions of dependencies that can satisfy all version
+                   requirements should be returned; if None, each repo's distributor
+                   configuration decides
+    :type pruned: bool
 
     :return:    data structure defining dependency data for the given module and
                 its download path, identical to what the puppet forge v1 API
-                generates, except this structure is not yet JSON serialized
+                generates, except this structure is not yet JSON serialized.
+                It may be shared with other requests and must not be modified.
     :rtype:     dict
     """
-    # Build the list of repositories that should be queried
+    # Get the databases to query. They are cached across requests, so they
+    # are not closed here.
+    dbs = get_repo_data(_get_repo_ids(consumer_id, repo_id))
+
+    cache_key = _response_cache_key(dbs, 'view', module_name, version, recurse_deps,
+                                    view_all_matching, pruned)
+    if cache_key is not None:
+        return_data = _response_cache.get(cache_key)
+        if return_data is not None:
+            return return_data
+
+    # Build list of units to return
+    ret = []
+    # If a version was specified filter by that specific version of the module
+    if version:
+        unit = _find_version(dbs, module_name, version)
+        if unit is not None:
+            ret.append(unit)
+    # if view_all_matching then return all modules matching the query, otherwise
+    # only return the latest matching module (for forge v1 & v2 api compliance)
+    elif view_all_matching:
+        ret = list(unit_generator(dbs, module_name))
+    else:
+        units = _latest_units(dbs, module_name)
+        if units:
+            ret.append(max(units))
+
+    # calculate dependencies for the units being returned & build the return structure
+    return_data = {}
+    for unit in ret:
+        populated_unit = unit.build_dep_metadata(recurse_deps,
+                                                 pruned=_is_pruned(dbs, unit, pruned))
+        for unit_name, unit_details in populated_unit.iteritems():
+            return_data.setdefault(unit_name, []).extend(unit_details)
+
+    if not return_data:
+        raise web.NotFound()
+
+    if cache_key is not None:
+        _response_cache[cache_key] = return_data
+    return return_data
+
+
+def resolve(consumer_id, repo_id, modules, recurse_deps=True, pruned=None):
+    """
+    produces data for the "resolve.json" view, which merges the "releases.json"
+    views of several modules into one, listing each release only once. The
+    dependencies the modules of a repo have in common are only walked once.
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param modules:     modules to resolve, each as a tuple of its name in form
+                        "author/title", an optional version and an optional
+                        version requirement. The latest release matching the
+                        version or version requirement is resolved.
+    :type  modules:     list of tuple
+    :param recurse_deps: Whether or not a module should have it's full dependency chain
+                         recursively added to it's own
+    :type recurse_deps: bool
+    :param pruned: whether only the versions of dependencies that can satisfy all version
+                   requirements should be returned; if None, each repo's distributor
+                   configuration decides
+    :type pruned: bool
+
+    :return:    data structure defining dependency data for the given modules
+                and their download paths, in the form of the "releases.json"
+                view. It may be shared with other requests and must not be
+                modified.
+    :rtype:     dict
+    """
+    dbs = get_repo_data(_get_repo_ids(consumer_id, repo_id))
+
+    cache_key = _response_cache_key(dbs, 'resolve', tuple(modules), recurse_deps, pruned)
+    if cache_key is not None:
+        return_data = _response_cache.get(cache_key)
+        if return_data is not None:
+            return return_data
+
+    return_data = {}
+    # maps the id of the database in which the dependencies of modules are
+    # looked up to the ID of the first repo using it and the dependency data
+    # of the modules from the repos using it
+    dep_roots = {}
+    for module_name, version, version_requirement in modules:
+        unit = _resolve_unit(dbs, module_name, version, version_requirement)
+        if unit is None:
+            raise web.NotFound()
+
+        if recurse_deps and _is_pruned(dbs, unit, pruned):
+            # the versions left depend on the module's own requirements, so
+            # they cannot be shared with other modules
+            _merge_releases(return_data, unit.build_dep_metadata(pruned=True))
+        else:
+            _merge_releases(return_data, {unit.name: [unit.to_dict()]})
+            root = dep_roots.setdefault(id(unit.db), (unit.repo_id, {}))[1]
+            unit.add_deps_to_metadata(root, recurse_deps)
+
+    for repo_id, root in sorted(dep_roots.itervalues()):
+        _merge_releases(return_data, root)
+
+    if cache_key is not None:
+        _response_cache[cache_key] = return_data
+    return return_data
+
+
+def view_page(consumer_id, repo_id, module_name, version=None, offset=0, limit=20,
+              reverse=False):
+    """
+    produces a page of the data for the v3 "releases" view, which lists the
+    releases of a module without the releases of their dependencies. The
+    module's releases in each repo are decoded once, and only the releases on
+    the page are built.
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+    :param version:     optional version
+    :type  version:     str
+    :param offset:      number of releases before the page
+    :type  offset:      int
+    :param limit:       maximum number of releases on the page
+    :type  limit:       int
+    :param reverse:     whether to list the releases in the reverse order,
+                        which is newest first within each repo
+    :type  reverse:     bool
+
+    :return:    tuple of the list of releases on the page, each in the form
+                used by the "releases.json" view, and the total number of
+                releases. The list may be shared with other requests and must
+                not be modified.
+    :rtype:     tuple
+    """
+    dbs = get_repo_data(_get_repo_ids(consumer_id, repo_id))
+
+    cache_key = _response_cache_key(dbs, 'page', module_name, version, offset, limit, reverse)
+    if cache_key is not None:
+        page = _response_cache.get(cache_key)
+        if page is not None:
+            return page
+
+    if version:
+        # only the first release with the version is ever returned, so the
+        # order does not matter
+        repo_releases = [(r_id, data, [r for r in module_releases if r['version'] == version])
+                         for r_id, data, module_releases in _module_releases(dbs, module_name)]
+    else:
+        repo_releases = list(_module_releases(dbs, module_name, reverse))
+
+    total = sum(len(module_releases) for r_id, data, module_releases in repo_releases)
+    if version:
+        total = min(total, 1)
+    if not total:
+        raise web.NotFound()
+
+    limit = min(limit, max(total - offset, 0))
+    units = _window_units(repo_releases, module_name, offset, limit)
+    page = ([unit.to_dict() for unit in units], total)
+
+    if cache_key is not None:
+        _response_cache[cache_key] = page
+    return page
+
+
+def search_modules(consumer_id, repo_id, query=None, offset=0, limit=20):
+    """
+    produces a page of the data for the v3 "modules" view, which lists the
+    modules whose metadata contains every term of a search query. It is
+    answered from the search index published with each repo; repos published
+    before the index was are not searched.
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param query:       search query; if empty, every module matches
+    :type  query:       basestring
+    :param offset:      number of modules before the page
+    :type  offset:      int
+    :param limit:       maximum number of modules on the page
+    :type  limit:       int
+
+    :return:    tuple of the list of the search entries of the latest release
+                of each module on the page, sorted by name, and the total
+                number of matching modules. The list may be shared with other
+                requests and must not be modified.
+    :rtype:     tuple
+    """
+    dbs = get_repo_data(_get_repo_ids(consumer_id, repo_id))
+    terms = tuple(sorted(search.terms(query)))
+
+    cache_key = _response_cache_key(dbs, 'search', terms, offset, limit)
+    if cache_key is not None:
+        page = _response_cache.get(cache_key)
+        if page is not None:
+            return page
+
+    # maps the name of each matching module to the repos it matched in
+    matches = {}
+    for repo_id, data in sorted(dbs.iteritems()):
+        if not data.get('search'):
+            _LOGGER.debug('repo %s has no search index. re-publish to add it.' % repo_id)
+            continue
+        for name in _search_repo(data['db'], terms):
+            matches.setdefault(name, []).append(repo_id)
+
+    names = sorted(matches)
+    entries = []
+    for name in names[offset:offset + limit]:
+        # a module in several repos is shown as in the one with its latest release
+        repo_entries = [json.loads(dbs[repo_id]['db'][constants.REPO_DEPDATA_MODULE_KEY_PREFIX +
+                                                      name])
+                        for repo_id in matches[name]]
+        entries.append(max(repo_entries, key=lambda entry: entry['version_key']))
+    page = (entries, len(names))
+
+    if cache_key is not None:
+        _response_cache[cache_key] = page
+    return page
+
+
+def _search_repo(db, terms):
+    """
+    :param db: open dependency database holding the search index
+    :type  db: gdbm.gdbm
+    :param terms: search terms
+    :type  terms: iterable of str
+
+    :return: names of the modules in the repo whose metadata contains every
+             term; every module's name if there are no terms
+    :rtype:  set of str
+    """
+    if not terms:
+        keys = [constants.REPO_DEPDATA_MODULES_KEY]
+    else:
+        keys = [constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + term for term in terms]
+
+    names = None
+    for key in keys:
+        try:
+            found = set(json.loads(db[key]))
+        except KeyError:
+            return set()
+        if names is None:
+            names = found
+        else:
+            names &= found
+        if not names:
+            break
+    return names
+
+
+def _get_repo_ids(consumer_id, repo_id):
+    """
+    Build the list of repositories that should be queried
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+
+    :return: list of repo IDs
+    :rtype:  list
+    """
     if repo_id == constants.FORGE_NULL_AUTH_VALUE:
         if consumer_id == constants.FORGE_NULL_AUTH_VALUE:
             # must provide either consumer ID or repo ID
             raise web.Unauthorized()
-        repo_ids = get_bound_repos(consumer_id)
+        return get_bound_repos(consumer_id)
+    return [repo_id]
+
+
+def _find_version(dbs, module_name, version):
+    """
+    :return: unit for the first release of the module with the given version;
+             None if there is no such release
+    :rtype:  pulp_puppet.forge.unit.Unit
+    """
+    for unit in unit_generator(dbs, module_name):
+        if unit.version == version:
+            return unit
+
+
+def _resolve_unit(dbs, module_name, version, version_requirement):
+    """
+    :return: unit for the first release of the module with the given version,
+             if specified, or else for the latest release satisfying the
+             given version requirement, if specified; None if there is no
+             such release
+    :rtype:  pulp_puppet.forge.unit.Unit
+    """
+    if version:
+        return _find_version(dbs, module_name, version)
+    if version_requirement:
+        requirement = requirements.get(version_requirement)
+        units = [unit for unit in unit_generator(dbs, module_name)
+                 if unit.satisfies(requirement)]
     else:
-        repo_ids = [repo_id]
+        units = _latest_units(dbs, module_name)
+    if units:
+        return max(units)
 
-    dbs = None
-    return_data = None
-    try:
-        # Get the list of database files to query
-        dbs = get_repo_data(repo_ids)
 
-        # Build list of units to return
-        ret = []
-        # If a version was specified filter by that specific version of the module
-        if version:
-            for unit in unit_generator(dbs, module_name):
-                if unit.version == version:
-                    ret.append(unit)
-                    break
-        else:
-            units = list(unit_generator(dbs, module_name))
-            # if view_all_matching then return all modules matching the query, otherwise
-            # only return the first matching module (for forge v1 & v2 api compliance)
-            if view_all_matching:
-                ret = units
-            else:
-                if units:
-                    ret.append(max(units))
-
-        # calculate dependencies for the units being returned & build the return structure
-        return_data = {}
-        for unit in ret:
-            populated_unit = unit.build_dep_metadata(recurse_deps)
-            for unit_name, unit_details in populated_unit.iteritems():
-                return_data.setdefault(unit_name, []).extend(unit_details)
-
-        if not return_data:
-            raise web.NotFound()
+def _is_pruned(dbs, unit, pruned):
+    """
+    :param pruned: whether pruning was requested; if None, the configuration
+                   of the distributor of the unit's repo decides
+    :type  pruned: bool
 
-    finally:
-        # Close all the database files. If closing one raises an error we still need to
-        # close the others so that file handles aren't left open.
-        if dbs:
-            error_raised = None
-            for repo_id, dbs_data in dbs.iteritems():
-                try:
-                    dbs_data['db'].close()
-                except Exception, e:
-                    error_raised = e
+    :return: whether only the versions of the unit's dependencies that can
+             satisfy all version requirements should be returned
+    :rtype:  bool
+    """
+    if pruned is None:
+        return dbs[unit.repo_id].get('pruned', False)
+    return pruned
 
-            if error_raised:
-                raise error_raised
 
-    return return_data
+def _merge_releases(target, source):
+    """
+    Adds the releases in one dependency data structure to another, skipping
+    those that it already lists.
+
+    :param target: dependency data structure to add to
+    :type  target: dict
+    :param source: dependency data structure to add
+    :type  source: dict
+    """
+    for name, releases in source.iteritems():
+        existing = target.setdefault(name, [])
+        listed = set((release['version'], release['file']) for release in existing)
+        for release in releases:
+            if (release['version'], release['file']) not in listed:
+                listed.add((release['version'], release['file']))
+                existing.append(release)
+
+
+def _response_cache_key(dbs, *params):
+    """
+    Builds the key under which the response to a releases view request is
+    cached. Every publish of a repo changes its generation and therefore the
+    key, so responses never outlive the publish they were built from. The
+    key also holds whether each repo's distributor is configured to prune
+    dependencies, so a change to that configuration is seen without waiting
+    for the next publish.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+    :param params: parameters of the request, starting with the view
+
+    :return: key for the response cache; None if the response must not be
+             cached because the generation of a repo is not known
+    :rtype:  tuple or None
+    """
+    repos = []
+    for repo_id, data in dbs.iteritems():
+        if data.get('generation') is None:
+            return None
+        repos.append((repo_id, data['generation'], data['protocol'],
+                      data.get('pruned', False)))
+    repos.sort()
+
+    host = get_host_and_protocol()['host']
+    return (tuple(repos), host) + params
+
+
+def response_cache_stats():
+    """
+    :return: number of releases view requests of this process that were and
+             were not answered from the response cache, under keys "hits" and
+             "misses", and the number of cached responses under key "size"
+    :rtype:  dict
+    """
+    return _cache_stats(_response_cache)
+
+
+def lookup_cache_stats():
+    """
+    :return: statistics of the binding and distributor caches, under keys
+             "bindings" and "distributors", in the form returned by
+             response_cache_stats
+    :rtype:  dict
+    """
+    return {'bindings': _cache_stats(_bindings_cache),
+            'distributors': _cache_stats(_distributors_cache)}
+
+
+def _cache_stats(cache):
+    """
+    :param cache: cache for which to report statistics
+    :type  cache: pulp_puppet.forge.cache.LRUCache
+
+    :return: number of lookups that hit and missed the cache, under keys
+             "hits" and "misses", and the number of cached entries under key
+             "size"
+    :rtype:  dict
+    """
+    return {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache)}
+
+
+def _latest_units(dbs, module_name):
+    """
+    Finds the units that may be the latest version of a module. For repos
+    whose dependency database stores the latest release of each module, only
+    that release is read. The releases of the module in any other repo are
+    all read and narrowed down by _latest_candidates.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+    :param module_name: name of a module in form "author/title"
+    :type  module_name: str
+
+    :return: units that may be the latest version of the module
+    :rtype:  list of pulp_puppet.forge.unit.Unit
+    """
+    host = get_host_and_protocol()['host']
+    latest_key = constants.REPO_DEPDATA_LATEST_KEY_PREFIX + module_name
+    units = []
+    other_dbs = {}
+    for repo_id, data in dbs.iteritems():
+        if not data.get('latest'):
+            other_dbs[repo_id] = data
+            continue
+        try:
+            json_data = data['db'][latest_key]
+        except KeyError:
+            _LOGGER.debug('module %s not found in repo %s' % (module_name, repo_id))
+            continue
+        dep_db, dep_closures = _dependency_source(data)
+        units.append(Unit(name=module_name, db=dep_db, repo_id=repo_id, host=host,
+                          protocol=data['protocol'], dep_closures=dep_closures,
+                          **json.loads(json_data)))
+
+    if other_dbs:
+        other_units = list(unit_generator(other_dbs, module_name))
+        units.extend(_latest_candidates(other_dbs, other_units))
+    return units
+
+
+def _dependency_source(data):
+    """
+    :param data: data of one repo, as returned by get_repo_data
+    :type  data: dict
+
+    :return: tuple of the database in which the dependencies of the repo's
+             modules are looked up, and whether it stores the dependency
+             closure of each module
+    :rtype:  tuple
+    """
+    merged = data.get('merged')
+    if merged is not None:
+        return merged, True
+    return data['db'], data.get('closures', False)
+
+
+def _get_merged_data(dbs):
+    """
+    Returns the combined view of the dependency data of several repos. Views
+    are kept for as long as none of the repos is published again, so the
+    dependencies looked up for one request are reused by the next.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+
+    :return: combined view of the repos' dependency data
+    :rtype:  pulp_puppet.forge.merged.MergedDependencyData
+    """
+    repos = []
+    for repo_id, data in dbs.iteritems():
+        if data['generation'] is None:
+            # a view that cannot be told apart from that of a later publish
+            # is only used for one request
+            return MergedDependencyData(dbs)
+        repos.append((repo_id, data['generation']))
+    cache_key = tuple(sorted(repos))
+
+    merged = _merged_data_cache.get(cache_key)
+    if merged is None:
+        merged = MergedDependencyData(dbs)
+        _merged_data_cache[cache_key] = merged
+    return merged
+
+
+def _latest_candidates(dbs, units):
+    """
+    Narrows the units found for a module down to those that may be its latest
+    version. Repositories whose dependency database stores releases in
+    ascending version order only contribute their last unit, so the versions
+    of all the others never need to be parsed and compared.
+
+    :param dbs: repo data as returned by get_repo_data
+    :type  dbs: dict
+    :param units: units in the order they were read from each repo's database
+    :type  units: list of pulp_puppet.forge.unit.Unit
+
+    :return: units that may be the latest version of the module
+    :rtype:  list of pulp_puppet.forge.unit.Unit
+    """
+    last_by_repo = {}
+    candidates = []
+    for unit in units:
+        if dbs[unit.repo_id].get('sorted'):
+            last_by_repo[unit.repo_id] = unit
+        else:
+            candidates.append(unit)
+    candidates.extend(last_by_repo.values())
+    return candidates
 
 
 # this just provides a convenient way to access each config key and value from
@@ -145,32 +729,242 @@ PROTOCOL_CONFIG_KEYS = {
 
 def get_repo_data(repo_ids):
     """
-    Find, open, and return the gdbm database file associated with each repo
-    plus that repo's publish protocol
+    Find, open, and return the dependency data associated with each repo
+    plus that repo's publish protocol. The memory-mapped dependency index is
+    used when the repo was published with one; otherwise the gdbm database is
+    opened. The open databases are shared with other requests and must not be
+    closed by the caller.
 
     :param repo_ids: list of repository IDs.
     :type  repo_ids: list
 
     :return:    dictionary where keys are repo IDs, and values are dicts that
-                contain an open gdbm database under key "db", and a protocol
-                under key "protocol".
+                contain the open dependency index or gdbm database under
+                key "db", a protocol under key "protocol", a token that
+                changes with every publish of the repo, or None if it is not
+                known, under key "generation", under key "sorted" whether the
+                database stores each module's releases in version order,
+                under key "closures" whether it stores each module's
+                dependency closure, under key "latest" whether it stores
+                the latest release of each module on its own, under key
+                "search" whether it stores the module search index, under key
+                "pruned" whether the distributor is configured to only return
+                the versions of dependencies that can satisfy all version
+                requirements, and, if several repos are found, under key
+                "merged" the combined view of their dependency data in which
+                the dependencies of their modules are looked up.
     :rtype:     dict
     """
     ret = {}
-    for distributor in RepoDistributorManager.find_by_repo_list(repo_ids):
-        publish_protocol = _get_protocol_from_distributor(distributor)
-        protocol_key, protocol_default_value = PROTOCOL_CONFIG_KEYS[publish_protocol]
-        repo_path = distributor['config'].get(protocol_key, protocol_default_value)
+    for distributor in _find_distributors(repo_ids):
+        publish_protocol, published_repo_dir = _get_published_repo_dir(distributor)
         repo_id = distributor['repo_id']
-        db_path = os.path.join(repo_path, repo_id, constants.REPO_DEPDATA_FILENAME)
-        try:
-            ret[repo_id] = {'db': gdbm.open(db_path, 'r'), 'protocol': publish_protocol}
-        except gdbm.error:
+        db, generation = _open_dependency_data(published_repo_dir)
+        if db is None:
             _LOGGER.error('failed to find dependency database for repo %s. re-publish to fix.' %
                           repo_id)
+            continue
+        db_format = _get_format(db)
+        ret[repo_id] = {'db': db, 'protocol': publish_protocol, 'generation': generation,
+                        'sorted': db_format >= constants.REPO_DEPDATA_SORTED_FORMAT,
+                        'closures': db_format >= constants.REPO_DEPDATA_CLOSURE_FORMAT,
+                        'latest': db_format >= constants.REPO_DEPDATA_LATEST_FORMAT,
+                        'search': db_format >= constants.REPO_DEPDATA_SEARCH_FORMAT,
+                        'pruned': _get_pruned_from_distributor(distributor)}
+
+    if len(ret) > 1:
+        # the modules of a repo may depend on modules in the others
+        merged = _get_merged_data(ret)
+        for data in ret.itervalues():
+            data['merged'] = merged
     return ret
 
 
+def get_etag(consumer_id, repo_id, *params):
+    """
+    Computes a strong entity tag for a response of the forge API. It is
+    derived from the publish generation, protocol and pruning configuration of
+    each repo the response is built from, along with the parameters of the
+    request, so it changes whenever the response may. Only the published files
+    are examined; the dependency data is not opened.
+
+    :param consumer_id: unique ID for a consumer
+    :type  consumer_id: str
+    :param repo_id:     unique ID for a repo
+    :type  repo_id:     str
+    :param params:      parameters of the request that determine the response
+
+    :return: quoted entity tag; None if no repo was found or the generation of
+             a repo is not known
+    :rtype:  str or None
+    """
+    states = []
+    for distributor in _find_distributors(_get_repo_ids(consumer_id, repo_id)):
+        protocol, published_repo_dir = _get_published_repo_dir(distributor)
+        generation = _dependency_data_identity(published_repo_dir)
+        if generation is None:
+            return None
+        states.append((distributor['repo_id'], generation, protocol,
+                       _get_pruned_from_distributor(distributor)))
+    if not states:
+        return None
+    states.sort()
+    return '"%s"' % hashlib.sha1(repr((tuple(states),) + params)).hexdigest()
+
+
+def _get_published_repo_dir(distributor):
+    """
+    :param distributor: distributor as returned by
+                        pulp.server.managers.RepoDistributorManager
+    :type  distributor: dict
+
+    :return: tuple of the protocol the repo is published for and the
+             directory from which it is served
+    :rtype:  tuple
+    """
+    publish_protocol = _get_protocol_from_distributor(distributor)
+    protocol_key, protocol_default_value = PROTOCOL_CONFIG_KEYS[publish_protocol]
+    repo_path = distributor['config'].get(protocol_key, protocol_default_value)
+    return publish_protocol, os.path.join(repo_path, distributor['repo_id'])
+
+
+def _find_distributors(repo_ids):
+    """
+    Finds the distributors of the given repos. Only those of repos whose
+    distributors are not cached are read from the database.
+
+    :param repo_ids: list of repository IDs
+    :type  repo_ids: list
+
+    :return: distributors as returned by
+             pulp.server.managers.RepoDistributorManager
+    :rtype:  list of dict
+    """
+    distributors = []
+    uncached_repo_ids = []
+    for repo_id in repo_ids:
+        cached = _distributors_cache.get(repo_id)
+        if cached is None:
+            uncached_repo_ids.append(repo_id)
+        else:
+            distributors.extend(cached)
+
+    if uncached_repo_ids:
+        # repos without distributors are cached too
+        found = dict((repo_id, []) for repo_id in uncached_repo_ids)
+        for distributor in RepoDistributorManager.find_by_repo_list(uncached_repo_ids):
+            found.setdefault(distributor['repo_id'], []).append(distributor)
+        for repo_id, repo_distributors in found.iteritems():
+            _distributors_cache[repo_id] = repo_distributors
+            distributors.extend(repo_distributors)
+
+    return distributors
+
+
+def _open_dependency_data(published_repo_dir):
+    """
+    :param published_repo_dir: directory from which the repo is served
+    :type  published_repo_dir: str
+    :return: tuple of the repo's dependency index if it has one, otherwise its
+             gdbm database, and the identity of the opened file; the database
+             is None if neither can be opened, and the identity is None if it
+             is not known
+    :rtype:  tuple
+    """
+    index_path = os.path.join(published_repo_dir, constants.REPO_DEPINDEX_FILENAME)
+    db, identity = _open_cached(index_path, DependencyIndex, (IOError, ValueError))
+    if db is not None:
+        return db, identity
+
+    db_path = os.path.join(published_repo_dir, constants.REPO_DEPDATA_FILENAME)
+    return _open_cached(db_path, lambda path: gdbm.open(path, 'r'), (gdbm.error,))
+
+
+def _dependency_data_identity(published_repo_dir):
+    """
+    :param published_repo_dir: directory from which the repo is served
+    :type  published_repo_dir: str
+    :return: identity of the repo's dependency index if it has one, otherwise
+             of its gdbm database; None if neither exists
+    :rtype:  tuple or None
+    """
+    for filename in (constants.REPO_DEPINDEX_FILENAME, constants.REPO_DEPDATA_FILENAME):
+        identity = _file_identity(os.path.join(published_repo_dir, filename))
+        if identity is not None:
+            return identity
+
+
+def _file_identity(path):
+    """
+    A publish swaps in a new build rather than modifying the files of the
+    previous one, so a published file is identified by its inode along with
+    its modification time and size.
+
+    :param path: full path to the file
+    :type  path: str
+    :return: identity of the file; None if it could not be examined
+    :rtype:  tuple or None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime, stat.st_size
+
+
+def _open_cached(path, open_function, errors):
+    """
+    Returns the cached handle for a published file if the file has not been
+    replaced since it was opened, otherwise opens the file and caches the
+    handle. Files are identified as by _file_identity.
+
+    Handles evicted from the cache are not closed explicitly, since other
+    requests may still be using them; they are closed once the last of those
+    requests releases them.
+
+    :param path: full path to the file
+    :type  path: str
+    :param open_function: called with the path to open the file
+    :type  open_function: callable
+    :param errors: exception types raised by open_function if the file cannot
+                   be opened
+    :type  errors: tuple
+
+    :return: tuple of the open handle and the identity of the file; the
+             handle is None if the file cannot be opened, and the identity is
+             None if the file could not be examined
+    :rtype:  tuple
+    """
+    identity = _file_identity(path)
+    if identity is not None:
+        cached = _dependency_data_cache.get(path)
+        if cached is not None and cached[0] == identity:
+            return cached[1], identity
+
+    try:
+        handle = open_function(path)
+    except errors:
+        _dependency_data_cache.pop(path)
+        return None, None
+
+    if identity is not None:
+        _dependency_data_cache[path] = (identity, handle)
+    return handle, identity
+
+
+def _get_format(db):
+    """
+    :param db: open dependency database
+    :type  db: gdbm.gdbm
+    :return: format of the database; 0 if it predates format versioning
+    :rtype:  int
+    """
+    # db is not a dictionary as assumed by flake8
+    if not db.has_key(constants.REPO_DEPDATA_FORMAT_KEY): # noqa
+        return 0
+    return int(db[constants.REPO_DEPDATA_FORMAT_KEY])
+
+
 def _get_protocol_from_distributor(distributor):
     """
     Look at a distributor's config and determine what protocol it gets published
@@ -195,6 +989,22 @@ def _get_protocol_from_distributor(distributor):
         return 'http'
 
 
+def _get_pruned_from_distributor(distributor):
+    """
+    :param distributor: distributor as returned by
+                        pulp.server.managers.RepoDistributorManager, should be
+                        a dict with key 'config'
+    :type distributor: dict
+    :return: whether the distributor is configured to only return the versions
+             of dependencies that can satisfy all version requirements
+    :rtype:  bool
+    """
+    pruned = distributor['config'].get(constants.CONFIG_PRUNED_DEPENDENCIES,
+                                       constants.DEFAULT_PRUNED_DEPENDENCIES)
+    # the value is stored as given, which may be a string
+    return str(pruned).lower() == 'true'
+
+
 def get_host_and_protocol():
     """
     Get host and protocol from the web request and return them
@@ -216,8 +1026,11 @@ def get_bound_repos(consumer_id):
     :return:    list of repo IDs
     :rtype:     list
     """
-    bindings = BindManager().find_by_consumer(consumer_id)
-    repos = [binding['repo_id']
-             for binding in bindings
-             if binding['distributor_id'] == constants.DISTRIBUTOR_TYPE_ID]
+    repos = _bindings_cache.get(consumer_id)
+    if repos is None:
+        bindings = BindManager().find_by_consumer(consumer_id)
+        repos = [binding['repo_id']
+                 for binding in bindings
+                 if binding['distributor_id'] == constants.DISTRIBUTOR_TYPE_ID]
+        _bindings_cache[consumer_id] = repos
     return repos
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Evaluates the version requirements in puppet module dependencies, such as
+">= 1.0.0 < 2.0.0" or "1.2.x", by translating them into semantic_version
+specs.
+
+Supported are comparisons with the >=, <=, >, < and = operators, versions with
+"x" wildcards, "~" and "^" ranges, hyphen ranges such as "1.0.0 - 1.4.0",
+clauses separated by whitespace that must all match, and alternatives
+separated by "||".
+"""
+
+import re
+
+import semantic_version
+
+from pulp_puppet.forge.cache import LRUCache
+
+# Number of parsed requirements kept by each process serving the API
+REQUIREMENT_CACHE_SIZE = 1024
+
+# Maps a requirement string to a 1-tuple holding its parsed Requirement, or
+# None if the requirement could not be parsed
+_requirement_cache = LRUCache(REQUIREMENT_CACHE_SIZE)
+
+_CLAUSE = re.compile(r'^(>=|<=|>|<|=|~|\^)?v?(\d+|x|\*)(?:\.(\d+|x|\*))?(?:\.(\d+|x|\*))?'
+                     r'(-[0-9A-Za-z.-]+)?$')
+_OPERATOR_SPACE = re.compile(r'(>=|<=|>|<|=|~|\^)\s+')
+
+
+class Requirement(object):
+    """
+    Parsed version requirement.
+    """
+
+    def __init__(self, specs):
+        """
+        :param specs: specs of which a version must match at least one
+        :type  specs: list of semantic_version.Spec
+        """
+        self.specs = specs
+
+    def match(self, version):
+        """
+        :param version: version to check
+        :type  version: semantic_version.Version
+
+        :return: True if the version satisfies the requirement
+        :rtype:  bool
+        """
+        for spec in self.specs:
+            if spec.match(version):
+                return True
+        return False
+
+
+def get(requirement):
+    """
+    Returns the parsed form of a requirement. Requirements are parsed once
+    and then cached.
+
+    :param requirement: version requirement of a dependency
+    :type  requirement: basestring
+
+    :return: parsed requirement; None if it could not be parsed, in which case
+             any version should be considered to satisfy it
+    :rtype:  Requirement or None
+    """
+    cached = _requirement_cache.get(requirement)
+    if cached is None:
+        try:
+            cached = (parse(requirement),)
+        except (ValueError, AttributeError, TypeError):
+            # not a string, or not in a supported syntax
+            cached = (None,)
+        _requirement_cache[requirement] = cached
+    return cached[0]
+
+
+def parse(requirement):
+    """
+    :param requirement: version requirement of a dependency
+    :type  requirement: basestring
+
+    :return: parsed requirement
+    :rtype:  Requirement
+
+    :raise ValueError: if the requirement is not in a supported syntax
+    """
+    specs = []
+    for alternative in requirement.split('||'):
+        tokens = _OPERATOR_SPACE.sub(r'\1', alternative.strip()).split()
+        items = []
+        i = 0
+        while i < len(tokens):
+            if i + 2 < len(tokens) and tokens[i + 1] == '-':
+                # hyphen range
+                items.extend(_clause_items('>=' + tokens[i]))
+                items.extend(_clause_items('<=' + tokens[i + 2]))
+                i += 3
+            else:
+                items.extend(_clause_items(tokens[i]))
+                i += 1
+        specs.append(semantic_version.Spec(','.join(items or ['>=0.0.0'])))
+    return Requirement(specs)
+
+
+def _clause_items(clause):
+    """
+    Translates one clause of a requirement into semantic_version spec items.
+
+    :param clause: clause such as ">=1.2.0", "1.x" or "~1.2"
+    :type  clause: str
+
+    :return: spec items that must all match
+    :rtype:  list of str
+
+    :raise ValueError: if the clause is not in a supported syntax
+    """
+    match = _CLAUSE.match(clause)
+    if match is None:
+        raise ValueError('unsupported version requirement: %s' % clause)
+    operator, major, minor, patch, prerelease = match.groups()
+
+    # the numbers that are specified, up to the first wildcard
+    numbers = []
+    for part in (major, minor, patch):
+        if part is None or part in ('x', '*'):
+            break
+        numbers.append(int(part))
+
+    if len(numbers) == 3:
+        version = '%d.%d.%d%s' % (numbers[0], numbers[1], numbers[2], prerelease or '')
+        if operator in (None, '='):
+            return ['==' + version]
+        if operator == '~':
+            return ['>=' + version, '<%d.%d.0' % (numbers[0], numbers[1] + 1)]
+        if operator == '^':
+            return ['>=' + version, '<%d.0.0' % (numbers[0] + 1)]
+        return [operator + version]
+
+    if prerelease:
+        raise ValueError('unsupported version requirement: %s' % clause)
+    if not numbers:
+        # a wildcard matches every version
+        return []
+
+    # a partial version stands for the range of versions that start with it
+    lower = '.'.join(str(n) for n in numbers + [0] * (3 - len(numbers)))
+    if operator == '^' and len(numbers) == 2:
+        bumped = [numbers[0] + 1, 0]
+    else:
+        bumped = numbers[:-1] + [numbers[-1] + 1]
+    upper = '.'.join(str(n) for n in bumped + [0] * (3 - len(bumped)))
+
+    if operator in (None, '=', '~', '^'):
+        return ['>=' + lower, '<' + upper]
+    if operator == '>=':
+        return ['>=' + lower]
+    if operator == '<':
+        return ['<' + lower]
+    if operator == '>':
+        return ['>=' + upper]
+    # operator == '<='
+    return ['<' + upper]
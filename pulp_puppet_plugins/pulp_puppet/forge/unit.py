@@ -16,6 +16,9 @@ import logging
 
 import semantic_version
 
+from pulp_puppet.common import constants
+from pulp_puppet.forge import requirements
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -126,7 +129,7 @@ class Unit(object):
     """
 
     def __init__(self, name, version, file, dependencies, db, repo_id, host, protocol,
-                 file_md5=None):
+                 file_md5=None, dep_closures=False, version_key=None):
         """
 
         :param name:        name in form "author/title"
@@ -138,10 +141,12 @@ class Unit(object):
         :param dependencies:list of dependencies as dicts with keys "name" and
                             "version_requirement"
         :type  dependencies:list
-        :param db:          open instance of a gdbm database
-        :type  db:          gdbm.gdbm
-        :param repo_id:     ID of the repository in which this unit lives and in
-                            which dependencies should be searched for
+        :param db:          open instance of a gdbm database in which
+                            dependencies should be searched for, or a view
+                            combining those of several repositories
+        :type  db:          gdbm.gdbm or
+                            pulp_puppet.forge.merged.MergedDependencyData
+        :param repo_id:     ID of the repository in which this unit lives
         :type  repo_id:     str
         :param host:        host name, optionally ending with a ":" and port
                             number, to which the current web request was made
@@ -150,6 +155,13 @@ class Unit(object):
         :type  protocol:    str
         :param file_md5:    the md5 checksum for the file
         :type  file_md5:    str
+        :param dep_closures:whether the database stores the dependency closure
+                            of each module
+        :type  dep_closures:bool
+        :param version_key: sort key of the version, as returned by
+                            version_sort_key; computed from the version if
+                            not specified
+        :type  version_key: list
         """
         self.name = name
         self.version = version
@@ -160,6 +172,9 @@ class Unit(object):
         self.host = host
         self.protocol = protocol
         self.file_md5 = file_md5
+        self.dep_closures = dep_closures
+        self._version_key = version_key
+        self._semver = None
 
     @classmethod
     def units_from_json(cls, name, db, repo_id, host, protocol):
@@ -194,13 +209,17 @@ class Unit(object):
             for unit in units
         ]
 
-    def build_dep_metadata(self, recurse_deps=True):
+    def build_dep_metadata(self, recurse_deps=True, pruned=False):
         """
         Builds and returns the dependency metadata for this unit
 
         :param recurse_deps: Whether or not a module should have it's full dependency chain
                          recursively added to it's own
         :type recurse_deps: bool
+        :param pruned: Whether only the versions of the dependencies that can be part of a
+                       set of versions satisfying all version requirements should be added,
+                       instead of all of them
+        :type pruned: bool
 
         :return:    data structure defining dependency data for the given module and
                     its download path, identical to what the puppet forge v1 API
@@ -208,10 +227,160 @@ class Unit(object):
         :rtype:     dict
         """
         root = {self.name: [self.to_dict()]}
-        for dep in self.dependencies:
-            self._add_dep_to_metadata(dep['name'], root, recurse_deps=recurse_deps)
+        if recurse_deps and pruned:
+            self._add_pruned_deps_to_metadata(root)
+        else:
+            self.add_deps_to_metadata(root, recurse_deps)
         return root
 
+    def add_deps_to_metadata(self, root, recurse_deps=True):
+        """
+        Adds the dependency metadata of this unit's dependencies, but not of
+        this unit itself, to an existing dependency metadata structure. Modules
+        already in the structure are neither added again nor walked, so units
+        of the same repository can share a structure to walk the dependencies
+        they have in common only once.
+
+        :param root:    existing dependency data structure
+        :type  root:    dict
+        :param recurse_deps: Whether or not a module should have it's full dependency chain
+                         recursively added to it's own
+        :type recurse_deps: bool
+
+        :return:    None
+        """
+        if recurse_deps and self.dep_closures:
+            self._add_dep_closure_to_metadata(root)
+        else:
+            for dep in self.dependencies:
+                self._add_dep_to_metadata(dep['name'], root, recurse_deps=recurse_deps)
+
+    def _add_dep_closure_to_metadata(self, root):
+        """
+        Adds all of this unit's dependencies, and everything they depend on in
+        turn, to a dependency metadata structure. The names of the indirect
+        dependencies are read from the closures stored in the database at
+        publish time, so the result matches that of recursively calling
+        _add_dep_to_metadata without walking the database.
+
+        :param root:    existing dependency data structure
+        :type  root:    dict
+
+        :return:    None
+        """
+        names = []
+        for dep in self.dependencies:
+            names.append(dep['name'])
+            try:
+                closure = self.db[constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX + dep['name']]
+            except KeyError:
+                # the dependency is not in the repository
+                continue
+            names.extend(json.loads(closure))
+
+        for name in names:
+            if name not in root:
+                units = self.units_from_json(name, self.db, self.repo_id, self.host,
+                                             self.protocol)
+                root[name] = [unit.to_dict() for unit in units]
+
+    def _add_pruned_deps_to_metadata(self, root):
+        """
+        Adds to a dependency metadata structure the versions of this unit's
+        dependencies, and of everything they depend on in turn, that can be
+        part of a set of versions satisfying all version requirements. This
+        unit is part of every such set, so its own requirements must always be
+        satisfied, while a version required by another dependency is only
+        added if some added version of a module depending on it requires it.
+        Versions with a requirement on a module in the repository that no
+        added version satisfies are then removed, until none are left.
+
+        Requirements that cannot be parsed are satisfied by every version, and
+        modules that are not in the repository satisfy every requirement, so
+        a version is only left out if it cannot be used.
+
+        :param root:    existing dependency data structure
+        :type  root:    dict
+
+        :return:    None
+        """
+        units_by_name = {self.name: [self]}
+
+        def units_of(name):
+            if name not in units_by_name:
+                units_by_name[name] = self.units_from_json(name, self.db, self.repo_id,
+                                                           self.host, self.protocol)
+            return units_by_name[name]
+
+        fixed_requirements = {}
+        for dep in self.dependencies:
+            fixed_requirements.setdefault(dep['name'], []).append(_requirement(dep))
+
+        def candidates(dep, excluded):
+            return [unit for unit in units_of(dep['name'])
+                    if id(unit) not in excluded and unit.satisfies(_requirement(dep)) and
+                    all(unit.satisfies(r) for r in fixed_requirements.get(dep['name'], []))]
+
+        excluded = set()
+        while True:
+            # find the versions reachable through satisfied requirements
+            added = {self.name: set([id(self)])}
+            names = []
+            queue = [self]
+            while queue:
+                unit = queue.pop()
+                for dep in unit.dependencies:
+                    if dep['name'] not in added:
+                        added[dep['name']] = set()
+                        names.append(dep['name'])
+                    for candidate in candidates(dep, excluded):
+                        if id(candidate) not in added[dep['name']]:
+                            added[dep['name']].add(id(candidate))
+                            queue.append(candidate)
+
+            # remove the versions that cannot be satisfied
+            unusable = set()
+            for name in names:
+                for unit in units_of(name):
+                    if id(unit) not in added[name]:
+                        continue
+                    for dep in unit.dependencies:
+                        if units_of(dep['name']) and not [
+                                c for c in candidates(dep, excluded)
+                                if id(c) in added[dep['name']]]:
+                            unusable.add(id(unit))
+            if not unusable:
+                break
+            excluded.update(unusable)
+
+        for name in names:
+            if name not in root:
+                root[name] = [unit.to_dict() for unit in units_of(name)
+                              if id(unit) in added[name]]
+
+    def satisfies(self, requirement):
+        """
+        :param requirement: parsed version requirement, as returned by
+                            pulp_puppet.forge.requirements.get
+        :type  requirement: pulp_puppet.forge.requirements.Requirement or None
+
+        :return: True if this unit's version satisfies the requirement; a
+                 requirement of None is satisfied by every version, and a
+                 version that cannot be parsed satisfies every requirement,
+                 so that pruning never drops a release it cannot judge
+        :rtype:  bool
+        """
+        if requirement is None:
+            return True
+        if self._semver is None:
+            try:
+                self._semver = semantic_version.Version(self.version)
+            except ValueError:
+                self._semver = False
+        if self._semver is False:
+            return True
+        return requirement.match(self._semver)
+
     def _add_dep_to_metadata(self, name, root, recurse_deps=True):
         """
         Given a dependency metadata structure, add a new dependency to it. This
@@ -263,16 +432,77 @@ class Unit(object):
             'file_md5': self.file_md5
         }
 
+    @property
+    def version_key(self):
+        """
+        :return: sort key of this unit's version, as returned by
+                 version_sort_key. It is stored with each release at publish
+                 time, so it only needs to be computed for repositories
+                 published before that was the case.
+        :rtype:  list
+        """
+        if self._version_key is None:
+            self._version_key = version_sort_key(self.version)
+        return self._version_key
+
     def __cmp__(self, other):
         """
-        Converts versions before doing the comparison. They are strings such as
-        "1.0.0", which we convert to a tuple of ints such as (1, 0, 0).
+        Compares the units by semantic version, using the sort key of each
+        unit's version.
 
         :param other:   other Unit instance
         :type  other:   pulp_puppet.forge.unit.Unit
 
         :return:        whatever "cmp" returns
         """
-        my_semver = semantic_version.Version(self.version)
-        other_semver = semantic_version.Version(other.version)
-        return cmp(my_semver, other_semver)
+        return cmp(self.version_key, other.version_key)
+
+
+def _requirement(dep):
+    """
+    :param dep: dependency as a dict with keys "name" and optionally
+                "version_requirement"
+    :type  dep: dict
+
+    :return: parsed version requirement of the dependency
+    :rtype:  pulp_puppet.forge.requirements.Requirement or None
+    """
+    # the requirement may be given as null, which means any version
+    return requirements.get(dep.get('version_requirement') or '>= 0.0.0')
+
+
+def version_sort_key(version):
+    """
+    Builds a key that orders versions by semantic version precedence when
+    compared with other keys built by this function. The key only holds
+    lists, ints and strings, so it survives being stored as JSON. Versions
+    that cannot be parsed sort before all valid versions, in string order.
+
+    For example, "1.2.0-rc.1" becomes [1, 1, 2, 0, [0, [1, "rc"], [0, 1]]]
+    and "1.2.0" becomes [1, 1, 2, 0, [1]].
+
+    :param version: version of a module, such as "1.2.0"
+    :type  version: basestring
+
+    :return: sort key of the version
+    :rtype:  list
+    """
+    try:
+        semver = semantic_version.Version(version)
+    except ValueError:
+        return [0, version]
+
+    if semver.prerelease:
+        # numeric identifiers have lower precedence than alphanumeric ones
+        identifiers = []
+        for identifier in semver.prerelease:
+            if identifier.isdigit():
+                identifiers.append([0, int(identifier)])
+            else:
+                identifiers.append([1, identifier])
+        # a pre-release has lower precedence than the release itself
+        prerelease = [0] + identifiers
+    else:
+        prerelease = [1]
+
+    return [1, semver.major, semver.minor, semver.patch, prerelease]
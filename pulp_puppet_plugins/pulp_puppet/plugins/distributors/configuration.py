@@ -21,10 +21,14 @@ from pulp_puppet.common import constants
 DEFAULT_CONFIG = {
     constants.CONFIG_SERVE_HTTP: constants.DEFAULT_SERVE_HTTP,
     constants.CONFIG_SERVE_HTTPS: constants.DEFAULT_SERVE_HTTPS,
+    constants.CONFIG_STATIC_RELEASES: constants.DEFAULT_STATIC_RELEASES,
+    constants.CONFIG_PRUNED_DEPENDENCIES: constants.DEFAULT_PRUNED_DEPENDENCIES,
     constants.CONFIG_HTTP_DIR: constants.DEFAULT_HTTP_DIR,
     constants.CONFIG_HTTPS_DIR: constants.DEFAULT_HTTPS_DIR,
     constants.CONFIG_ABSOLUTE_PATH: constants.DEFAULT_ABSOLUTE_PATH,
-    constants.CONFIG_FILE_HTTPS_DIR: constants.DEFAULT_FILE_HTTPS_DIR
+    constants.CONFIG_FILE_HTTPS_DIR: constants.DEFAULT_FILE_HTTPS_DIR,
+    constants.CONFIG_MASTER_DIR: constants.DEFAULT_MASTER_DIR,
+    constants.CONFIG_SYMLINK_THREADS: constants.DEFAULT_SYMLINK_THREADS,
 }
 
 
@@ -41,7 +45,10 @@ def validate(config):
 
     validations = (
         _validate_http,
-        _validate_https
+        _validate_https,
+        _validate_static_releases,
+        _validate_pruned_dependencies,
+        _validate_symlink_threads,
     )
 
     for v in validations:
@@ -73,3 +80,49 @@ def _validate_https(config):
 
     return True, None
 
+
+def _validate_static_releases(config):
+    """
+    Validates the static releases flag, if one was specified.
+    """
+    if config.get(constants.CONFIG_STATIC_RELEASES) is None:
+        return True, None
+
+    parsed = config.get_boolean(constants.CONFIG_STATIC_RELEASES)
+    if parsed is None:
+        return False, _('The value for <%(k)s> must be either "true" or "false"') % {'k' : constants.CONFIG_STATIC_RELEASES}
+
+    return True, None
+
+
+def _validate_pruned_dependencies(config):
+    """
+    Validates the pruned dependencies flag, if one was specified.
+    """
+    if config.get(constants.CONFIG_PRUNED_DEPENDENCIES) is None:
+        return True, None
+
+    parsed = config.get_boolean(constants.CONFIG_PRUNED_DEPENDENCIES)
+    if parsed is None:
+        return False, _('The value for <%(k)s> must be either "true" or "false"') % {'k' : constants.CONFIG_PRUNED_DEPENDENCIES}
+
+    return True, None
+
+
+def _validate_symlink_threads(config):
+    """
+    Validates the number of symlink threads, if specified.
+    """
+    value = config.get(constants.CONFIG_SYMLINK_THREADS)
+    if value is None:
+        return True, None
+
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        parsed = 0
+
+    if parsed < 1:
+        return False, _('The value for <%(k)s> must be a positive integer') % {'k' : constants.CONFIG_SYMLINK_THREADS}
+
+    return True, None
@@ -2,23 +2,43 @@ from datetime import datetime
 from gettext import gettext as _
 import copy
 import gdbm
-import hashlib
+import itertools
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import shutil
 import sys
+import zlib
 
 from pulp.server.db.model.criteria import UnitAssociationCriteria
 
-from pulp_puppet.common import constants
+from pulp_puppet.common import constants, dependency_index, search
 from pulp_puppet.common.constants import (STATE_FAILED, STATE_RUNNING, STATE_SUCCESS, STATE_SKIPPED)
 from pulp_puppet.common.model import RepositoryMetadata, Module
 from pulp_puppet.common.publish_progress import PublishProgressReport
+from pulp_puppet.forge.unit import Unit as ForgeUnit, version_sort_key
+from pulp_puppet.plugins.importers import metadata as metadata_parser
 
 
 _logger = logging.getLogger(__name__)
 
+# Number of module symlinks created between progress report updates
+SYMLINK_BATCH_SIZE = 500
+
+# Number of units retrieved from the database at a time
+UNIT_PAGE_SIZE = 1000
+
+# Number of bytes of the metadata document compressed at a time
+GZIP_CHUNK_SIZE = 64 * 1024
+
+# Unit fields, in addition to the unit key, retrieved by each step of the
+# publish. The checksum and storage path are needed by both to describe the
+# module in the publish manifest.
+MODULES_STEP_UNIT_FIELDS = ('_storage_path', 'checksum')
+METADATA_STEP_UNIT_FIELDS = ('_storage_path', 'checksum', 'tag_list', 'dependencies',
+                             'file_md5', 'summary', 'description', 'project_page')
+
 
 class PuppetModulePublishRun(object):
     """
@@ -46,6 +66,17 @@ class PuppetModulePublishRun(object):
 
         self.progress_report = PublishProgressReport(self.publish_conduit)
 
+        # Populated when the build directory from the previous publish is
+        # reused; only these changes are applied to it
+        self.incremental = False
+        self.added_module_keys = set()
+        self.removed_entries = []
+
+        # Manifest keys of modules that could not be added to the build
+        # directory; they are left out of the manifest so the next publish
+        # retries them
+        self.failed_module_keys = set()
+
     def perform_publish(self):
         """
         Performs the publish operation according to the configured state of the
@@ -63,10 +94,8 @@ class PuppetModulePublishRun(object):
         _logger.info('Beginning publish for repository <%s>' % self.repo.id)
 
         try:
-            modules = self._modules_step()
-
-            if modules is not None:
-                self._metadata_step(modules)
+            if self._modules_step():
+                self._metadata_step()
         finally:
             # One final update before finishing
             self.progress_report.update_progress()
@@ -80,9 +109,8 @@ class PuppetModulePublishRun(object):
         publish. Calls in here should *only* update the modules-related steps
         in the progress report.
 
-        :return: list of modules in the repository; None if the modules step
-                 failed
-        :rtype:  list of pulp.plugins.model.AssociatedUnit
+        :return: true if the modules step succeeded; false otherwise
+        :rtype:  bool
         """
         self.progress_report.modules_state = STATE_RUNNING
         # Do not update here; the counts need to be set first by the
@@ -91,9 +119,11 @@ class PuppetModulePublishRun(object):
         start_time = datetime.now()
 
         try:
-            self._init_build_dir()
-            modules = self._retrieve_repo_modules()
-            self._symlink_modules(modules)
+            previous_manifest = self._load_manifest()
+            if previous_manifest is None or \
+                    not self._apply_module_changes(previous_manifest):
+                self._init_build_dir()
+                self._symlink_modules(self._iterate_repo_modules(MODULES_STEP_UNIT_FIELDS))
         except Exception, e:
             _logger.exception('Exception during modules step for repository <%s>' % self.repo.id)
 
@@ -108,7 +138,7 @@ class PuppetModulePublishRun(object):
 
             self.progress_report.update_progress()
 
-            return None
+            return False
 
         self.progress_report.modules_state = STATE_SUCCESS
 
@@ -118,15 +148,13 @@ class PuppetModulePublishRun(object):
 
         self.progress_report.update_progress()
 
-        return modules
+        return True
 
-    def _metadata_step(self, modules):
+    def _metadata_step(self):
         """
         Performs all of the necessary actions in the metadata section of the
         publish. Calls in here should *only* update the metadata-related steps
         in the progress report.
-
-        :type modules: list of pulp.plugins.model.AssociatedUnit
         """
         self.progress_report.metadata_state = STATE_RUNNING
         self.progress_report.update_progress()
@@ -134,10 +162,9 @@ class PuppetModulePublishRun(object):
         start_time = datetime.now()
 
         try:
-            self._generate_metadata(modules)
-            self._generate_dependency_data(modules)
+            manifest_entries = self._generate_metadata()
             self._copy_to_published()
-            self._cleanup_build_dir()
+            self._write_manifest(manifest_entries)
         except Exception, e:
             _logger.exception('Exception during metadata generation step for repository <%s>' % self.repo.id)
             self.progress_report.metadata_state = STATE_FAILED
@@ -177,25 +204,164 @@ class PuppetModulePublishRun(object):
 
         os.makedirs(build_dir)
 
-    def _cleanup_build_dir(self):
+    def _load_manifest(self):
+        """
+        Loads the manifest describing the contents of the build directory as
+        of the last successful publish. The manifest file is removed as part
+        of this call so that a publish that fails partway through leaves no
+        manifest behind and the next publish rebuilds from scratch.
+
+        The manifest is only usable if the build directory it describes is
+        still intact and it was generated for the same repository path and
+        dependency database format, since the path is embedded in the
+        dependency data.
+
+        :return: manifest of the previous publish; None if there is no usable
+                 manifest
+        :rtype:  dict or None
+        """
+        manifest_path = self._manifest_path()
+        if not os.path.exists(manifest_path):
+            return None
+
+        try:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, ValueError):
+            _logger.warning('Unable to read publish manifest for repository <%s>' % self.repo.id)
+            manifest = None
+        finally:
+            os.remove(manifest_path)
+
+        if manifest is None or manifest.get('repo_path') != self._repo_path:
+            return None
+
+        if manifest.get('depdata_format') != constants.REPO_DEPDATA_FORMAT_VERSION:
+            return None
+
+        dep_file = os.path.join(self._build_dir(), constants.REPO_DEPDATA_FILENAME)
+        if not os.path.exists(dep_file):
+            return None
+
+        return manifest
+
+    def _write_manifest(self, entries):
         """
-        Deletes the build directory after a successful publish.
+        Records the modules present in the build directory so the next publish
+        can apply only the changes made to the repository since this one.
+
+        :param entries: manifest entries of the modules in the build directory,
+                        keyed by manifest key
+        :type  entries: dict
         """
-        _logger.info('Cleaning up build directory for repository <%s>' % self.repo.id)
+        manifest = {'repo_path': self._repo_path,
+                    'depdata_format': constants.REPO_DEPDATA_FORMAT_VERSION,
+                    'modules': entries}
+        with open(self._manifest_path(), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    def _manifest_entry(self, module):
+        """
+        :type  module: pulp.plugins.model.AssociatedUnit
+        :return: description of the module as it is stored in the manifest
+        :rtype:  dict
+        """
+        return {
+            'author': module.unit_key['author'],
+            'name': module.unit_key['name'],
+            'version': module.unit_key['version'],
+            'checksum': module.metadata.get('checksum'),
+            'storage_path': module.storage_path,
+            'path': self._build_relative_path(module),
+        }
+
+    def _apply_module_changes(self, previous_manifest):
+        """
+        Brings the build directory left by the previous publish in line with
+        the current contents of the repository by removing the symlinks of
+        modules that are gone or have changed and adding symlinks for modules
+        that are new or have changed. The added and removed modules are stored
+        on this instance so the metadata step can apply the same changes to
+        the dependency data. Only the modules that were added are held in
+        memory while the repository's units are read.
+
+        If anything goes wrong the caller is expected to rebuild the
+        repository from scratch.
+
+        :param previous_manifest: manifest loaded from the previous publish
+        :type  previous_manifest: dict
+
+        :return: true if the changes were applied; false otherwise
+        :rtype:  bool
+        """
+        _logger.info('Applying module changes to the previous build for repository <%s>' %
+                     self.repo.id)
 
         build_dir = self._build_dir()
-        shutil.rmtree(build_dir)
+        # entries still in here once all units are read are for removed modules
+        previous_entries = previous_manifest['modules']
+
+        module_count = 0
+        added_modules = []
+        removed_entries = []
+        for module in self._iterate_repo_modules(MODULES_STEP_UNIT_FIELDS):
+            module_count += 1
+            entry = self._manifest_entry(module)
+            previous_entry = previous_entries.pop(_manifest_key(module.unit_key), None)
+            if previous_entry != entry:
+                added_modules.append(module)
+                if previous_entry is not None:
+                    removed_entries.append(previous_entry)
+        removed_entries.extend(previous_entries.values())
+
+        self.progress_report.modules_total_count = module_count
+        self.progress_report.modules_finished_count = module_count - len(added_modules)
+        self.progress_report.modules_error_count = 0
+        self.progress_report.update_progress()
 
-    def _retrieve_repo_modules(self):
+        try:
+            for entry in removed_entries:
+                symlink_path = os.path.join(build_dir, entry['path'])
+                if os.path.lexists(symlink_path):
+                    os.remove(symlink_path)
+        except Exception:
+            _logger.exception('Unable to reuse the previous build for repository <%s>' %
+                              self.repo.id)
+            return False
+
+        self._create_symlinks(build_dir, added_modules)
+
+        self.incremental = True
+        self.added_module_keys = set(_manifest_key(m.unit_key) for m in added_modules)
+        self.removed_entries = removed_entries
+        return True
+
+    def _iterate_repo_modules(self, unit_fields):
         """
-        Retrieves all modules in the repository.
+        Retrieves the modules in the repository from the database a page at a
+        time, so only one page of units is held in memory at once.
+
+        :param unit_fields: fields to retrieve for each module in addition to
+                            its unit key
+        :type  unit_fields: iterable of str
 
-        :return: list of modules in the repository; empty list if there are none
-        :rtype:  list of pulp.plugins.model.AssociatedUnit
+        :return: generator of the modules in the repository
+        :rtype:  generator of pulp.plugins.model.AssociatedUnit
         """
-        criteria = UnitAssociationCriteria(type_ids=[constants.TYPE_PUPPET_MODULE])
-        all_units = self.publish_conduit.get_units(criteria=criteria)
-        return all_units
+        fields = list(Module.UNIT_KEY_NAMES) + list(unit_fields)
+        skip = 0
+        while True:
+            criteria = UnitAssociationCriteria(type_ids=[constants.TYPE_PUPPET_MODULE],
+                                               unit_fields=fields,
+                                               association_sort=[('unit_id', 1)],
+                                               skip=skip, limit=UNIT_PAGE_SIZE)
+            page = self.publish_conduit.get_units(criteria=criteria)
+            for module in page:
+                yield module
+
+            if len(page) < UNIT_PAGE_SIZE:
+                break
+            skip += len(page)
 
     def _symlink_modules(self, modules):
         """
@@ -204,31 +370,91 @@ class PuppetModulePublishRun(object):
         this call will match the expected structure of how the repository will
         be served.
 
-        :type modules: list of pulp.plugins.model.AssociatedUnit
+        The total module count in the progress report grows as the modules
+        are read.
+
+        :type modules: iterable of pulp.plugins.model.AssociatedUnit
         """
         _logger.info('Creating symlinks for modules in repository <%s>' % self.repo.id)
 
         build_dir = self._build_dir()
 
-        self.progress_report.modules_total_count = len(modules)
+        self.progress_report.modules_total_count = 0
         self.progress_report.modules_finished_count = 0
         self.progress_report.modules_error_count = 0
         self.progress_report.update_progress()
 
-        for module in modules:
-            served_relative_path = self._build_relative_path(module)
-            symlink_path = os.path.join(build_dir, served_relative_path)
-            symlink_dir = os.path.split(symlink_path)[0]
+        def counted(modules):
+            for module in modules:
+                self.progress_report.modules_total_count += 1
+                yield module
 
-            try:
-                if not os.path.exists(symlink_dir):
-                    os.makedirs(symlink_dir)
-                os.symlink(module.storage_path, symlink_path)
-                self.progress_report.modules_finished_count += 1
-            except Exception:
-                self.progress_report.add_failed_module(module, sys.exc_info()[2])
+        self._create_symlinks(build_dir, counted(modules))
 
-            self.progress_report.update_progress()
+    def _create_symlinks(self, build_dir, modules):
+        """
+        Creates the symlinks for the given modules in the build directory. The
+        modules are read and linked in batches, with the progress report
+        updated after each batch rather than each module. Within a batch the
+        author directories the links live in are created first, each only
+        once per call, and the links are then made in path order.
+
+        If the distributor is configured with more than one symlink thread,
+        the links in a batch are created concurrently, which helps when the
+        build directory is on a network filesystem.
+
+        A failure for an individual module is recorded in the progress report
+        rather than raised.
+
+        :param build_dir: directory in which the repository is being assembled
+        :type  build_dir: str
+        :type  modules:   iterable of pulp.plugins.model.AssociatedUnit
+        """
+        created_dirs = set()
+
+        thread_count = int(self.config.get(constants.CONFIG_SYMLINK_THREADS,
+                                           constants.DEFAULT_SYMLINK_THREADS))
+        pool = None
+        if thread_count > 1:
+            pool = ThreadPool(thread_count)
+
+        try:
+            modules = iter(modules)
+            while True:
+                batch = [(os.path.join(build_dir, self._build_relative_path(module)), module)
+                         for module in itertools.islice(modules, SYMLINK_BATCH_SIZE)]
+                if not batch:
+                    break
+                batch.sort(key=lambda link: link[0])
+
+                symlink_dirs = set(os.path.dirname(path) for path, module in batch)
+                for symlink_dir in sorted(symlink_dirs - created_dirs):
+                    try:
+                        if not os.path.exists(symlink_dir):
+                            os.makedirs(symlink_dir)
+                    except OSError:
+                        # each module in the directory will fail and be reported below
+                        _logger.exception('Unable to create directory %s' % symlink_dir)
+                    created_dirs.add(symlink_dir)
+
+                requests = [(module.storage_path, path) for path, module in batch]
+                if pool is None:
+                    results = map(_create_symlink, requests)
+                else:
+                    results = pool.map(_create_symlink, requests)
+
+                for (path, module), traceback in zip(batch, results):
+                    if traceback is None:
+                        self.progress_report.modules_finished_count += 1
+                    else:
+                        self.failed_module_keys.add(_manifest_key(module.unit_key))
+                        self.progress_report.add_failed_module(module, traceback)
+
+                self.progress_report.update_progress()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
     def _build_relative_path(self, module):
         """
@@ -254,122 +480,427 @@ class PuppetModulePublishRun(object):
         base_path = self.config.get(constants.CONFIG_ABSOLUTE_PATH, constants.DEFAULT_ABSOLUTE_PATH)
         return os.path.join(base_path, self.repo.id)
 
-    def _generate_metadata(self, modules):
+    def _generate_metadata(self):
         """
-        Generates the repository metadata document for all modules in the
-
-        :type modules: list of pulp.plugins.model.AssociatedUnit
+        Generates the repository metadata document and the dependency data in
+        a single pass over the modules in the repository, which are read from
+        the database a page at a time. The metadata document is written as
+        each module is read, rather than holding the whole document.
+
+        :return: manifest entries of the modules in the build directory, keyed
+                 by manifest key
+        :rtype:  dict
         """
         _logger.info('Generating metadata for repository <%s>' % self.repo.id)
 
-        # Convert the Pulp data types into the local model
-        metadata = RepositoryMetadata()
-
-        for m in modules:
-            combined = copy.copy(m.unit_key)
-            combined.update(m.metadata)
-            module = Module.from_dict(combined)
-            metadata.modules.append(module)
-
-        # Write the JSON representation of the metadata to the repository
-        json_metadata = metadata.to_json()
         build_dir = self._build_dir()
         metadata_file = os.path.join(build_dir, constants.REPO_METADATA_FILENAME)
+        manifest_entries = {}
+
+        db = self._open_dependency_data()
+        try:
+            # search entries of the latest release of each module
+            search_entries = {}
+            # encoded dependency entries of the added releases of each module
+            added_entries = {}
+
+            def module_dicts():
+                for module in self._iterate_repo_modules(METADATA_STEP_UNIT_FIELDS):
+                    key = _manifest_key(module.unit_key)
+                    # a module whose file could not be published is left out
+                    # of the manifest, so it is added again by the next publish
+                    if key not in self.failed_module_keys:
+                        if not self.incremental or key in self.added_module_keys:
+                            self._add_dependency_entry(added_entries, module)
+                        manifest_entries[key] = self._manifest_entry(module)
+                    _add_search_entry(search_entries, module)
+                    yield _module_dict(module)
+
+            _remove_file(metadata_file)
+            f = open(metadata_file, 'w')
+            try:
+                RepositoryMetadata.write_json(module_dicts(), f)
+            finally:
+                f.close()
+
+            changed_keys = self._store_dependency_data(db, added_entries)
+            if changed_keys:
+                self._store_dependency_closures(db)
+            search_changed = self._store_search_index(db, search_entries)
+
+            index_file = os.path.join(build_dir, constants.REPO_DEPINDEX_FILENAME)
+            if changed_keys or search_changed or not os.path.exists(index_file):
+                dependency_index.write_index(index_file, db)
+
+            self._generate_static_releases(db)
+        finally:
+            db.close()
+
+        self._write_metadata_artifacts(metadata_file)
+
+        return manifest_entries
 
-        f = open(metadata_file, 'w')
-        f.write(json_metadata)
+    def _write_metadata_artifacts(self, metadata_file):
+        """
+        Writes a gzip compressed copy of the metadata document and a sidecar
+        file holding the document's SHA-256 checksum beside it, so the web
+        server can hand the compressed form to clients that accept it.
+
+        When the checksum matches that of the build currently being served,
+        the new files are given the modification time of the served document.
+        Apache derives the ETag and Last-Modified headers from the
+        modification time and size, so they stay the same across publishes
+        that did not change the metadata and conditional requests from
+        downstream servers are answered without a body.
+
+        :param metadata_file: full path to the metadata document in the build
+                              directory
+        :type  metadata_file: str
+        """
+        checksum = metadata_parser.calculate_checksum(metadata_file)
+
+        compressed_file = metadata_file + constants.REPO_METADATA_GZIP_SUFFIX
+        _remove_file(compressed_file)
+        _gzip_file(metadata_file, compressed_file)
+
+        checksum_file = metadata_file + constants.REPO_METADATA_CHECKSUM_SUFFIX
+        _remove_file(checksum_file)
+        f = open(checksum_file, 'w')
+        f.write('%s  %s\n' % (checksum, os.path.basename(metadata_file)))
         f.close()
 
-    def _generate_dependency_data(self, modules):
+        served = self._served_metadata_checksum()
+        if served is not None and served[0] == checksum:
+            mtime = served[1]
+            for path in (metadata_file, compressed_file, checksum_file):
+                os.utime(path, (mtime, mtime))
+
+    def _served_metadata_checksum(self):
+        """
+        :return: tuple of the checksum of the metadata document in the build
+                 currently being served and the document's modification
+                 time; None if there is no such build or it has no checksum
+        :rtype:  tuple or None
         """
-        generate the dependency metadata that is required to provide the API
-        that the "puppet module" tool uses. Store the metadata in a gdbm
-        database at the root of the repo. Generating and storing it at publish
-        time means the API requests will always return results that are in-sync
-        with the most recent publish and are not influenced by more recent
-        changes to the repo or its contents.
+        for proto_key in (constants.CONFIG_HTTP_DIR, constants.CONFIG_HTTPS_DIR):
+            repo_dir = os.path.join(self.config.get(proto_key), self.repo.id)
+            if os.path.exists(repo_dir):
+                # the build the repository's symlink points to, which is not
+                # necessarily the newest one if a publish failed part way
+                served_build_dir = os.path.realpath(repo_dir)
+                break
+        else:
+            return None
+
+        metadata_file = os.path.join(served_build_dir, constants.REPO_METADATA_FILENAME)
+        try:
+            f = open(metadata_file + constants.REPO_METADATA_CHECKSUM_SUFFIX)
+            try:
+                checksum = f.read().split()[0]
+            finally:
+                f.close()
+            mtime = os.stat(metadata_file).st_mtime
+        except (IOError, OSError, IndexError):
+            return None
+
+        return checksum, mtime
 
-        :type modules: list of pulp.plugins.model.AssociatedUnit
+    def _open_dependency_data(self):
+        """
+        Opens the dependency metadata that is required to provide the API
+        that the "puppet module" tool uses. It is stored in a gdbm database at
+        the root of the repo. Generating and storing it at publish time means
+        the API requests will always return results that are in-sync with the
+        most recent publish and are not influenced by more recent changes to
+        the repo or its contents.
+
+        A new database is created unless the build directory of the previous
+        publish is being reused, in which case its database is opened so the
+        changes made to the repository since then can be applied to it.
+
+        :return: the open database
+        :rtype:  gdbm database
         """
         filename = os.path.join(self._build_dir(), constants.REPO_DEPDATA_FILENAME)
-        _logger.debug('generating dependency metadata in file %s' % filename)
-        # opens a new file for writing and overwrites any existing file
-        db = gdbm.open(filename, 'n')
-        try:
-            for module in modules:
-                version = module.unit_key['version']
-                deps = module.metadata.get('dependencies', [])
-                path = os.path.join(self._repo_path, self._build_relative_path(module))
-                # calculate the checksum
-                with open(module.storage_path) as file_handle:
-                    file_hash = hashlib.md5()
-                    while True:
-                        content = file_handle.read(128)
-                        if not content:
-                            break
-                        file_hash.update(content)
-                    md5_sum = file_hash.hexdigest()
-                value = {'file': path, 'version': version, 'dependencies': deps,
-                         'file_md5': md5_sum}
-
-                name = module.unit_key['name']
-                author = module.unit_key['author']
-                key = '%s/%s' % (author, name)
-
-                # db is not a dictionary as assumed by flake8
+
+        if not self.incremental:
+            _logger.debug('generating dependency metadata in file %s' % filename)
+            _remove_file(filename)
+            db = gdbm.open(filename, 'n')
+            db[constants.REPO_DEPDATA_FORMAT_KEY] = constants.REPO_DEPDATA_FORMAT_VERSION
+            return db
+
+        _logger.debug('updating dependency metadata in file %s' % filename)
+        # the database is updated in place, so it must not be shared with the
+        # build being served
+        _unshare_file(filename)
+        return gdbm.open(filename, 'w')
+
+    def _add_dependency_entry(self, entries, module):
+        """
+        Adds the dependency data for a single version of a module to the
+        releases of the module gathered while the repository's units are read.
+        The data is held encoded, along with the sort key of the version, so
+        the gathered releases take little more memory than the database
+        values they are written as.
+
+        :param entries: encoded dependency entries, as tuples of the version,
+                        its sort key and the encoded entry, keyed by the
+                        module's "author/name"
+        :type  entries: dict
+        :type  module: pulp.plugins.model.AssociatedUnit
+        """
+        key = '%s/%s' % (module.unit_key['author'], module.unit_key['name'])
+        entry = self._dependency_entry(module)
+        entries.setdefault(key, []).append(
+            (entry['version'], _dependency_entry_sort_key(entry), json.dumps(entry)))
+
+    def _store_dependency_data(self, db, added_entries):
+        """
+        Writes to the dependency database the release list of each module
+        whose releases were added or removed, in ascending semantic version
+        order so the API can take the last one as the latest. The latest
+        release of each module is also stored on its own, so the API can find
+        it without reading the whole list.
+
+        Each list is written once. In an incremental publish, the list from
+        the previous publish is read once and merged with the added releases,
+        which replace any release of the same version, and the releases of
+        removed modules are dropped.
+
+        :param db: open dependency database
+        :type  db: gdbm database
+        :param added_entries: encoded dependency entries of the added releases,
+                              as gathered by _add_dependency_entry
+        :type  added_entries: dict
+
+        :return: keys of the release lists that were changed
+        :rtype:  set of str
+        """
+        removed_versions = {}
+        if self.incremental:
+            for entry in self.removed_entries:
+                key = '%s/%s' % (entry['author'], entry['name'])
+                removed_versions.setdefault(key, set()).add(entry['version'])
+
+        changed_keys = set(added_entries) | set(removed_versions)
+        for key in changed_keys:
+            releases = added_entries.get(key, [])
+            # db is not a dictionary as assumed by flake8
+            if self.incremental and db.has_key(key): # noqa
+                dropped = removed_versions.get(key, set()) | \
+                    set(version for version, sort_key, value in releases)
+                releases = releases + [
+                    (entry['version'], _dependency_entry_sort_key(entry), json.dumps(entry))
+                    for entry in json.loads(db[key]) if entry['version'] not in dropped]
+            releases.sort(key=lambda release: release[1])
+
+            latest_key = constants.REPO_DEPDATA_LATEST_KEY_PREFIX + key
+            if releases:
+                # the same as encoding the list of entries
+                db[key] = '[%s]' % ', '.join(value for version, sort_key, value in releases)
+                db[latest_key] = releases[-1][2]
+            else:
+                # the module is no longer in the repository
                 if db.has_key(key): # noqa
-                    module_list = json.loads(db[key])
-                else:
-                    module_list = []
-                module_list.append(value)
-                db[key] = json.dumps(module_list)
-        finally:
-            db.close()
+                    del db[key]
+                if db.has_key(latest_key): # noqa
+                    del db[latest_key]
+
+        if removed_versions:
+            db.reorganize()
+        return changed_keys
+
+    def _store_dependency_closures(self, db):
+        """
+        Stores in the dependency database, for each module, the names of all
+        modules that any of its releases depend on directly or indirectly.
+        The forge API can then find every module in a release's dependency
+        tree with a fixed number of lookups instead of walking the database
+        recursively. The closures of modules that are no longer in the
+        repository are deleted.
+
+        :param db: open dependency database, holding the release lists of all
+                   modules in the repository
+        :type  db: gdbm database
+        """
+        prefix = constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+
+        graph = {}
+        closure_keys = []
+        for key in db.keys():
+            if key.startswith(prefix):
+                closure_keys.append(key)
+            elif not key.startswith('.'):
+                graph[key] = set(dep['name'] for release in json.loads(db[key])
+                                 for dep in release['dependencies'])
+
+        closures = _dependency_closures(graph)
+
+        for key in closure_keys:
+            if key[len(prefix):] not in closures:
+                del db[key]
+        for name, closure in closures.iteritems():
+            db[prefix + name] = json.dumps(closure)
+
+    def _store_search_index(self, db, entries):
+        """
+        Stores in the dependency database the module search index used by the
+        forge API: the names of all modules, the search entry of each module,
+        and for each term in the modules' metadata the names of the modules
+        it is found in. Keys of the index that are no longer needed are
+        deleted, and only the keys whose values changed are written.
+
+        :param db: open dependency database
+        :type  db: gdbm database
+        :param entries: search entries of the latest release of each module in
+                        the repository, keyed by the module's "author/name"
+        :type  entries: dict
+
+        :return: True if the database was changed
+        :rtype:  bool
+        """
+        values = {constants.REPO_DEPDATA_MODULES_KEY: json.dumps(sorted(entries))}
+        index = {}
+        for name, entry in entries.iteritems():
+            values[constants.REPO_DEPDATA_MODULE_KEY_PREFIX + name] = json.dumps(entry)
+            for term in search.module_terms(entry):
+                index.setdefault(term, []).append(name)
+        for term, names in index.iteritems():
+            values[constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + term] = json.dumps(sorted(names))
+
+        changed = False
+        prefixes = (constants.REPO_DEPDATA_MODULE_KEY_PREFIX,
+                    constants.REPO_DEPDATA_SEARCH_KEY_PREFIX)
+        for key in db.keys():
+            if key.startswith(prefixes) and key not in values:
+                del db[key]
+                changed = True
+        for key, value in values.iteritems():
+            # db is not a dictionary as assumed by flake8
+            if not db.has_key(key) or db[key] != value: # noqa
+                db[key] = value
+                changed = True
+        return changed
+
+    def _generate_static_releases(self, db):
+        """
+        If configured to, renders for each module in the repository the
+        response the forge API gives to a repository-scoped v1 releases.json
+        request for the module, which is for its latest version with all of
+        its dependencies. The web server can then serve those requests from
+        the files without running the API. The file URLs in the responses are
+        absolute paths, so the files do not depend on the requested host.
+
+        Files from a previous publish are always removed first.
+
+        :param db: open dependency database, holding the sorted release lists
+                   and the dependency closures of all modules in the repository
+        :type  db: gdbm database
+        """
+        releases_dir = os.path.join(self._build_dir(), constants.STATIC_RELEASES_RELATIVE_PATH)
+        if os.path.exists(releases_dir):
+            shutil.rmtree(releases_dir)
+
+        if not self.config.get_boolean(constants.CONFIG_STATIC_RELEASES):
+            return
+
+        _logger.debug('generating static releases in %s' % releases_dir)
+
+        # the responses are pruned like the API's, unless a request asks otherwise
+        pruned = bool(self.config.get_boolean(constants.CONFIG_PRUNED_DEPENDENCIES))
+        for name in db.keys():
+            if name.startswith('.'):
+                continue
+
+            units = ForgeUnit.units_from_json(name, db, self.repo.id, None, None)
+            if not units:
+                continue
+            # the releases are sorted, so the last is the latest
+            latest = units[-1]
+            latest.dep_closures = True
+
+            releases_file = os.path.join(releases_dir, name + '.json')
+            if not os.path.exists(os.path.dirname(releases_file)):
+                os.makedirs(os.path.dirname(releases_file))
+            f = open(releases_file, 'w')
+            try:
+                json.dump(latest.build_dep_metadata(pruned=pruned), f)
+            finally:
+                f.close()
+
+    def _dependency_entry(self, module):
+        """
+        Builds the value stored in the dependency database for a single
+        version of a module.
+
+        :type  module: pulp.plugins.model.AssociatedUnit
+        :return: file path, version, sort key of the version, dependencies and
+                 MD5 of the module
+        :rtype:  dict
+        """
+        version = module.unit_key['version']
+        deps = module.metadata.get('dependencies', [])
+        path = os.path.join(self._repo_path, self._build_relative_path(module))
+        # the checksum is stored on the unit when it is imported; only units
+        # saved before that was the case need the file to be read
+        md5_sum = module.metadata.get('file_md5')
+        if not md5_sum:
+            md5_sum = metadata_parser.calculate_checksum(module.storage_path,
+                                                         constants.FILE_MD5_HASHLIB)
+        return {'file': path, 'version': version, 'version_key': version_sort_key(version),
+                'dependencies': deps, 'file_md5': md5_sum}
 
     def _copy_to_published(self):
         """
-        Moves the built repository into the proper locations where it will be
-        hosted. If a directory is found at the destination, it will be deleted
-        first.
+        Makes the newly built repository live. The build is copied once into a
+        new timestamped directory under the master directory, and the entry
+        for the repository in each protocol directory that should serve it is
+        atomically repointed to that copy. Clients therefore always see either
+        the previous or the new build in full. Builds that are no longer
+        served are then deleted.
+
+        The files of the build are hard linked into the copy rather than
+        duplicated, so a publish does not rewrite files it did not change. The
+        next publish removes or unshares a file before writing to it, so the
+        copy is never changed once it is live.
         """
         _logger.info('Making newly built repository live for repository <%s>' % self.repo.id)
 
-        build_dir = self._build_dir()
+        serve_http = self.config.get_boolean(constants.CONFIG_SERVE_HTTP)
+        serve_https = self.config.get_boolean(constants.CONFIG_SERVE_HTTPS)
 
-        # Remove the existing repository if it's found. It will either
-        # remain deleted if the configuration changed and it shouldn't be
-        # served, or it will be replaced with the newly built one.
+        published_build_dir = None
+        if serve_http or serve_https:
+            published_build_dir = self._new_published_build_dir()
+            _link_tree(self._build_dir(), published_build_dir)
 
         # -- HTTP --------
         proto_dir = self.config.get(constants.CONFIG_HTTP_DIR)
-        repo_dest_dir = os.path.join(proto_dir, self.repo.id)
-
-        unpublish(proto_dir, self.repo)
 
-        should_serve = self.config.get_boolean(constants.CONFIG_SERVE_HTTP)
-        if should_serve:
-            shutil.copytree(build_dir, repo_dest_dir, symlinks=True)
+        if serve_http:
+            _make_live(proto_dir, self.repo, published_build_dir)
             self.progress_report.publish_http = STATE_SUCCESS
         else:
+            unpublish(proto_dir, self.repo)
             self.progress_report.publish_http = STATE_SKIPPED
 
         self.progress_report.update_progress()
 
         # -- HTTPS --------
         proto_dir = self.config.get(constants.CONFIG_HTTPS_DIR)
-        repo_dest_dir = os.path.join(proto_dir, self.repo.id)
-
-        unpublish(proto_dir, self.repo)
 
-        should_serve = self.config.get_boolean(constants.CONFIG_SERVE_HTTPS)
-        if should_serve:
-            shutil.copytree(build_dir, repo_dest_dir, symlinks=True)
+        if serve_https:
+            _make_live(proto_dir, self.repo, published_build_dir)
             self.progress_report.publish_https = STATE_SUCCESS
         else:
+            unpublish(proto_dir, self.repo)
             self.progress_report.publish_https = STATE_SKIPPED
 
         self.progress_report.update_progress()
 
+        _remove_old_published_builds(self._published_builds_dir(), published_build_dir)
+
     # -- helpers --------------------------------------------------------------
 
     def _build_dir(self):
@@ -384,6 +915,220 @@ class PuppetModulePublishRun(object):
         build_dir = os.path.join(self.repo.working_dir, 'build', self.repo.id)
         return build_dir
 
+    def _manifest_path(self):
+        """
+        Returns the location of the manifest describing the contents of the
+        build directory. It lives beside the build directory so it is never
+        copied into the published repository.
+
+        :return: full path to the publish manifest
+        :rtype:  str
+        """
+        return os.path.join(self.repo.working_dir, constants.PUBLISH_MANIFEST_FILENAME)
+
+    def _published_builds_dir(self):
+        """
+        :return: full path to the directory holding this repository's
+                 timestamped published builds
+        :rtype:  str
+        """
+        return _published_builds_dir(self.config, self.repo)
+
+    def _new_published_build_dir(self):
+        """
+        Returns a location, named after the current time so that builds sort
+        in the order they were published, into which a new build of the
+        repository can be copied. The directory itself is not created.
+
+        :return: full path to a new published build directory
+        :rtype:  str
+        """
+        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        builds_dir = self._published_builds_dir()
+        if not os.path.exists(builds_dir):
+            os.makedirs(builds_dir)
+        return os.path.join(builds_dir, timestamp)
+
+
+def _manifest_key(unit_key):
+    """
+    :param unit_key: unit key of a puppet module
+    :type  unit_key: dict
+    :return: string uniquely identifying the module within the publish manifest
+    :rtype:  str
+    """
+    return '%s/%s/%s' % (unit_key['author'], unit_key['name'], unit_key['version'])
+
+
+def _module_dict(module):
+    """
+    :type  module: pulp.plugins.model.AssociatedUnit
+    :return: the module in the dict form used by the local model
+    :rtype:  dict
+    """
+    combined = copy.copy(module.unit_key)
+    combined.update(module.metadata)
+    return combined
+
+
+def _create_symlink(request):
+    """
+    :param request: path the symlink should point to and path of the symlink
+    :type  request: tuple
+    :return: None if the symlink was created; otherwise the traceback of the
+             failure
+    :rtype:  traceback or None
+    """
+    source, link_name = request
+    try:
+        os.symlink(source, link_name)
+    except Exception:
+        return sys.exc_info()[2]
+    return None
+
+
+def _link_tree(source_dir, destination_dir):
+    """
+    Copies a directory tree like shutil.copytree, keeping symlinks, except
+    that regular files are hard linked into the copy. A file that cannot be
+    linked, such as one on another filesystem, is copied instead.
+
+    :param source_dir: full path to the directory to copy
+    :type  source_dir: str
+    :param destination_dir: full path to the copy, which must not exist
+    :type  destination_dir: str
+    """
+    os.makedirs(destination_dir)
+    for name in os.listdir(source_dir):
+        source_path = os.path.join(source_dir, name)
+        destination_path = os.path.join(destination_dir, name)
+        if os.path.islink(source_path):
+            os.symlink(os.readlink(source_path), destination_path)
+        elif os.path.isdir(source_path):
+            _link_tree(source_path, destination_path)
+        else:
+            try:
+                os.link(source_path, destination_path)
+            except OSError:
+                shutil.copy2(source_path, destination_path)
+
+
+def _remove_file(path):
+    """
+    Removes a file that is about to be written again, so the new contents go
+    to a new file instead of one that may be hard linked from a published
+    build. If the file does not exist, this call has no effect.
+
+    :param path: full path to the file
+    :type  path: str
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def _unshare_file(path):
+    """
+    Replaces a file that is hard linked from elsewhere, such as a published
+    build, with a copy of its own, so it can be changed in place without
+    changing the other links. If the file does not exist or is not shared,
+    this call has no effect.
+
+    :param path: full path to the file
+    :type  path: str
+    """
+    if os.path.exists(path) and os.stat(path).st_nlink > 1:
+        tmp_path = path + '.tmp'
+        shutil.copy2(path, tmp_path)
+        os.rename(tmp_path, path)
+
+
+def _gzip_file(source_path, destination_path):
+    """
+    Writes a gzip compressed copy of a file. The gzip header holds neither
+    the original file name nor a modification time, so the same file always
+    compresses to the same bytes.
+
+    :param source_path: full path to the file to compress
+    :type  source_path: str
+    :param destination_path: full path to which the compressed copy is written
+    :type  destination_path: str
+    """
+    source = open(source_path, 'rb')
+    destination = open(destination_path, 'wb')
+    try:
+        # zlib writes a gzip header with a zero modification time
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in iter(lambda: source.read(GZIP_CHUNK_SIZE), ''):
+            destination.write(compressor.compress(chunk))
+        destination.write(compressor.flush())
+    finally:
+        destination.close()
+        source.close()
+
+
+def _dependency_closures(graph):
+    """
+    :param graph: names of the modules that the releases of each module depend
+                  on, keyed by module name
+    :type  graph: dict
+    :return: sorted names of all modules each module in the graph depends on
+             directly or indirectly, keyed by module name
+    :rtype:  dict
+    """
+    closures = {}
+    for name, deps in graph.iteritems():
+        seen = set()
+        pending = list(deps)
+        while pending:
+            dep = pending.pop()
+            if dep not in seen:
+                seen.add(dep)
+                pending.extend(graph.get(dep, ()))
+        seen.discard(name)
+        closures[name] = sorted(seen)
+    return closures
+
+
+def _add_search_entry(entries, module):
+    """
+    Adds the search entry of a module to those of the other modules in the
+    repository, unless an entry for a later release of the module is already
+    there.
+
+    :param entries: search entries keyed by the module's "author/name"
+    :type  entries: dict
+    :type  module: pulp.plugins.model.AssociatedUnit
+    """
+    name = '%s/%s' % (module.unit_key['author'], module.unit_key['name'])
+    version_key = version_sort_key(module.unit_key['version'])
+    existing = entries.get(name)
+    if existing is not None and existing['version_key'] >= version_key:
+        return
+
+    entries[name] = {
+        'author': module.unit_key['author'],
+        'name': module.unit_key['name'],
+        'version': module.unit_key['version'],
+        'version_key': version_key,
+        'summary': module.metadata.get('summary'),
+        'description': module.metadata.get('description'),
+        'tag_list': module.metadata.get('tag_list') or [],
+        'project_page': module.metadata.get('project_page'),
+    }
+
+
+def _dependency_entry_sort_key(entry):
+    """
+    Sort key placing dependency database entries in ascending semantic version
+    order. Versions that cannot be parsed sort before all valid versions so
+    they are never picked as the latest release.
+
+    :param entry: dependency database value for one version of a module
+    :type  entry: dict
+    :rtype: list
+    """
+    return entry['version_key']
+
 
 def unpublish_repo(repo, config):
     """
@@ -401,6 +1146,10 @@ def unpublish_repo(repo, config):
         proto_dir = config.get(proto_key)
         unpublish(proto_dir, repo)
 
+    builds_dir = _published_builds_dir(config, repo)
+    if os.path.exists(builds_dir):
+        shutil.rmtree(builds_dir)
+
 
 def unpublish(protocol_directory, repo):
     """
@@ -414,5 +1163,79 @@ def unpublish(protocol_directory, repo):
     """
     repo_dest_dir = os.path.join(protocol_directory, repo.id)
 
-    if os.path.exists(repo_dest_dir):
+    if os.path.islink(repo_dest_dir):
+        os.remove(repo_dest_dir)
+    elif os.path.exists(repo_dest_dir):
+        # published before builds were symlinked into place
+        shutil.rmtree(repo_dest_dir)
+
+
+def _make_live(protocol_directory, repo, published_build_dir):
+    """
+    Atomically points the repository's entry in the given protocol hosting
+    directory at a published build. A new symlink is created beside the
+    current one and renamed over it, so there is no moment at which the
+    repository is missing.
+
+    :param protocol_directory: directory the repository is served from
+    :type  protocol_directory: str
+    :param repo: repository instance given to the plugin by Pulp
+    :type  repo: pulp.plugins.model.Repository
+    :param published_build_dir: build the repository should be served from
+    :type  published_build_dir: str
+    """
+    repo_dest_dir = os.path.join(protocol_directory, repo.id)
+
+    if not os.path.exists(protocol_directory):
+        os.makedirs(protocol_directory)
+
+    # A directory published before builds were symlinked into place cannot be
+    # renamed over, so it has to be removed first.
+    if os.path.isdir(repo_dest_dir) and not os.path.islink(repo_dest_dir):
         shutil.rmtree(repo_dest_dir)
+
+    tmp_link = os.path.join(protocol_directory, '.%s.new' % repo.id)
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(published_build_dir, tmp_link)
+    os.rename(tmp_link, repo_dest_dir)
+
+
+def _published_builds_dir(config, repo):
+    """
+    :param config: config instance passed into the plugin by Pulp
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+    :param repo: repository instance given to the plugin by Pulp
+    :type  repo: pulp.plugins.model.Repository
+    :return: full path to the directory holding the repository's timestamped
+             published builds
+    :rtype:  str
+    """
+    master_dir = config.get(constants.CONFIG_MASTER_DIR, constants.DEFAULT_MASTER_DIR)
+    return os.path.join(master_dir, repo.id)
+
+
+def _remove_old_published_builds(builds_dir, current_build_dir):
+    """
+    Deletes the published builds of a repository other than the one currently
+    served and the one immediately before it. The previous build is kept so
+    that requests which resolved the repository's path just before the
+    switch can still be answered.
+
+    :param builds_dir: directory holding the repository's published builds
+    :type  builds_dir: str
+    :param current_build_dir: build now being served; None if none is
+    :type  current_build_dir: str or None
+    """
+    if not os.path.exists(builds_dir):
+        return
+
+    builds = sorted(os.listdir(builds_dir))
+    if current_build_dir is None:
+        doomed = builds
+    else:
+        current = os.path.basename(current_build_dir)
+        doomed = [b for b in builds if b < current][:-1]
+
+    for build in doomed:
+        shutil.rmtree(os.path.join(builds_dir, build))
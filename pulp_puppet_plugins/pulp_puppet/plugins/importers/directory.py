@@ -20,6 +20,7 @@ from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp_puppet.common import constants
 from pulp_puppet.common.model import Module
 from pulp_puppet.common.sync_progress import SyncProgressReport
+from pulp_puppet.plugins.importers import metadata as metadata_module
 
 
 _logger = logging.getLogger(__name__)
@@ -293,6 +294,7 @@ class SynchronizeWithDirectory(object):
         :type module: Module
         """
         type_id = constants.TYPE_PUPPET_MODULE
+        module.file_md5 = metadata_module.calculate_checksum(path, constants.FILE_MD5_HASHLIB)
         unit_key = module.unit_key()
         unit_metadata = module.unit_metadata()
         relative_path = constants.STORAGE_MODULE_RELATIVE_PATH % module.filename()
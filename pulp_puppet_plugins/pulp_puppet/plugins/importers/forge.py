@@ -132,11 +132,20 @@ class SynchronizeWithPuppetForge(object):
         finally:
             self.downloader = None
 
-        # Parse the retrieved metadata documents
+        # Parse the retrieved metadata documents, merging modules returned by
+        # more than one query so each distinct module is only processed once
         try:
             metadata = RepositoryMetadata()
-            for doc in metadata_json_docs:
-                metadata.update_from_json(doc)
+            self.progress_report.metadata_query_result_counts = []
+            for index, doc in enumerate(metadata_json_docs):
+                previous_count = len(metadata.modules)
+                result_count = metadata.update_from_json(doc)
+                self.progress_report.metadata_query_result_counts.append({
+                    'result_count': result_count,
+                    'new_count': len(metadata.modules) - previous_count,
+                })
+                # Release the raw document as soon as it has been merged
+                metadata_json_docs[index] = None
         except Exception, e:
             _logger.exception('Exception parsing metadata for repository <%s>' % self.repo.id)
             self.progress_report.metadata_state = STATE_FAILED
@@ -308,6 +317,8 @@ class SynchronizeWithPuppetForge(object):
             # Extract the extra metadata into the module
             metadata_json = metadata_module.extract_metadata(unit.storage_path, self.repo.working_dir, module)
             module = Module.from_json(metadata_json)
+            module.file_md5 = metadata_module.calculate_checksum(unit.storage_path,
+                                                                 constants.FILE_MD5_HASHLIB)
 
             # Update the unit with the extracted metadata
             unit.metadata = module.unit_metadata()
@@ -91,23 +91,40 @@ def extract_metadata(filename, temp_dir, module=None):
         return json.loads(metadata)
 
 
-def calculate_checksum(filename):
+def calculate_checksum(filename, hash_type=constants.DEFAULT_HASHLIB):
     """
     Calculate the checksum for a given file using the default hashlib
 
     :param filename: the filename including path of the file to calculate a checksum for
     :type filename: str
+    :param hash_type: name of the hashlib algorithm to use
+    :type hash_type: str
     :return: The checksum for the file
     :rtype: str
     """
-    m = hashlib.new(constants.DEFAULT_HASHLIB)
+    return calculate_checksums(filename, [hash_type])[hash_type]
+
+
+def calculate_checksums(filename, hash_types):
+    """
+    Calculate several checksums for a given file while only reading it once
+
+    :param filename: the filename including path of the file to calculate checksums for
+    :type filename: str
+    :param hash_types: names of the hashlib algorithms to use
+    :type hash_types: list
+    :return: The checksum for the file keyed by hashlib algorithm name
+    :rtype: dict
+    """
+    hashes = dict((hash_type, hashlib.new(hash_type)) for hash_type in hash_types)
     with open(filename, 'r') as f:
         while 1:
             file_buffer = f.read(CHECKSUM_READ_BUFFER_SIZE)
             if not file_buffer:
                 break
-            m.update(file_buffer)
-    return m.hexdigest()
+            for m in hashes.itervalues():
+                m.update(file_buffer)
+    return dict((hash_type, m.hexdigest()) for hash_type, m in hashes.iteritems())
 
 
 def _extract_json(module, filename, temp_dir):
@@ -51,11 +51,13 @@ def handle_uploaded_unit(repo, type_id, unit_key, metadata, file_path, conduit):
 
     # Extract the metadata from the module
     extracted_data = metadata_parser.extract_metadata(file_path, repo.working_dir, initial_module)
-    checksum = metadata_parser.calculate_checksum(file_path)
+    checksums = metadata_parser.calculate_checksums(
+        file_path, [constants.DEFAULT_HASHLIB, constants.FILE_MD5_HASHLIB])
 
     # Create a module from the metadata
     module = Module.from_json(extracted_data)
-    module.checksum = checksum
+    module.checksum = checksums[constants.DEFAULT_HASHLIB]
+    module.file_md5 = checksums[constants.FILE_MD5_HASHLIB]
 
     # Create the Pulp unit
     type_id = constants.TYPE_PUPPET_MODULE
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Migration script for existing puppet module units to include the file MD5
+#
+# Copyright © 2015 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+import itertools
+import logging
+from multiprocessing.pool import ThreadPool
+
+from pulp.server.managers.content.query import ContentQueryManager
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.importers import metadata
+
+_log = logging.getLogger('pulp')
+
+# Number of module files hashed concurrently. Hashing releases the GIL, so
+# threads keep several disks or network filesystem requests busy at once.
+HASHING_THREADS = 4
+
+# Number of units read from the database and handed to the pool at a time, so
+# a large collection is never queued up in memory ahead of the hashing.
+HASHING_BATCH_SIZE = 100
+
+
+def migrate(*args, **kwargs):
+    """
+    for each puppet module that does not yet have one, calculate the MD5 of
+    the source file on the filesystem so publishing no longer has to
+    """
+    query_manager = ContentQueryManager()
+    collection = query_manager.get_content_unit_collection(type_id=constants.TYPE_PUPPET_MODULE)
+    # hashing a large collection can outlast the server's idle cursor timeout
+    cursor = collection.find({'file_md5': {'$exists': False}}, fields=['_storage_path'],
+                             timeout=False)
+    units = ((unit['_id'], unit['_storage_path']) for unit in cursor)
+
+    pool = ThreadPool(HASHING_THREADS)
+    try:
+        while True:
+            batch = list(itertools.islice(units, HASHING_BATCH_SIZE))
+            if not batch:
+                break
+            for unit_id, file_md5 in pool.imap_unordered(_calculate_file_md5, batch):
+                if file_md5 is not None:
+                    collection.update({'_id': unit_id}, {'$set': {'file_md5': file_md5}},
+                                      safe=True)
+    finally:
+        pool.close()
+        pool.join()
+        cursor.close()
+    _log.info("Migrated puppet modules to include file MD5")
+
+
+def _calculate_file_md5(unit):
+    """
+    :param unit: ID of a puppet module unit and the storage path of its file
+    :type  unit: tuple
+    :return: ID of the unit and the MD5 of its file; the MD5 is None if the
+             file could not be read, leaving it to be calculated at publish
+    :rtype:  tuple
+    """
+    unit_id, storage_path = unit
+    try:
+        file_md5 = metadata.calculate_checksum(storage_path, constants.FILE_MD5_HASHLIB)
+    except IOError:
+        _log.warning("Unable to calculate MD5 of puppet module file %s" % storage_path)
+        file_md5 = None
+    return unit_id, file_md5
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Measures the size of forge API responses and the CPU time spent encoding them
+without compression and with each supported content coding at several
+compression levels. Responses are generated in the form of releases.json for
+dependency trees of increasing size, and encoded as the forge API does for a
+response that is not in the body cache.
+
+Usage: bench_compression.py [versions per module] [request count]
+"""
+
+import sys
+import time
+
+from pulp_puppet.forge import encoding
+
+
+DEFAULT_VERSION_COUNT = 10
+DEFAULT_REQUEST_COUNT = 20
+
+# numbers of modules in the generated responses
+MODULE_COUNTS = (1, 10, 100, 1000)
+
+LEVELS = (1, 6, 9)
+
+
+def build_response(module_count, version_count):
+    """
+    :return: response of the releases.json view for a module depending on
+             module_count - 1 others, each with version_count releases
+    :rtype:  dict
+    """
+    response = {}
+    for i in range(module_count):
+        name = 'author%d/module%d' % (i % 20, i)
+        dependencies = [['author%d/module%d' % (d % 20, d), '>= 1.0.0']
+                        for d in range(i + 1, min(i + 4, module_count))]
+        response[name] = [{'file': '/pulp/puppet/bench/system/releases/%s/%s-1.0.%d.tar.gz' %
+                                   (name[0], name.replace('/', '-'), v),
+                           'version': '1.0.%d' % v,
+                           'dependencies': dependencies,
+                           'file_md5': '%032x' % (i * version_count + v)}
+                          for v in range(version_count)]
+    return response
+
+
+def measure(response, compression, request_count):
+    """
+    :return: size in bytes of the encoded response, and CPU seconds spent
+             encoding it per request
+    :rtype:  tuple
+    """
+    # processor time, which excludes time spent waiting for other processes
+    start = time.clock()
+    for i in range(request_count):
+        size = 0
+        for chunk in encoding.compressed_chunks(encoding.json_chunks(response), compression):
+            size += len(chunk)
+    return size, (time.clock() - start) / request_count
+
+
+def main(version_count=DEFAULT_VERSION_COUNT, request_count=DEFAULT_REQUEST_COUNT):
+    compressions = [None] + [(coding, level) for coding in encoding.CONTENT_CODINGS
+                             for level in LEVELS]
+
+    print('%d requests per response, %d versions per module' % (request_count, version_count))
+    print('%8s  %-10s %12s %8s %12s' % ('modules', 'coding', 'bytes', 'ratio', 'ms/request'))
+    for module_count in MODULE_COUNTS:
+        response = build_response(module_count, version_count)
+        identity_size = None
+        for compression in compressions:
+            size, seconds = measure(response, compression, request_count)
+            if compression is None:
+                identity_size = size
+                label = 'identity'
+            else:
+                label = '%s-%d' % compression
+            print('%8d  %-10s %12d %7.1f%% %12.3f' %
+                  (module_count, label, size, 100.0 * size / identity_size, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
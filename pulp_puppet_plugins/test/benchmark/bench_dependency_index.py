@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Compares the cost of answering forge API lookups from the gdbm dependency
+database and from the memory-mapped dependency index. As in the forge API,
+the data is opened, a module's release list is read and parsed, and the data
+is closed again for every request.
+
+Usage: bench_dependency_index.py [module count] [versions per module] [request count]
+"""
+
+import gdbm
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from pulp_puppet.common import constants, dependency_index
+from pulp_puppet.common.dependency_index import DependencyIndex
+
+
+DEFAULT_MODULE_COUNT = 5000
+DEFAULT_VERSION_COUNT = 10
+DEFAULT_REQUEST_COUNT = 20000
+
+
+def build_db(path, module_count, version_count):
+    """
+    :return: names of the modules in the generated database
+    :rtype:  list of str
+    """
+    names = []
+    db = gdbm.open(path, 'n')
+    try:
+        for i in range(module_count):
+            name = 'author%d/module%d' % (i % 100, i)
+            releases = [{'file': '/pulp/puppet/bench/%s-1.0.%d.tar.gz' % (name, v),
+                         'version': '1.0.%d' % v,
+                         'dependencies': [{'name': 'author0/module0',
+                                           'version_requirement': '>= 1.0.0'}],
+                         'file_md5': '0' * 32}
+                        for v in range(version_count)]
+            db[name] = json.dumps(releases)
+            names.append(name)
+        db[constants.REPO_DEPDATA_FORMAT_KEY] = constants.REPO_DEPDATA_FORMAT_VERSION
+    finally:
+        db.close()
+    return names
+
+
+def time_requests(open_data, names):
+    """
+    :return: seconds taken to answer a lookup for each of the given names
+    :rtype:  float
+    """
+    start = time.time()
+    for name in names:
+        data = open_data()
+        try:
+            json.loads(data[name])
+        finally:
+            data.close()
+    return time.time() - start
+
+
+def main(module_count=DEFAULT_MODULE_COUNT, version_count=DEFAULT_VERSION_COUNT,
+         request_count=DEFAULT_REQUEST_COUNT):
+    working_dir = tempfile.mkdtemp(prefix='pulp-puppet-bench')
+    try:
+        db_path = os.path.join(working_dir, constants.REPO_DEPDATA_FILENAME)
+        index_path = os.path.join(working_dir, constants.REPO_DEPINDEX_FILENAME)
+
+        names = build_db(db_path, module_count, version_count)
+        db = gdbm.open(db_path, 'r')
+        try:
+            dependency_index.write_index(index_path, db)
+        finally:
+            db.close()
+
+        requested = [random.choice(names) for i in range(request_count)]
+
+        gdbm_time = time_requests(lambda: gdbm.open(db_path, 'r'), requested)
+        index_time = time_requests(lambda: DependencyIndex(index_path), requested)
+
+        print('%d requests against %d modules with %d versions each' %
+              (request_count, module_count, version_count))
+        print('  gdbm:  %.3fs (%.1f us/request)' % (gdbm_time, gdbm_time * 1e6 / request_count))
+        print('  index: %.3fs (%.1f us/request)' % (index_time, index_time * 1e6 / request_count))
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
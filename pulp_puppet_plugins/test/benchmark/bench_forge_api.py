@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Load test of the forge API. Synthetic repositories are published with the
+distributor's own metadata step, and a consumer is bound to all of them. The
+modules form a dependency tree of the given depth, and the modules of each
+repository depend on modules in the others.
+
+The Pulp database is replaced by an in-process fake that only knows the
+published repositories and the consumer, so only the forge API's own work is
+measured. Requests are passed straight to the WSGI applications of the three
+URL prefixes by several threads at once, with no web server in between.
+
+Each mix of requests is served by a fresh worker process, as it would be by a
+mod_wsgi daemon process, so that its caches start out empty and its memory use
+can be measured on its own. For each mix, the median, 95th and 99th percentile
+latencies, the throughput and the peak resident memory of the worker are
+reported.
+
+Usage: bench_forge_api.py [module count] [dependency depth] [versions per module]
+                          [thread count] [request count]
+"""
+
+import base64
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib
+from cStringIO import StringIO
+
+import mock
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.model import Repository, Unit
+import web
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.distributors import publish
+
+
+DEFAULT_MODULE_COUNT = 1000
+DEFAULT_DEPTH = 4
+DEFAULT_VERSION_COUNT = 5
+DEFAULT_THREAD_COUNT = 4
+DEFAULT_REQUEST_COUNT = 2000
+
+REPO_IDS = ('bench-repo1', 'bench-repo2', 'bench-repo3')
+CONSUMER_ID = 'bench-consumer'
+
+# number of modules in the next level of the tree each module depends on
+DEPENDENCY_COUNT = 2
+
+# number of modules named in each resolve.json request
+RESOLVE_MODULE_COUNT = 3
+
+# sent by the puppet module tool, through Ruby's Net::HTTP
+ACCEPT_ENCODING = 'gzip;q=1.0,deflate;q=0.6,identity;q=0.3'
+
+
+class FakeRepoDistributorManager(object):
+    """
+    Stands in for the distributor manager, which reads from the Pulp database
+    """
+    distributors = []
+
+    @classmethod
+    def find_by_repo_list(cls, repo_ids):
+        return [dict(d) for d in cls.distributors if d['repo_id'] in repo_ids]
+
+
+class FakeBindManager(object):
+    """
+    Stands in for the bind manager, which reads from the Pulp database
+    """
+    bindings = {}
+
+    def find_by_consumer(self, consumer_id):
+        return list(self.bindings.get(consumer_id, []))
+
+
+def build_modules(module_count, depth, version_count):
+    """
+    The modules are split into levels, and each module depends on modules in
+    the next level. They are spread across the repositories in turn.
+
+    :return: units of the modules in each repository, keyed by repository ID,
+             and the names of all modules
+    :rtype:  tuple
+    """
+    levels = [[] for i in range(depth)]
+    for i in range(module_count):
+        levels[i * depth // module_count].append(i)
+
+    units = dict((repo_id, []) for repo_id in REPO_IDS)
+    names = []
+    for level, members in enumerate(levels):
+        next_level = levels[level + 1] if level + 1 < depth else []
+        for i in members:
+            author, name = 'author%d' % (i % 50), 'module%d' % i
+            deps = []
+            if next_level:
+                deps = [{'name': 'author%d/module%d' % (d % 50, d),
+                         'version_requirement': '>= 1.0.0'}
+                        for d in sorted(set(next_level[(i * 7 + k) % len(next_level)]
+                                            for k in range(DEPENDENCY_COUNT)))]
+            for v in range(version_count):
+                key = {'author': author, 'name': name, 'version': '1.%d.0' % v}
+                metadata = {'dependencies': deps, 'file_md5': '%032x' % i,
+                            'summary': 'Level %d module %d' % (level, i),
+                            'tag_list': ['bench', 'level%d' % level]}
+                units[REPO_IDS[i % len(REPO_IDS)]].append(
+                    Unit(constants.TYPE_PUPPET_MODULE, key, metadata,
+                         '/does/not/exist/%s-%s-%s.tar.gz' % (author, name, key['version'])))
+            names.append('%s/%s' % (author, name))
+    return units, names
+
+
+def publish_repos(working_dir, units):
+    """
+    Generates the dependency data of each repository with the distributor,
+    which does not look at the module files, and serves each build directory
+    as if it had been published.
+
+    :return: directory from which the repositories are served
+    :rtype:  str
+    """
+    http_dir = os.path.join(working_dir, 'http')
+    os.mkdir(http_dir)
+    for repo_id, repo_units in units.iteritems():
+        conduit = mock.MagicMock()
+        conduit.get_units.side_effect = lambda criteria, repo_units=repo_units: \
+            repo_units[criteria.skip:criteria.skip + criteria.limit]
+        repo = Repository(repo_id, working_dir=os.path.join(working_dir, repo_id))
+        run = publish.PuppetModulePublishRun(repo, conduit, PluginCallConfiguration({}, {}),
+                                             mock.MagicMock())
+        run._init_build_dir()
+        run._generate_metadata()
+        os.symlink(run._build_dir(), os.path.join(http_dir, repo_id))
+    return http_dir
+
+
+def load_api(http_dir):
+    """
+    Imports the forge API as served by mod_wsgi, with the fake managers in
+    place of the Pulp database.
+
+    :return: WSGI applications keyed by the name of their URL prefix
+    :rtype:  dict
+    """
+    # as under mod_wsgi; otherwise web.py reloads changed modules on every request
+    web.config.debug = False
+    with mock.patch('pulp.server.db.connection.initialize'):
+        from pulp_puppet.forge import api, releases
+
+    FakeRepoDistributorManager.distributors = [
+        {'repo_id': repo_id, 'config': {constants.CONFIG_HTTP_DIR: http_dir,
+                                        constants.CONFIG_SERVE_HTTP: True,
+                                        constants.CONFIG_SERVE_HTTPS: False}}
+        for repo_id in REPO_IDS]
+    FakeBindManager.bindings = {
+        CONSUMER_ID: [{'repo_id': repo_id, 'distributor_id': constants.DISTRIBUTOR_TYPE_ID}
+                      for repo_id in REPO_IDS]}
+    mock.patch.object(releases, 'RepoDistributorManager', FakeRepoDistributorManager).start()
+    mock.patch.object(releases, 'BindManager', FakeBindManager).start()
+
+    return {'pre33': api.pre_33_app.wsgifunc(),
+            'post33': api.post_33_app.wsgifunc(),
+            'post36': api.post_36_app.wsgifunc()}
+
+
+def request_kinds(names, depth):
+    """
+    :return: functions that each produce a random request of one kind, as a
+             tuple of the application, the path, the query string and the
+             basic auth credentials, keyed by the name of the kind
+    :rtype:  dict
+    """
+    consumer_v1 = '/consumer/%s/api/v1' % CONSUMER_ID
+    repos = dict((name, REPO_IDS[i % len(REPO_IDS)]) for i, name in enumerate(names))
+    consumer_auth = (CONSUMER_ID, '.')
+
+    def releases_repo(rng):
+        name = rng.choice(names)
+        return 'pre33', '/releases.json', urllib.urlencode({'module': name}), ('.', repos[name])
+
+    def releases_consumer(rng):
+        return ('post33', consumer_v1 + '/releases.json',
+                urllib.urlencode({'module': rng.choice(names)}), None)
+
+    def resolve(rng):
+        modules = rng.sample(names, min(RESOLVE_MODULE_COUNT, len(names)))
+        return ('post33', consumer_v1 + '/resolve.json',
+                urllib.urlencode([('module', name) for name in modules]), None)
+
+    def v3_releases(rng):
+        return ('post36', '/releases', urllib.urlencode({'module': rng.choice(names)}),
+                consumer_auth)
+
+    def v3_search(rng):
+        name = rng.choice(names)
+        query = rng.choice(['bench', name.split('/')[1], 'level%d' % rng.randrange(depth)])
+        return 'post36', '/modules', urllib.urlencode({'query': query}), consumer_auth
+
+    return {'releases.json repo': releases_repo,
+            'releases.json consumer': releases_consumer,
+            'resolve.json': resolve,
+            'v3 releases': v3_releases,
+            'v3 search': v3_search}
+
+
+def build_mixes(names, depth, request_count):
+    """
+    :return: lists of requests, keyed by name of the mix. Each kind of request
+             is a mix on its own, and they are all combined in the "mixed" mix.
+    :rtype:  dict
+    """
+    rng = random.Random(0)
+    kinds = request_kinds(names, depth)
+    mixes = {}
+    for name, kind in kinds.iteritems():
+        mixes[name] = [kind(rng) for i in range(request_count)]
+    all_kinds = [kinds[name] for name in sorted(kinds)]
+    mixes['mixed'] = [rng.choice(all_kinds)(rng) for i in range(request_count)]
+    return mixes
+
+
+def call(app, path, query, credentials):
+    """
+    :return: seconds taken to serve the request and read the whole response,
+             and the response status
+    :rtype:  tuple
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_ACCEPT_ENCODING': ACCEPT_ENCODING,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(''),
+        'wsgi.errors': sys.stderr,
+    }
+    if credentials is not None:
+        environ['HTTP_AUTHORIZATION'] = 'Basic %s' % base64.b64encode('%s:%s' % credentials)
+    status = []
+
+    def start_response(response_status, headers, exc_info=None):
+        status.append(response_status)
+
+    start = time.time()
+    body = app(environ, start_response)
+    for chunk in body:
+        pass
+    if hasattr(body, 'close'):
+        body.close()
+    return time.time() - start, status[0]
+
+
+def serve(apps, requests, thread_count):
+    """
+    Serves the requests with the given number of threads, each taking the
+    next request as soon as it is done with the last.
+
+    :return: latency of each request in seconds, number of requests that did
+             not succeed, seconds taken to serve all requests, and peak
+             resident memory of the process in kilobytes before and after
+    :rtype:  tuple
+    """
+    pending = list(reversed(requests))
+    latencies = []
+    errors = []
+
+    def worker():
+        while True:
+            try:
+                app, path, query, credentials = pending.pop()
+            except IndexError:
+                return
+            seconds, status = call(apps[app], path, query, credentials)
+            latencies.append(seconds)
+            if not status.startswith('200'):
+                errors.append(status)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    threads = [threading.Thread(target=worker) for i in range(thread_count)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return latencies, len(errors), elapsed, rss_before, rss_after
+
+
+def run_in_worker(function, *args):
+    """
+    Runs a function in a forked worker process.
+
+    :return: what the function returned, which must be JSON serializable
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            output = os.fdopen(write_fd, 'w')
+            output.write(json.dumps(function(*args)))
+            output.close()
+            status = 0
+        except Exception:
+            traceback.print_exc()
+        os._exit(status)
+
+    os.close(write_fd)
+    result_file = os.fdopen(read_fd)
+    try:
+        result = result_file.read()
+    finally:
+        result_file.close()
+    os.waitpid(pid, 0)
+    if not result:
+        raise RuntimeError('worker process failed')
+    return json.loads(result)
+
+
+def percentile(sorted_values, percent):
+    """
+    :return: nearest-rank percentile of the sorted values
+    :rtype:  float
+    """
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def main(module_count=DEFAULT_MODULE_COUNT, depth=DEFAULT_DEPTH,
+         version_count=DEFAULT_VERSION_COUNT, thread_count=DEFAULT_THREAD_COUNT,
+         request_count=DEFAULT_REQUEST_COUNT):
+    working_dir = tempfile.mkdtemp(prefix='pulp-puppet-bench')
+    try:
+        units, names = build_modules(module_count, depth, version_count)
+        start = time.time()
+        http_dir = publish_repos(working_dir, units)
+        publish_time = time.time() - start
+
+        apps = load_api(http_dir)
+        mixes = build_mixes(names, depth, request_count)
+
+        print('%d modules with %d versions each in %d repos, %d levels of dependencies '
+              '(published in %.2fs)' % (module_count, version_count, len(REPO_IDS), depth,
+                                        publish_time))
+        print('%d requests per mix with %d threads' % (request_count, thread_count))
+        print('%-24s %9s %9s %9s %9s %7s %9s %9s' % ('mix', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                     'req/s', 'errors', 'peak MB', 'growth MB'))
+        for mix in sorted(mixes):
+            latencies, errors, elapsed, rss_before, rss_after = run_in_worker(
+                serve, apps, mixes[mix], thread_count)
+            latencies.sort()
+            print('%-24s %9.2f %9.2f %9.2f %9.1f %7d %9.1f %9.1f' %
+                  (mix, percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                   percentile(latencies, 99) * 1000, len(latencies) / elapsed, errors,
+                   rss_after / 1024.0, (rss_after - rss_before) / 1024.0))
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Times the creation of the module symlink farm in a distributor build
+directory for a large repository.
+
+Usage: bench_symlink_modules.py [unit count] [author count] [thread count]
+
+The build directory is created under $TMPDIR; point that at a network
+filesystem to measure the effect of the symlink thread pool.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.model import Repository, Unit
+
+from pulp_puppet.common import constants
+from pulp_puppet.plugins.distributors import publish
+
+
+DEFAULT_UNIT_COUNT = 50000
+DEFAULT_AUTHOR_COUNT = 1000
+
+
+def build_units(storage_dir, unit_count, author_count):
+    """
+    The storage paths of the units do not need to exist; the symlinks are
+    created without looking at their targets.
+
+    :return: list of units spread evenly across the given number of authors
+    :rtype:  list of pulp.plugins.model.Unit
+    """
+    units = []
+    for i in range(unit_count):
+        key = {'author': 'author%d' % (i % author_count),
+               'name': 'module%d' % i,
+               'version': '1.0.0'}
+        storage_path = os.path.join(storage_dir, '%(author)s-%(name)s-%(version)s.tar.gz' % key)
+        units.append(Unit(constants.TYPE_PUPPET_MODULE, key, {}, storage_path))
+    return units
+
+
+def main(unit_count=DEFAULT_UNIT_COUNT, author_count=DEFAULT_AUTHOR_COUNT, thread_count=1):
+    working_dir = tempfile.mkdtemp(prefix='pulp-puppet-bench')
+    try:
+        repo = Repository('bench-repo', working_dir=working_dir)
+        config = PluginCallConfiguration(
+            {constants.CONFIG_SYMLINK_THREADS: thread_count}, {})
+        run = publish.PuppetModulePublishRun(repo, mock.MagicMock(), config,
+                                             mock.MagicMock())
+        # Only the symlink counters matter here; don't report to the conduit
+        run.progress_report.update_progress = mock.MagicMock()
+
+        units = build_units(working_dir, unit_count, author_count)
+        run._init_build_dir()
+
+        start = time.time()
+        run._symlink_modules(units)
+        elapsed = time.time() - start
+
+        pr = run.progress_report
+        print('%d symlinks in %d author directories with %d thread(s): %.2fs '
+              '(%d errors, %d progress updates)' %
+              (pr.modules_finished_count, author_count, thread_count, elapsed,
+               pr.modules_error_count, pr.update_progress.call_count))
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -14,12 +14,13 @@
 import json
 import unittest
 import urlparse
+import zlib
 
 import mock
 from pulp.server.db.connection import initialize
 import web
 
-from pulp_puppet.forge import api
+from pulp_puppet.forge import api, encoding
 
 initialize(name='pulp_unittest')
 
@@ -130,10 +131,222 @@ class TestAppPost33(unittest.TestCase):
         self.assertEqual(result.status, '404 Not Found')
 
 
+class TestAppResolve(unittest.TestCase):
+    app = api.post_33_app
+    FAKE_VIEW_DATA = {
+        'foo/bar': [{'version': '1.0.0', 'file': '/tmp/foo', 'dependencies': []}]
+    }
+    PATH = '/repository/repo1/api/v1/resolve.json'
+
+    @mock.patch('pulp_puppet.forge.releases.resolve', autospec=True)
+    def test_get(self, mock_resolve):
+        mock_resolve.return_value = self.FAKE_VIEW_DATA
+
+        result = self.app.request(self.PATH + '?module=foo/bar&module=foo-baz')
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(result.headers['Content-Type'], 'application/json')
+        self.assertEqual(result.data, json.dumps(self.FAKE_VIEW_DATA))
+        mock_resolve.assert_called_once_with(
+            '.', 'repo1', modules=[('foo/bar', None, None), ('foo/baz', None, None)])
+
+    @mock.patch('pulp_puppet.forge.releases.resolve', autospec=True)
+    def test_post(self, mock_resolve):
+        mock_resolve.return_value = self.FAKE_VIEW_DATA
+        body = json.dumps(['foo/bar',
+                           {'name': 'foo/baz', 'version': '1.0.0'},
+                           {'name': 'foo/qux', 'version_requirement': '>= 1.0.0 < 2.0.0'}])
+
+        result = self.app.request(self.PATH + '?pruned=true', method='POST', data=body)
+
+        self.assertEqual(result.status, '200 OK')
+        mock_resolve.assert_called_once_with(
+            '.', 'repo1', modules=[('foo/bar', None, None), ('foo/baz', '1.0.0', None),
+                                   ('foo/qux', None, '>= 1.0.0 < 2.0.0')],
+            pruned=True)
+
+    @mock.patch('pulp_puppet.forge.releases.resolve', autospec=True)
+    def test_invalid(self, mock_resolve):
+        for body in ('not json', '{}', '[]', '[1]', '[{"version": "1.0.0"}]',
+                     '["foo"]', '[{"name": "foo/bar", "version": 1}]',
+                     '[{"name": "foo/bar", "version_requirement": "not a requirement"}]'):
+            result = self.app.request(self.PATH, method='POST', data=body)
+            self.assertEqual(result.status, '400 Bad Request')
+
+        self.assertEqual(mock_resolve.call_count, 0)
+
+    def test_no_credentials(self):
+        result = api.pre_33_app.request('/resolve.json?module=foo/bar')
+        self.assertEqual(result.status, '401 Unauthorized')
+
+    def test_invalid_resource_type(self):
+        result = self.app.request('/notatype/foo/api/v1/resolve.json?module=foo/bar')
+        self.assertEqual(result.status, '404 Not Found')
+
+
+@mock.patch('pulp_puppet.forge.releases.get_etag', autospec=True, return_value='"abc"')
+@mock.patch('pulp_puppet.forge.releases.view', autospec=True, return_value={})
+class TestConditionalGET(unittest.TestCase):
+    app = api.post_33_app
+    PATH = '/repository/repo1/api/v1/releases.json?module=foo/bar'
+
+    def test_etag(self, mock_view, mock_etag):
+        result = self.app.request(self.PATH)
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(result.headers['ETag'], '"abc"')
+        self.assertTrue('Cache-Control' not in result.headers)
+        mock_etag.assert_called_once_with('.', 'repo1', mock.ANY, self.PATH, None)
+
+    def test_cache_control(self, mock_view, mock_etag):
+        result = self.app.request(self.PATH, env={api.CACHE_CONTROL_ENV: 'max-age=60'})
+
+        self.assertEqual(result.headers['Cache-Control'], 'max-age=60')
+
+    def test_not_modified(self, mock_view, mock_etag):
+        for if_none_match in ('"abc"', 'W/"abc"', '"def", "abc"'):
+            result = self.app.request(self.PATH, headers={'If-None-Match': if_none_match})
+
+            self.assertEqual(result.status, '304 Not Modified')
+            self.assertEqual(result.headers['ETag'], '"abc"')
+            self.assertEqual(result.data, '')
+
+        self.assertEqual(mock_view.call_count, 0)
+
+    def test_modified(self, mock_view, mock_etag):
+        result = self.app.request(self.PATH, headers={'If-None-Match': '"def"'})
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(mock_view.call_count, 1)
+
+    def test_wildcard_not_matched(self, mock_view, mock_etag):
+        result = self.app.request(self.PATH, headers={'If-None-Match': '*'})
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(mock_view.call_count, 1)
+
+    def test_not_found_no_caching_headers(self, mock_view, mock_etag):
+        def not_found(*args, **kwargs):
+            raise web.notfound()
+        mock_view.side_effect = not_found
+
+        result = self.app.request(self.PATH, headers={'If-None-Match': '*'},
+                                  env={api.CACHE_CONTROL_ENV: 'max-age=60'})
+
+        self.assertEqual(result.status, '404 Not Found')
+        self.assertTrue('ETag' not in result.headers)
+        self.assertTrue('Cache-Control' not in result.headers)
+
+    def test_unknown_etag(self, mock_view, mock_etag):
+        mock_etag.return_value = None
+
+        result = self.app.request(self.PATH, headers={'If-None-Match': '*'})
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertTrue('ETag' not in result.headers)
+
+    @mock.patch('pulp_puppet.forge.releases.resolve', autospec=True)
+    def test_resolve(self, mock_resolve, mock_view, mock_etag):
+        path = '/repository/repo1/api/v1/resolve.json'
+
+        result = self.app.request(path + '?module=foo/bar', headers={'If-None-Match': '"abc"'})
+        self.assertEqual(result.status, '304 Not Modified')
+
+        # POST requests are not conditional
+        mock_resolve.return_value = {}
+        result = self.app.request(path, method='POST', data='["foo/bar"]',
+                                  headers={'If-None-Match': '"abc"'})
+        self.assertEqual(result.status, '200 OK')
+
+
+@mock.patch('pulp_puppet.forge.releases.get_etag', autospec=True, return_value=None)
+@mock.patch('pulp_puppet.forge.releases.view', autospec=True)
+class TestCompression(unittest.TestCase):
+    app = api.post_33_app
+    PATH = '/repository/repo1/api/v1/releases.json?module=foo/bar'
+    FAKE_VIEW_DATA = {
+        'foo/bar': [{'version': '1.0.0', 'file': '/tmp/foo', 'dependencies': []}]
+    }
+
+    def setUp(self):
+        encoding._body_cache.clear()
+
+    def tearDown(self):
+        encoding._body_cache.clear()
+
+    def test_gzip(self, mock_view, mock_etag):
+        mock_view.return_value = self.FAKE_VIEW_DATA
+
+        result = self.app.request(self.PATH, headers={'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(result.status, '200 OK')
+        self.assertEqual(result.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(result.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(zlib.decompress(result.data, 16 + zlib.MAX_WBITS),
+                         json.dumps(self.FAKE_VIEW_DATA))
+        mock_etag.assert_called_once_with('.', 'repo1', mock.ANY, self.PATH,
+                                          ('gzip', encoding.DEFAULT_COMPRESSION_LEVEL))
+
+    def test_deflate(self, mock_view, mock_etag):
+        mock_view.return_value = self.FAKE_VIEW_DATA
+
+        result = self.app.request(self.PATH, headers={'Accept-Encoding': 'deflate'},
+                                  env={api.COMPRESSION_LEVEL_ENV: '9'})
+
+        self.assertEqual(result.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(result.data), json.dumps(self.FAKE_VIEW_DATA))
+
+    def test_not_accepted(self, mock_view, mock_etag):
+        mock_view.return_value = self.FAKE_VIEW_DATA
+
+        result = self.app.request(self.PATH)
+
+        self.assertTrue('Content-Encoding' not in result.headers)
+        self.assertEqual(result.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(result.data, json.dumps(self.FAKE_VIEW_DATA))
+
+    def test_disabled(self, mock_view, mock_etag):
+        mock_view.return_value = self.FAKE_VIEW_DATA
+
+        result = self.app.request(self.PATH, headers={'Accept-Encoding': 'gzip'},
+                                  env={api.COMPRESSION_LEVEL_ENV: '0'})
+
+        self.assertTrue('Content-Encoding' not in result.headers)
+        self.assertTrue('Vary' not in result.headers)
+        self.assertEqual(result.data, json.dumps(self.FAKE_VIEW_DATA))
+
+    def test_cached(self, mock_view, mock_etag):
+        mock_view.return_value = self.FAKE_VIEW_DATA
+
+        gzipped = self.app.request(self.PATH, headers={'Accept-Encoding': 'gzip'}).data
+        with mock.patch.object(zlib, 'compressobj') as mock_compressobj:
+            self.assertEqual(self.app.request(self.PATH, headers={'Accept-Encoding': 'gzip'}).data,
+                             gzipped)
+        self.assertEqual(mock_compressobj.call_count, 0)
+
+        # each content coding is cached separately
+        self.assertEqual(self.app.request(self.PATH).data, json.dumps(self.FAKE_VIEW_DATA))
+
+    @mock.patch('pulp_puppet.forge.releases.view_page', autospec=True)
+    def test_post36(self, mock_view_page, mock_view, mock_etag):
+        mock_view_page.return_value = ([], 0)
+
+        result = api.post_36_app.request('/releases?module=foo/bar',
+                                         headers={'Accept-Encoding': 'gzip',
+                                                  'Authorization': 'Basic LjpyZXBvMQ=='})
+
+        self.assertEqual(result.headers['Content-Encoding'], 'gzip')
+        data = json.loads(zlib.decompress(result.data, 16 + zlib.MAX_WBITS))
+        self.assertEqual(data['results'], [])
+
+
 # these header objects are very annoying to mock out, and we really just want
 # them to stay out of the way.
 @mock.patch.object(web, 'header', new=mock.MagicMock())
 @mock.patch.object(web.webapi, 'ctx', new=mock.MagicMock())
+@mock.patch.object(api.Releases, '_negotiate_compression', new=mock.Mock(return_value=None))
+@mock.patch.object(api.Releases, '_get_etag', new=mock.Mock(return_value=None))
+@mock.patch.object(api.Releases, '_set_caching_headers', new=mock.Mock())
 class TestGET(unittest.TestCase):
     @mock.patch('web.ctx')
     def test_no_credentials(self, mock_ctx):
@@ -165,7 +378,7 @@ class TestGET(unittest.TestCase):
 
         result = api.Releases().GET()
 
-        self.assertEqual(result, json.dumps({}))
+        self.assertEqual(''.join(result), json.dumps({}))
         mock_view.assert_called_once_with('consumer1', 'repo1', module_name='foo/bar', version=None)
 
     @mock.patch('pulp_puppet.forge.releases.view', autospec=True)
@@ -179,11 +392,26 @@ class TestGET(unittest.TestCase):
         mock_view.return_value = {}
 
         result = api.Releases().GET()
-        self.assertEqual(result, json.dumps({}))
+        self.assertEqual(''.join(result), json.dumps({}))
 
         mock_view.assert_called_once_with('consumer1', 'repo1', module_name='foo/bar',
                                           version='1.0.0')
 
+    @mock.patch('pulp_puppet.forge.releases.view', autospec=True)
+    @mock.patch.object(web, 'input')
+    @mock.patch.object(api.Releases, '_get_credentials')
+    @mock.patch.object(api.Releases, '_get_module_name')
+    def test_pruned(self, mock_get_name, mock_get_cred, mock_input, mock_view):
+        mock_get_cred.return_value = ('consumer1', 'repo1')
+        mock_get_name.return_value = 'foo/bar'
+        mock_input.return_value = {'pruned': 'true'}
+        mock_view.return_value = {}
+
+        api.Releases().GET()
+
+        mock_view.assert_called_once_with('consumer1', 'repo1', module_name='foo/bar',
+                                          version=None, pruned=True)
+
 
 class TestGetCredentials(unittest.TestCase):
     @mock.patch('web.ctx')
@@ -223,12 +451,39 @@ class TestGetModuleName(unittest.TestCase):
 
 class TestPost36(unittest.TestCase):
 
-    @mock.patch('pulp_puppet.forge.api.releases.view')
-    def test_get_releases(self, mock_view):
+    @mock.patch('web.input', autospec=True, return_value={'module': 'foo/bar'})
+    @mock.patch('pulp_puppet.forge.api.releases.view_page')
+    def test_get_releases(self, mock_view_page, mock_input):
+        release = api.ReleasesPost36()
+        release.get_releases()
+        mock_view_page.assert_called_once_with(offset=0, limit=20, reverse=False)
+
+    @mock.patch('web.input', autospec=True, return_value={'module': 'foo/bar',
+                                                          'limit': '5',
+                                                          'offset': '10'})
+    @mock.patch('pulp_puppet.forge.api.releases.view_page')
+    def test_get_releases_page(self, mock_view_page, mock_input):
+        release = api.ReleasesPost36()
+        release.get_releases('consumer1', '.', module_name='foo/bar', version=None)
+        mock_view_page.assert_called_once_with('consumer1', '.', module_name='foo/bar',
+                                               version=None, offset=10, limit=5,
+                                               reverse=False)
+
+    @mock.patch('web.input', autospec=True, return_value={'module': 'foo/bar',
+                                                          'order': 'desc'})
+    @mock.patch('pulp_puppet.forge.api.releases.view_page')
+    def test_get_releases_descending(self, mock_view_page, mock_input):
         release = api.ReleasesPost36()
         release.get_releases()
-        mock_view.assert_called_once_with(recurse_deps=False,
-                                          view_all_matching=True)
+        mock_view_page.assert_called_once_with(offset=0, limit=20, reverse=True)
+
+    @mock.patch('pulp_puppet.forge.releases.view_page', autospec=True)
+    def test_invalid_page(self, mock_view_page):
+        for query in ('limit=a', 'limit=0', 'limit=-1', 'offset=-1', 'order=size'):
+            result = api.post_36_app.request('/releases?module=foo/bar&' + query,
+                                             headers={'Authorization': 'Basic LjpyZXBvMQ=='})
+            self.assertEqual(result.status, '400 Bad Request')
+        self.assertEqual(mock_view_page.call_count, 0)
 
     def test_format_query_string_no_version(self):
         result = api.ReleasesPost36._format_query_string(
@@ -258,14 +513,31 @@ class TestPost36(unittest.TestCase):
         query = urlparse.parse_qs(data.query)
         self.assertEquals(['3.5'], query['version'])
 
+    def test_format_query_string_order(self):
+        result = api.ReleasesPost36._format_query_string(
+            base_url='https://foo.com/api/v3/',
+            module_name='modulename', module_version=None,
+            offset=5, limit=2, order='desc'
+        )
+        query = urlparse.parse_qs(urlparse.urlparse(result).query)
+        self.assertEquals(['desc'], query['order'])
+
+        result = api.ReleasesPost36._format_query_string(
+            base_url='https://foo.com/api/v3/',
+            module_name='modulename', module_version=None,
+            offset=5, limit=2, order='asc'
+        )
+        query = urlparse.parse_qs(urlparse.urlparse(result).query)
+        self.assertTrue('order' not in query)
+
     @mock.patch('web.ctx')
     @mock.patch('web.header')
     @mock.patch('web.input', autospec=True, return_value={'module': 'foo/bar'})
     def test_format_results_pagination_defaults(self, mock_input, mock_hdr, mock_ctx):
         release = api.ReleasesPost36()
         mock_ctx.path = 'releases/'
-        result_str = release.format_results({'foo/bar': []})
-        result = json.loads(result_str)
+        result_str = release.format_results(([], 0))
+        result = json.loads(''.join(result_str))
 
         self.assertEquals(20, result['pagination']['limit'])
         self.assertEquals(0, result['pagination']['offset'])
@@ -285,12 +557,10 @@ class TestPost36(unittest.TestCase):
     def test_format_results_pagination_middle_page(self, mock_input, mock_hdr, mock_ctx):
         release = api.ReleasesPost36()
         mock_ctx.path = 'releases/'
-        result_str = release.format_results({'foo/bar': [
-            {'dependencies': [], 'version': '1.0', 'file': 'foo', 'file_md5': 'bar'},
+        result_str = release.format_results(([
             {'dependencies': [], 'version': '2.0', 'file': 'foo', 'file_md5': 'bar'},
-            {'dependencies': [], 'version': '3.0', 'file': 'foo', 'file_md5': 'bar'},
-        ]})
-        result = json.loads(result_str)
+        ], 3))
+        result = json.loads(''.join(result_str))
 
         self.assertEquals(1, result['pagination']['limit'])
         self.assertEquals(1, result['pagination']['offset'])
@@ -314,12 +584,10 @@ class TestPost36(unittest.TestCase):
     def test_format_results_pagination_last_page(self, mock_input, mock_hdr, mock_ctx):
         release = api.ReleasesPost36()
         mock_ctx.path = 'releases/'
-        result_str = release.format_results({'foo/bar': [
-            {'dependencies': [], 'version': '1.0', 'file': 'foo', 'file_md5': 'bar'},
-            {'dependencies': [], 'version': '2.0', 'file': 'foo', 'file_md5': 'bar'},
+        result_str = release.format_results(([
             {'dependencies': [], 'version': '3.0', 'file': 'foo', 'file_md5': 'bar'},
-        ]})
-        result = json.loads(result_str)
+        ], 3))
+        result = json.loads(''.join(result_str))
 
         self.assertEquals(1, result['pagination']['limit'])
         self.assertEquals(2, result['pagination']['offset'])
@@ -340,11 +608,11 @@ class TestPost36(unittest.TestCase):
     def test_format_results_render_module(self, mock_input, mock_hdr, mock_ctx):
         release = api.ReleasesPost36()
         mock_ctx.path = 'releases/'
-        result_str = release.format_results({'foo/bar': [
+        result_str = release.format_results(([
             {'dependencies': [('apple', '42.5')],
              'version': '1.0', 'file': 'foo', 'file_md5': 'bar'},
-        ]})
-        result = json.loads(result_str)
+        ], 1))
+        result = json.loads(''.join(result_str))
 
         module_data = result['results'][0]
         self.assertEquals('foo/bar', module_data['metadata']['name'])
@@ -354,3 +622,59 @@ class TestPost36(unittest.TestCase):
         dependencies = module_data['metadata']['dependencies']
         self.assertEquals('apple', dependencies[0]['name'])
         self.assertEquals('42.5', dependencies[0]['version_requirement'])
+
+
+@mock.patch('pulp_puppet.forge.releases.get_etag', autospec=True, return_value=None)
+@mock.patch('pulp_puppet.forge.releases.search_modules', autospec=True)
+class TestModules(unittest.TestCase):
+    app = api.post_36_app
+    AUTH = {'Authorization': 'Basic LjpyZXBvMQ=='}
+    ENTRY = {'author': 'foo', 'name': 'bar', 'version': '1.0.0', 'version_key': [],
+             'summary': 'A module', 'description': 'Does things', 'tag_list': ['things'],
+             'project_page': 'http://example.com/bar'}
+
+    def test_search(self, mock_search, mock_etag):
+        mock_search.return_value = ([self.ENTRY], 3)
+
+        result = self.app.request('/modules?query=bar%20things&limit=1&offset=1',
+                                  headers=self.AUTH)
+
+        self.assertEqual(result.status, '200 OK')
+        mock_search.assert_called_once_with('.', 'repo1', query='bar things', offset=1,
+                                            limit=1)
+        body = json.loads(result.data)
+        self.assertEqual(body['pagination']['total'], 3)
+        self.assertEqual(body['pagination']['previous'],
+                         '/v3/modules?query=bar+things&limit=1&offset=0')
+        self.assertEqual(body['pagination']['next'],
+                         '/v3/modules?query=bar+things&limit=1&offset=2')
+        module = body['results'][0]
+        self.assertEqual(module['slug'], 'foo-bar')
+        self.assertEqual(module['owner']['username'], 'foo')
+        self.assertEqual(module['homepage_url'], 'http://example.com/bar')
+        self.assertEqual(module['current_release']['version'], '1.0.0')
+        self.assertEqual(module['current_release']['tags'], ['things'])
+        self.assertEqual(module['current_release']['metadata']['name'], 'foo-bar')
+        self.assertEqual(module['current_release']['metadata']['summary'], 'A module')
+
+    def test_no_query(self, mock_search, mock_etag):
+        mock_search.return_value = ([], 0)
+
+        result = self.app.request('/modules', headers=self.AUTH)
+
+        mock_search.assert_called_once_with('.', 'repo1', query='', offset=0, limit=20)
+        body = json.loads(result.data)
+        self.assertEqual(body['pagination']['current'], '/v3/modules?limit=20&offset=0')
+        self.assertEqual(body['pagination']['next'], None)
+        self.assertEqual(body['results'], [])
+
+    def test_invalid_page(self, mock_search, mock_etag):
+        for query in ('limit=a', 'limit=0', 'offset=-1'):
+            result = self.app.request('/modules?' + query, headers=self.AUTH)
+            self.assertEqual(result.status, '400 Bad Request')
+        self.assertEqual(mock_search.call_count, 0)
+
+    def test_no_credentials(self, mock_search, mock_etag):
+        result = self.app.request('/modules?query=bar')
+
+        self.assertEqual(result.status, '401 Unauthorized')
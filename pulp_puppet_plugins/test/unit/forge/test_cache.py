@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import mock
+
+from pulp_puppet.forge import cache
+from pulp_puppet.forge.cache import LRUCache, TTLCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(2)
+
+    def test_get(self):
+        self.cache['a'] = 1
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('b', 2), 2)
+
+    def test_counters(self):
+        self.cache['a'] = 1
+        self.cache.get('a')
+        self.cache.get('a')
+        self.cache.get('b')
+
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        # using "a" makes "b" the least recently used
+        self.cache.get('a')
+        self.cache['c'] = 3
+
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache)
+        self.assertTrue('c' in self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_replace(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache['a'] = 3
+        self.cache['c'] = 4
+
+        self.assertEqual(self.cache.get('a'), 3)
+        self.assertFalse('b' in self.cache)
+
+    def test_pop(self):
+        self.cache['a'] = 1
+
+        self.assertEqual(self.cache.pop('a'), 1)
+        self.assertEqual(self.cache.pop('a'), None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_clear(self):
+        self.cache['a'] = 1
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.cache['b'] = 2
+        self.assertEqual(self.cache.get('b'), 2)
+
+
+@mock.patch.object(cache.time, 'time')
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(2, 10)
+
+    def test_get(self, mock_time):
+        mock_time.return_value = 100
+        self.cache['a'] = 1
+
+        mock_time.return_value = 109
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_expired(self, mock_time):
+        mock_time.return_value = 100
+        self.cache['a'] = 1
+
+        mock_time.return_value = 110
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertFalse('a' in self.cache)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_evicts_least_recently_used(self, mock_time):
+        mock_time.return_value = 100
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache.get('a')
+        self.cache['c'] = 3
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertFalse('b' in self.cache)
+
+    def test_pop(self, mock_time):
+        mock_time.return_value = 100
+        self.cache['a'] = 1
+
+        self.assertEqual(self.cache.pop('a'), 1)
+        self.assertEqual(self.cache.pop('a'), None)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+import zlib
+
+import mock
+
+from pulp_puppet.forge import encoding
+
+
+DATA = {
+    'me/mymodule': [
+        {'file': '/path/to/file', 'version': '1.0.0', 'file_md5': None,
+         'dependencies': [['you/yourmodule', '>= 2.1.0']]},
+    ],
+    u'you/yourmodule': [
+        {'file': '/path/to/file2', 'version': '2.1.0', 'file_md5': 'abc',
+         'dependencies': []},
+        {'file': u'/path/to/fil\xe9', 'version': '2.2.0', 'file_md5': 'def',
+         'dependencies': []},
+    ],
+    'empty/module': [],
+}
+
+
+class TestJSONChunks(unittest.TestCase):
+
+    def test_identical(self):
+        for depth in range(4):
+            self.assertEqual(''.join(encoding.json_chunks(DATA, depth)), json.dumps(DATA))
+
+    def test_empty(self):
+        self.assertEqual(''.join(encoding.json_chunks({})), '{}')
+        self.assertEqual(''.join(encoding.json_chunks([])), '[]')
+
+    @mock.patch.object(encoding, 'CHUNK_SIZE', 50)
+    def test_chunked(self):
+        chunks = list(encoding.json_chunks(DATA))
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), json.dumps(DATA))
+
+
+class TestSharedJSONChunks(unittest.TestCase):
+
+    def setUp(self):
+        encoding._body_cache.clear()
+
+    def tearDown(self):
+        encoding._body_cache.clear()
+
+    def test_cached(self):
+        body = ''.join(encoding.shared_json_chunks(DATA))
+
+        with mock.patch.object(encoding, '_encode') as mock_encode:
+            self.assertEqual(''.join(encoding.shared_json_chunks(DATA)), body)
+        self.assertEqual(mock_encode.call_count, 0)
+
+    def test_not_cached_until_complete(self):
+        chunks = encoding.shared_json_chunks(DATA)
+        next(chunks)
+
+        self.assertEqual(len(encoding._body_cache), 0)
+
+    def test_other_object(self):
+        data = {'a': []}
+        ''.join(encoding.shared_json_chunks(data))
+        # another object that happens to get the same id is not served the
+        # chunks of the first
+        encoding._body_cache[(id(data), None)] = ({'b': []}, ['{"b": []}'])
+
+        self.assertEqual(''.join(encoding.shared_json_chunks(data)), '{"a": []}')
+
+
+class TestCompressedChunks(unittest.TestCase):
+
+    def test_gzip(self):
+        chunks = list(encoding.compressed_chunks(['abc' * 100, 'def' * 100], ('gzip', 6)))
+
+        self.assertEqual(zlib.decompress(''.join(chunks), 16 + zlib.MAX_WBITS),
+                         'abc' * 100 + 'def' * 100)
+
+    def test_deflate(self):
+        chunks = list(encoding.compressed_chunks(['abc' * 100], ('deflate', 1)))
+
+        self.assertEqual(zlib.decompress(''.join(chunks)), 'abc' * 100)
+
+    def test_not_compressed(self):
+        self.assertEqual(list(encoding.compressed_chunks(['a', 'b'], None)), ['a', 'b'])
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_preference(self):
+        self.assertEqual(encoding.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(encoding.negotiate('deflate, gzip'), 'gzip')
+        self.assertEqual(encoding.negotiate('GZIP'), 'gzip')
+        self.assertEqual(encoding.negotiate('*'), 'gzip')
+
+    def test_quality(self):
+        self.assertEqual(encoding.negotiate('gzip;q=0.5, deflate'), 'deflate')
+        self.assertEqual(encoding.negotiate('gzip;q=1.0,deflate;q=0.6,identity;q=0.3'), 'gzip')
+        self.assertEqual(encoding.negotiate('*;q=0.5, gzip;q=0'), 'deflate')
+
+    def test_not_compressed(self):
+        self.assertEqual(encoding.negotiate(None), None)
+        self.assertEqual(encoding.negotiate(''), None)
+        self.assertEqual(encoding.negotiate('identity'), None)
+        self.assertEqual(encoding.negotiate('br, compress'), None)
+        self.assertEqual(encoding.negotiate('gzip;q=0'), None)
+        self.assertEqual(encoding.negotiate('gzip;q=0.5, identity'), None)
+        self.assertEqual(encoding.negotiate('gzip;q=invalid'), None)
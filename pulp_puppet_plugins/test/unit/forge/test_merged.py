@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+import mock
+
+from pulp_puppet.common import constants
+from pulp_puppet.forge import merged
+from pulp_puppet.forge.merged import MergedDependencyData
+
+
+def release(version, *deps, **kwargs):
+    return dict({'file': '/path/to/%s' % version, 'version': version, 'file_md5': None,
+                 'dependencies': [{'name': d, 'version_requirement': '>= 1.0.0'}
+                                  for d in deps]}, **kwargs)
+
+
+class TestMergedDependencyData(unittest.TestCase):
+
+    def setUp(self):
+        self.dbs = {
+            'repo1': {'db': {
+                'me/a': json.dumps([release('1.0.0', 'me/b'), release('1.10.0', 'me/b')]),
+                'me/b': json.dumps([release('1.0.0', 'me/missing')]),
+                '.format': '5',
+            }},
+            'repo2': {'db': {
+                'me/a': json.dumps([release('1.2.0'), release('1.0.0', file='/other')]),
+                'me/missing': json.dumps([release('1.0.0', 'me/c')]),
+                'me/c': json.dumps([release('1.0.0', 'me/a')]),
+            }},
+        }
+        self.merged = MergedDependencyData(self.dbs)
+
+    def test_releases(self):
+        releases = json.loads(self.merged['me/a'])
+
+        # in version order, with a version in both repos listed as in the first
+        self.assertEqual([r['version'] for r in releases], ['1.0.0', '1.2.0', '1.10.0'])
+        self.assertEqual(releases[0]['file'], '/path/to/1.0.0')
+        self.assertEqual(releases[1]['version_key'], [1, 1, 2, 0, [1]])
+
+    def test_releases_kept(self):
+        first = self.merged['me/b']
+        del self.dbs['repo1']['db']['me/b']
+
+        self.assertTrue(self.merged['me/b'] is first)
+
+    def test_missing(self):
+        self.assertRaises(KeyError, self.merged.__getitem__, 'me/nothere')
+        self.assertRaises(KeyError, self.merged.__getitem__, '.format')
+        self.assertFalse(self.merged.has_key('me/nothere'))
+        self.assertTrue(self.merged.has_key('me/a'))
+
+    def test_closure(self):
+        prefix = constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+
+        # dependencies are followed from one repo into the other
+        self.assertEqual(json.loads(self.merged[prefix + 'me/a']),
+                         ['me/b', 'me/c', 'me/missing'])
+        self.assertEqual(json.loads(self.merged[prefix + 'me/c']),
+                         ['me/a', 'me/b', 'me/missing'])
+        self.assertRaises(KeyError, self.merged.__getitem__, prefix + 'me/nothere')
+
+    @mock.patch.object(merged, 'MODULE_CACHE_SIZE', 2)
+    def test_bounded(self):
+        view = MergedDependencyData(self.dbs)
+        prefix = constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+
+        closure = json.loads(view[prefix + 'me/a'])
+
+        self.assertEqual(closure, ['me/b', 'me/c', 'me/missing'])
+        self.assertEqual(len(view._releases), 2)
+        # entries are built again once evicted
+        self.assertEqual([r['version'] for r in json.loads(view['me/b'])], ['1.0.0'])
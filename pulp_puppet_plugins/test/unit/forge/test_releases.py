@@ -2,14 +2,20 @@
 
 import functools
 import gdbm
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
 from pulp.server.managers.consumer.bind import BindManager
 import web
 
-from pulp_puppet.common import constants
+from pulp_puppet.common import constants, dependency_index, search
+from pulp_puppet.common.dependency_index import DependencyIndex
 from pulp_puppet.forge import releases
+from pulp_puppet.forge.merged import MergedDependencyData
 from pulp_puppet.forge.unit import Unit
 
 
@@ -91,6 +97,108 @@ class TestUnitGenerator(unittest.TestCase):
         results = list(releases.unit_generator(dbs, 'foo'))
         self.assertEquals(4, len(results))
 
+    def test_window(self, mock_get_host):
+        def release_list(*versions):
+            return json.dumps([dict(UNIT_DICT_FROM_DB, version=v) for v in versions])
+        dbs = {
+            'repo2': {'db': {'foo': release_list('2.0.0', '2.1.0')}, 'protocol': 'http'},
+            'repo1': {'db': {'foo': release_list('1.0.0', '1.1.0', '1.2.0')}, 'protocol': 'http'},
+        }
+
+        def versions(offset, limit):
+            return [u.version for u in releases.unit_generator(dbs, 'foo', offset, limit)]
+
+        # repos are visited in order of their IDs
+        self.assertEqual(versions(0, None), ['1.0.0', '1.1.0', '1.2.0', '2.0.0', '2.1.0'])
+        self.assertEqual(versions(0, 2), ['1.0.0', '1.1.0'])
+        self.assertEqual(versions(2, 2), ['1.2.0', '2.0.0'])
+        self.assertEqual(versions(4, 2), ['2.1.0'])
+        self.assertEqual(versions(5, 2), [])
+
+        reversed_versions = [u.version for u in
+                             releases.unit_generator(dbs, 'foo', 1, 3, reverse=True)]
+        self.assertEqual(reversed_versions, ['2.0.0', '1.2.0', '1.1.0'])
+
+    def test_count_releases(self, mock_get_host):
+        dbs = {
+            'repo1': {'db': {'foo': json.dumps([UNIT_DICT_FROM_DB] * 3)}, 'protocol': 'http'},
+            'repo2': {'db': {'foo': json.dumps([UNIT_DICT_FROM_DB] * 2)}, 'protocol': 'http'},
+            'repo3': {'db': {}, 'protocol': 'http'},
+        }
+
+        self.assertEqual(releases.count_releases(dbs, 'foo'), 5)
+        self.assertEqual(releases.count_releases(dbs, 'foo', '1.0.0'), 1)
+        self.assertEqual(releases.count_releases(dbs, 'foo', '2.0.0'), 0)
+        self.assertEqual(releases.count_releases(dbs, 'bar'), 0)
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestViewPage(unittest.TestCase):
+
+    def setUp(self):
+        self.db = {'me/mymodule': json.dumps(
+            [dict(UNIT_DICT_FROM_DB, version=v) for v in ('1.0.0', '2.0.0', '3.0.0')])}
+
+    def test_page(self, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        page, total = releases.view_page(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                         'me/mymodule', offset=1, limit=1)
+
+        self.assertEqual(total, 3)
+        self.assertEqual([r['version'] for r in page], ['2.0.0'])
+        self.assertEqual(page[0]['dependencies'], [['you/yourmodule', '>= 2.1.0']])
+
+    def test_page_reverse(self, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        page, total = releases.view_page(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                         'me/mymodule', offset=0, limit=2, reverse=True)
+
+        self.assertEqual(total, 3)
+        self.assertEqual([r['version'] for r in page], ['3.0.0', '2.0.0'])
+
+    def test_page_decoded_once(self, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        with mock.patch.object(releases.json, 'loads', wraps=json.loads) as mock_loads:
+            releases.view_page(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule',
+                               offset=1, limit=1)
+
+        self.assertEqual(mock_loads.call_count, 1)
+
+    def test_past_last_page(self, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        page, total = releases.view_page(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                         'me/mymodule', offset=3, limit=1)
+
+        self.assertEqual(total, 3)
+        self.assertEqual(page, [])
+
+    def test_version(self, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        page, total = releases.view_page(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                         'me/mymodule', version='2.0.0')
+
+        self.assertEqual(total, 1)
+        self.assertEqual([r['version'] for r in page], ['2.0.0'])
+
+    @mock.patch('web.NotFound', return_value=FooException())
+    def test_not_found(self, mock_not_found, mock_get_data, mock_host):
+        mock_get_data.return_value = {'repo1': {'db': self.db, 'protocol': 'http'}}
+
+        self.assertRaises(FooException, releases.view_page, constants.FORGE_NULL_AUTH_VALUE,
+                          'repo1', 'you/yourmodule')
+
+    @mock.patch('web.webapi.ctx')
+    def test_null_auth(self, mock_ctx, mock_get_data, mock_host):
+        self.assertRaises(
+            web.Unauthorized, releases.view_page, constants.FORGE_NULL_AUTH_VALUE,
+            constants.FORGE_NULL_AUTH_VALUE, 'foo/bar')
+
 
 @mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
 class TestView(unittest.TestCase):
@@ -132,7 +240,7 @@ class TestView(unittest.TestCase):
 
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
-    def test_db_closing(self, mock_get_data, mock_unit_generator, mock_host):
+    def test_dbs_not_closed(self, mock_get_data, mock_unit_generator, mock_host):
         mock_get_data.return_value = {
             'repo1': {'db': mock.MagicMock(), 'protocol': 'http'},
             'repo2': {'db': mock.MagicMock(), 'protocol': 'http'},
@@ -140,69 +248,66 @@ class TestView(unittest.TestCase):
         mock_unit_generator.return_value = [unit_generator()]
 
         releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule')
-        mock_get_data.return_value['repo1']['db'].close.assert_called_once_with()
-        mock_get_data.return_value['repo2']['db'].close.assert_called_once_with()
 
-    @mock.patch('web.NotFound', return_value=FooException())
+        # the databases are cached for use by later requests
+        self.assertEqual(mock_get_data.return_value['repo1']['db'].close.call_count, 0)
+        self.assertEqual(mock_get_data.return_value['repo2']['db'].close.call_count, 0)
+
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
-    def test_db_closing_with_exception(self, mock_get_data, mock_unit_generator, mock_not_found,
-                                       mock_host):
+    def test_calculating_deps_default(self, mock_get_data, mock_unit_generator, mock_host):
         mock_get_data.return_value = {
             'repo1': {'db': mock.MagicMock(), 'protocol': 'http'},
-            'repo2': {'db': mock.MagicMock(), 'protocol': 'http'},
         }
-        mock_unit_generator.return_value = []
+        u1 = unit_generator(version='1.0.0')
+        mock_unit_generator.return_value = [u1]
+        u1_built_data = u1.build_dep_metadata(True)
+        u1.build_dep_metadata = mock.Mock(return_value=u1_built_data)
 
-        self.assertRaises(FooException, releases.view, constants.FORGE_NULL_AUTH_VALUE,
-                          'repo_foo', 'me/mymodule')
-        mock_get_data.return_value['repo1']['db'].close.assert_called_once_with()
-        mock_get_data.return_value['repo2']['db'].close.assert_called_once_with()
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule')
+        u1.build_dep_metadata.assert_called_once_with(True, pruned=False)
 
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
-    def test_db_closing_first_close_raises(self, mock_get_data, mock_unit_generator, mock_host):
+    def test_calculating_deps_recurse_false(self, mock_get_data, mock_unit_generator, mock_host):
         mock_get_data.return_value = {
             'repo1': {'db': mock.MagicMock(), 'protocol': 'http'},
-            'repo2': {'db': mock.MagicMock(), 'protocol': 'http'},
         }
-        mock_unit_generator.return_value = [unit_generator()]
-        mock_get_data.return_value['repo1']['db'].close.side_effect = ValueError()
+        u1 = unit_generator(version='1.0.0')
+        mock_unit_generator.return_value = [u1]
+        u1_built_data = u1.build_dep_metadata(False)
+        u1.build_dep_metadata = mock.Mock(return_value=u1_built_data)
 
-        self.assertRaises(ValueError, releases.view, constants.FORGE_NULL_AUTH_VALUE,
-                          'repo_foo', 'me/mymodule')
-        mock_get_data.return_value['repo1']['db'].close.assert_called_once_with()
-        # Ensure the second db is still closed
-        mock_get_data.return_value['repo2']['db'].close.assert_called_once_with()
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule',
+                      recurse_deps=False)
+        u1.build_dep_metadata.assert_called_once_with(False, pruned=False)
 
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
-    def test_calculating_deps_default(self, mock_get_data, mock_unit_generator, mock_host):
+    def test_calculating_deps_pruned_config(self, mock_get_data, mock_unit_generator, mock_host):
         mock_get_data.return_value = {
-            'repo1': {'db': mock.MagicMock(), 'protocol': 'http'},
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'pruned': True},
         }
         u1 = unit_generator(version='1.0.0')
         mock_unit_generator.return_value = [u1]
-        u1_built_data = u1.build_dep_metadata(True)
-        u1.build_dep_metadata = mock.Mock(return_value=u1_built_data)
+        u1.build_dep_metadata = mock.Mock(return_value={'me/mymodule': []})
 
         releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule')
-        u1.build_dep_metadata.assert_called_once_with(True)
+        u1.build_dep_metadata.assert_called_once_with(True, pruned=True)
 
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
-    def test_calculating_deps_recurse_false(self, mock_get_data, mock_unit_generator, mock_host):
+    def test_calculating_deps_pruned_override(self, mock_get_data, mock_unit_generator,
+                                              mock_host):
         mock_get_data.return_value = {
-            'repo1': {'db': mock.MagicMock(), 'protocol': 'http'},
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'pruned': True},
         }
         u1 = unit_generator(version='1.0.0')
         mock_unit_generator.return_value = [u1]
-        u1_built_data = u1.build_dep_metadata(False)
-        u1.build_dep_metadata = mock.Mock(return_value=u1_built_data)
+        u1.build_dep_metadata = mock.Mock(return_value={'me/mymodule': []})
 
-        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule',
-                      recurse_deps=False)
-        u1.build_dep_metadata.assert_called_once_with(False)
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule', pruned=False)
+        u1.build_dep_metadata.assert_called_once_with(True, pruned=False)
 
     @mock.patch.object(releases, 'unit_generator', autospec=True)
     @mock.patch.object(releases, 'get_repo_data', autospec=True)
@@ -252,8 +357,453 @@ class TestView(unittest.TestCase):
         self.assertEquals(1, len(result['me/mymodule']))
         self.assertEquals('3.0.0', result['me/mymodule'][0]['version'])
 
+    @mock.patch.object(releases, 'unit_generator', autospec=True)
+    @mock.patch.object(releases, 'get_repo_data', autospec=True)
+    def test_filtering_view_all_false_sorted(self, mock_get_data, mock_unit_generator,
+                                             mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'sorted': True},
+            'repo2': {'db': mock.MagicMock(), 'protocol': 'http', 'sorted': True},
+        }
+        u1 = unit_generator(version='1.0.0', repo_id='repo1')
+        u2 = unit_generator(version='3.0.0', repo_id='repo1')
+        # an unparsable version would fail the comparison, but is never compared
+        # since only the last unit of each sorted repo is considered
+        u3 = unit_generator(version='not-a-version', repo_id='repo2')
+        u4 = unit_generator(version='2.0.0', repo_id='repo2')
+        mock_unit_generator.return_value = [u1, u2, u3, u4]
+
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo_foo', 'me/mymodule',
+                               view_all_matching=False)
+        self.assertEquals('3.0.0', result['me/mymodule'][0]['version'])
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'unit_generator', autospec=True)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestViewResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        releases._response_cache.clear()
+
+    def tearDown(self):
+        releases._response_cache.clear()
+
+    def test_cached(self, mock_get_data, mock_unit_generator, mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'generation': 1},
+        }
+        mock_unit_generator.return_value = [unit_generator()]
+        stats = releases.response_cache_stats()
+
+        first = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+        second = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+
+        self.assertTrue(first is second)
+        self.assertEqual(mock_unit_generator.call_count, 1)
+        new_stats = releases.response_cache_stats()
+        self.assertEqual(new_stats['hits'], stats['hits'] + 1)
+        self.assertEqual(new_stats['misses'], stats['misses'] + 1)
+        self.assertEqual(new_stats['size'], 1)
+
+    def test_parameters_in_key(self, mock_get_data, mock_unit_generator, mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'generation': 1},
+        }
+        mock_unit_generator.return_value = [unit_generator()]
+
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule',
+                      recurse_deps=False)
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule',
+                      version='1.0.0')
+
+        self.assertEqual(mock_unit_generator.call_count, 3)
+
+    def test_new_generation(self, mock_get_data, mock_unit_generator, mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'generation': 1},
+        }
+        mock_unit_generator.return_value = [unit_generator()]
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+
+        # the repo is published again
+        mock_get_data.return_value['repo1']['generation'] = 2
+        mock_unit_generator.return_value = [unit_generator(version='2.0.0')]
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+
+        self.assertEqual(result['me/mymodule'][0]['version'], '2.0.0')
+
+    def test_unknown_generation(self, mock_get_data, mock_unit_generator, mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': mock.MagicMock(), 'protocol': 'http', 'generation': 1},
+            'repo2': {'db': mock.MagicMock(), 'protocol': 'http', 'generation': None},
+        }
+        mock_unit_generator.return_value = [unit_generator()]
+
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+        releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+
+        self.assertEqual(mock_unit_generator.call_count, 2)
+        self.assertEqual(releases.response_cache_stats()['size'], 0)
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+@mock.patch.object(releases, '_open_dependency_data', autospec=True)
+class TestViewResponseCachePruned(unittest.TestCase):
+
+    def setUp(self):
+        releases._response_cache.clear()
+        releases._distributors_cache.clear()
+
+    def tearDown(self):
+        releases._response_cache.clear()
+        releases._distributors_cache.clear()
+
+    def test_pruned_config_changed(self, mock_open, mock_find, mock_host):
+        db = {
+            constants.REPO_DEPDATA_FORMAT_KEY: str(constants.REPO_DEPDATA_SORTED_FORMAT),
+            'me/mymodule': json.dumps([UNIT_DICT_FROM_DB]),
+            'you/yourmodule': json.dumps([
+                dict(UNIT_DICT_FROM_DB, version=v, dependencies=[]) for v in ('2.0.0', '2.2.0')]),
+        }
+        mock_open.return_value = (db, 1)
+        distributor = {'repo_id': 'repo1', 'config': {}}
+        mock_find.return_value = [distributor]
+
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+        self.assertEqual([r['version'] for r in result['you/yourmodule']], ['2.0.0', '2.2.0'])
+
+        # the distributor is reconfigured and its cached configuration expires
+        distributor['config'][constants.CONFIG_PRUNED_DEPENDENCIES] = True
+        releases._distributors_cache.clear()
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule')
+
+        self.assertEqual([r['version'] for r in result['you/yourmodule']], ['2.2.0'])
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'unit_generator', autospec=True)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestViewLatest(unittest.TestCase):
+
+    def test_latest_pointer(self, mock_get_data, mock_unit_generator, mock_host):
+        latest = dict(UNIT_DICT_FROM_DB, version='2.0.0', version_key=[1, 2, 0, 0, [1]])
+        db = {constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/mymodule': json.dumps(latest)}
+        mock_get_data.return_value = {
+            'repo1': {'db': db, 'protocol': 'http', 'latest': True},
+        }
+
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule',
+                               recurse_deps=False)
+
+        self.assertEqual([r['version'] for r in result['me/mymodule']], ['2.0.0'])
+        # the release lists are not read
+        self.assertEqual(mock_unit_generator.call_count, 0)
+
+    def test_latest_pointer_mixed(self, mock_get_data, mock_unit_generator, mock_host):
+        latest = dict(UNIT_DICT_FROM_DB, version='2.0.0', version_key=[1, 2, 0, 0, [1]])
+        db = {constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/mymodule': json.dumps(latest)}
+        mock_get_data.return_value = {
+            'repo1': {'db': db, 'protocol': 'http', 'latest': True},
+            'repo2': {'db': {}, 'protocol': 'http', 'sorted': True},
+        }
+        mock_unit_generator.return_value = [unit_generator(version='1.0.0', repo_id='repo2'),
+                                            unit_generator(version='3.0.0', repo_id='repo2')]
+
+        result = releases.view(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me/mymodule',
+                               recurse_deps=False)
+
+        self.assertEqual([r['version'] for r in result['me/mymodule']], ['3.0.0'])
+        mock_unit_generator.assert_called_once_with(
+            {'repo2': mock_get_data.return_value['repo2']}, 'me/mymodule')
+
+    @mock.patch('web.NotFound', return_value=FooException())
+    def test_latest_pointer_missing(self, mock_not_found, mock_get_data, mock_unit_generator,
+                                    mock_host):
+        mock_get_data.return_value = {
+            'repo1': {'db': {}, 'protocol': 'http', 'latest': True},
+        }
+
+        self.assertRaises(FooException, releases.view, constants.FORGE_NULL_AUTH_VALUE,
+                          'repo1', 'me/mymodule')
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestSearchModules(unittest.TestCase):
+
+    def setUp(self):
+        releases._response_cache.clear()
+
+    def tearDown(self):
+        releases._response_cache.clear()
+
+    @staticmethod
+    def search_db(entries):
+        db = {constants.REPO_DEPDATA_MODULES_KEY: json.dumps(sorted(entries))}
+        for name, entry in entries.iteritems():
+            db[constants.REPO_DEPDATA_MODULE_KEY_PREFIX + name] = json.dumps(entry)
+            for term in search.module_terms(entry):
+                key = constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + term
+                db[key] = json.dumps(sorted(json.loads(db.get(key, '[]')) + [name]))
+        return db
+
+    @staticmethod
+    def search_entry(author, name, version='1.0.0', version_key=None, summary=None):
+        return {'author': author, 'name': name, 'version': version,
+                'version_key': version_key or [1, 1, 0, 0, [1]], 'summary': summary,
+                'description': None, 'tag_list': [], 'project_page': None}
+
+    def test_search(self, mock_get_data, mock_host):
+        db = self.search_db({
+            'me/mymodule': self.search_entry('me', 'mymodule', summary='Web server'),
+            'you/yourmodule': self.search_entry('you', 'yourmodule', summary='Database server'),
+        })
+        mock_get_data.return_value = {'repo1': {'db': db, 'search': True}}
+
+        entries, total = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                                 'SERVER')
+        self.assertEqual([e['name'] for e in entries], ['mymodule', 'yourmodule'])
+        self.assertEqual(total, 2)
+
+        entries, total = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                                 'web server')
+        self.assertEqual([e['name'] for e in entries], ['mymodule'])
+        self.assertEqual(total, 1)
+
+        entries, total = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                                 'web nothing')
+        self.assertEqual((entries, total), ([], 0))
+
+    def test_all_modules_paged(self, mock_get_data, mock_host):
+        db = self.search_db(dict(('me/module%d' % i, self.search_entry('me', 'module%d' % i))
+                                 for i in range(5)))
+        mock_get_data.return_value = {'repo1': {'db': db, 'search': True}}
+
+        entries, total = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1', '',
+                                                 offset=2, limit=2)
+
+        self.assertEqual([e['name'] for e in entries], ['module2', 'module3'])
+        self.assertEqual(total, 5)
+
+    def test_latest_across_repos(self, mock_get_data, mock_host):
+        old = self.search_db({'me/mymodule': self.search_entry('me', 'mymodule', '1.0.0')})
+        new = self.search_db({'me/mymodule': self.search_entry('me', 'mymodule', '2.0.0',
+                                                               [1, 2, 0, 0, [1]])})
+        mock_get_data.return_value = {
+            'repo1': {'db': new, 'search': True},
+            'repo2': {'db': old, 'search': True},
+            # published before search was supported
+            'repo3': {'db': {}},
+        }
+
+        entries, total = releases.search_modules('consumer1', None, 'mymodule')
+
+        self.assertEqual([e['version'] for e in entries], ['2.0.0'])
+        self.assertEqual(total, 1)
+
+    def test_cached(self, mock_get_data, mock_host):
+        db = CountingDict(self.search_db({'me/mymodule': self.search_entry('me', 'mymodule')}))
+        mock_get_data.return_value = {
+            'repo1': {'db': db, 'protocol': 'http', 'search': True, 'generation': 1},
+        }
+
+        first = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'mymodule me')
+        reads = dict(db.reads)
+        second = releases.search_modules(constants.FORGE_NULL_AUTH_VALUE, 'repo1', 'me mymodule')
+
+        self.assertTrue(first is second)
+        self.assertEqual(db.reads, reads)
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestViewMerged(unittest.TestCase):
+
+    def setUp(self):
+        releases._response_cache.clear()
+
+    def tearDown(self):
+        releases._response_cache.clear()
+
+    def test_dependency_in_other_repo(self, mock_get_data, mock_host):
+        release = dict(UNIT_DICT_FROM_DB, file='/repo1/file')
+        dep = {'file': '/repo2/file', 'version': '2.1.0', 'dependencies': [], 'file_md5': None}
+        dbs = {
+            'repo1': {'db': {'me/mymodule': json.dumps([release])}},
+            'repo2': {'db': {'you/yourmodule': json.dumps([dep])}},
+        }
+        merged = MergedDependencyData(dbs)
+        mock_get_data.return_value = dict(
+            (repo_id, {'db': data['db'], 'protocol': 'http', 'merged': merged})
+            for repo_id, data in dbs.iteritems())
+
+        result = releases.view('consumer1', constants.FORGE_NULL_AUTH_VALUE, 'me/mymodule')
+
+        self.assertEqual([r['file'] for r in result['me/mymodule']], ['/repo1/file'])
+        self.assertEqual([r['file'] for r in result['you/yourmodule']], ['/repo2/file'])
+
+    def test_resolve_shares_dependencies(self, mock_get_data, mock_host):
+        common = {'file': '/repo1/common', 'version': '1.0.0', 'dependencies': [],
+                  'file_md5': None}
+        a = {'file': '/repo1/a', 'version': '1.0.0', 'file_md5': None,
+             'dependencies': [{'name': 'me/common', 'version_requirement': '1.x'}]}
+        b = dict(a, file='/repo2/b')
+        dbs = {
+            'repo1': {'db': CountingDict({'me/a': json.dumps([a]),
+                                          'me/common': json.dumps([common])})},
+            'repo2': {'db': CountingDict({'me/b': json.dumps([b])})},
+        }
+        merged = MergedDependencyData(dbs)
+        mock_get_data.return_value = dict(
+            (repo_id, {'db': data['db'], 'protocol': 'http', 'merged': merged})
+            for repo_id, data in dbs.iteritems())
+
+        result = releases.resolve('consumer1', constants.FORGE_NULL_AUTH_VALUE,
+                                  [('me/a', None, None), ('me/b', None, None)])
+
+        self.assertEqual(sorted(result), ['me/a', 'me/b', 'me/common'])
+        self.assertEqual(len(result['me/common']), 1)
+        # the dependency is looked up once for both modules
+        self.assertEqual(dbs['repo1']['db'].reads['me/common'], 1)
+
+
+class CountingDict(dict):
+    """
+    Dictionary that counts how often each key is read
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingDict, self).__init__(*args, **kwargs)
+        self.reads = {}
+
+    def __getitem__(self, key):
+        self.reads[key] = self.reads.get(key, 0) + 1
+        return super(CountingDict, self).__getitem__(key)
+
+
+@mock.patch.object(releases, 'get_host_and_protocol', return_value=MOCK_HOST_PROTOCOL)
+@mock.patch.object(releases, 'get_repo_data', autospec=True)
+class TestResolve(unittest.TestCase):
+    def setUp(self):
+        def releases_json(*versions):
+            return json.dumps([
+                {'file': '/path/to/%s' % version, 'version': version,
+                 'dependencies': [{'name': name, 'version_requirement': '>= 1.0.0'}
+                                  for name in deps]}
+                for version, deps in versions])
+
+        self.db = CountingDict({
+            'a/one': releases_json(('1.0.0', ['c/common'])),
+            'a/two': releases_json(('1.0.0', ['c/common', 'a/one']),
+                                   ('2.0.0', ['c/common', 'a/one'])),
+            'c/common': releases_json(('1.0.0', ['c/leaf']), ('2.0.0', ['c/leaf'])),
+            'c/leaf': releases_json(('1.0.0', [])),
+        })
+        self.repo_data = {'repo1': {'db': self.db, 'protocol': 'http', 'generation': 1}}
+        releases._response_cache.clear()
+
+    def tearDown(self):
+        releases._response_cache.clear()
+
+    @staticmethod
+    def versions(result):
+        return dict((name, sorted(r['version'] for r in rels))
+                    for name, rels in result.iteritems())
+
+    def test_merged(self, mock_get_data, mock_host):
+        mock_get_data.return_value = self.repo_data
+
+        result = releases.resolve(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                  [('a/one', None, None), ('a/two', '1.0.0', None)])
+
+        self.assertEqual(self.versions(result), {
+            'a/one': ['1.0.0'],
+            'a/two': ['1.0.0'],
+            'c/common': ['1.0.0', '2.0.0'],
+            'c/leaf': ['1.0.0'],
+        })
+        # the shared dependencies are only read once
+        self.assertEqual(self.db.reads['c/common'], 1)
+        self.assertEqual(self.db.reads['c/leaf'], 1)
+
+    def test_version_requirement(self, mock_get_data, mock_host):
+        mock_get_data.return_value = self.repo_data
+
+        result = releases.resolve(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                  [('c/common', None, '< 2.0.0'), ('a/two', None, None)])
+
+        self.assertEqual(result['c/common'][0]['version'], '1.0.0')
+        self.assertEqual(self.versions(result)['a/two'], ['2.0.0'])
+
+    def test_pruned(self, mock_get_data, mock_host):
+        mock_get_data.return_value = self.repo_data
+
+        with mock.patch.object(Unit, 'build_dep_metadata', autospec=True) as mock_build:
+            mock_build.return_value = {'a/one': [{'version': '1.0.0', 'file': '/path'}]}
+            result = releases.resolve(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                      [('a/one', None, None)], pruned=True)
+
+        self.assertEqual(result, mock_build.return_value)
+        self.assertEqual(mock_build.call_args[1], {'pruned': True})
+
+    @mock.patch('web.NotFound', return_value=FooException())
+    def test_not_found(self, mock_not_found, mock_get_data, mock_host):
+        mock_get_data.return_value = self.repo_data
+
+        self.assertRaises(FooException, releases.resolve, constants.FORGE_NULL_AUTH_VALUE,
+                          'repo1', [('a/one', None, None), ('a/missing', None, None)])
+        self.assertRaises(FooException, releases.resolve, constants.FORGE_NULL_AUTH_VALUE,
+                          'repo1', [('a/one', None, '>= 2.0.0')])
+
+    def test_cached(self, mock_get_data, mock_host):
+        mock_get_data.return_value = self.repo_data
+        modules = [('a/one', None, None)]
+
+        result = releases.resolve(constants.FORGE_NULL_AUTH_VALUE, 'repo1', modules)
+        self.assertTrue(releases.resolve(constants.FORGE_NULL_AUTH_VALUE, 'repo1',
+                                         modules) is result)
+
 
 class TestGetRepoData(unittest.TestCase):
+    def setUp(self):
+        releases._dependency_data_cache.clear()
+        releases._distributors_cache.clear()
+
+    def tearDown(self):
+        releases._dependency_data_cache.clear()
+        releases._distributors_cache.clear()
+
+    @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+    @mock.patch('gdbm.open', autospec=True)
+    def test_distributors_cached(self, mock_open, mock_find):
+        mock_find.return_value = [{'repo_id':'repo1', 'config':{}}]
+
+        releases.get_repo_data(['repo1'])
+        mock_find.return_value = [{'repo_id':'repo2', 'config':{}}]
+        result = releases.get_repo_data(['repo1', 'repo2', 'repo3'])
+
+        self.assertEqual(sorted(result.keys()), ['repo1', 'repo2'])
+        # only the repos not yet cached are queried
+        mock_find.assert_called_with(['repo2', 'repo3'])
+        self.assertEqual(releases.lookup_cache_stats()['distributors']['size'], 3)
+
+        mock_find.return_value = []
+        releases.get_repo_data(['repo3'])
+        self.assertEqual(mock_find.call_count, 2)
+
+    @mock.patch.object(releases, '_distributors_cache', releases.TTLCache(10, 0))
+    @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+    @mock.patch('gdbm.open', autospec=True)
+    def test_distributors_expire(self, mock_open, mock_find):
+        mock_find.return_value = [{'repo_id':'repo1', 'config':{}}]
+
+        releases.get_repo_data(['repo1'])
+        releases.get_repo_data(['repo1'])
+
+        self.assertEqual(mock_find.call_count, 2)
+
     @mock.patch('web.ctx')
     @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
     @mock.patch('gdbm.open', autospec=True)
@@ -266,9 +816,52 @@ class TestGetRepoData(unittest.TestCase):
         self.assertTrue(isinstance(result, dict))
         self.assertEqual(result.keys(), ['repo1'])
         self.assertEqual(result['repo1']['db'], mock_open.return_value)
+        self.assertFalse(result['repo1']['sorted'])
+        self.assertFalse(result['repo1']['closures'])
         mock_open.assert_called_once_with('/var/lib/pulp/published/puppet/http/repos/repo1/.dependency_db',
                                           'r')
 
+    @mock.patch('web.ctx')
+    @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+    @mock.patch('gdbm.open', autospec=True)
+    def test_index_preferred(self, mock_open, mock_find, mock_ctx):
+        mock_ctx.protocol = 'http'
+        publish_dir = tempfile.mkdtemp(prefix='pulp-puppet-forge')
+        try:
+            os.mkdir(os.path.join(publish_dir, 'repo1'))
+            dependency_index.write_index(
+                os.path.join(publish_dir, 'repo1', constants.REPO_DEPINDEX_FILENAME),
+                {constants.REPO_DEPDATA_FORMAT_KEY: constants.REPO_DEPDATA_FORMAT_VERSION})
+            mock_find.return_value = [
+                {'repo_id':'repo1', 'config':{constants.CONFIG_HTTP_DIR: publish_dir}}
+            ]
+
+            result = releases.get_repo_data(['repo1'])
+
+            self.assertTrue(isinstance(result['repo1']['db'], DependencyIndex))
+            self.assertTrue(result['repo1']['closures'])
+            self.assertEqual(mock_open.call_count, 0)
+            result['repo1']['db'].close()
+        finally:
+            shutil.rmtree(publish_dir)
+
+    @mock.patch('web.ctx')
+    @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+    @mock.patch('gdbm.open', autospec=True)
+    def test_current_format(self, mock_open, mock_find, mock_ctx):
+        mock_ctx.protocol = 'http'
+        mock_find.return_value = [{'repo_id':'repo1', 'config':{}}]
+        db = {constants.REPO_DEPDATA_FORMAT_KEY: constants.REPO_DEPDATA_FORMAT_VERSION}
+        mock_open.return_value = mock.MagicMock()
+        mock_open.return_value.has_key.side_effect = db.has_key
+        mock_open.return_value.__getitem__.side_effect = db.__getitem__
+
+        result = releases.get_repo_data(['repo1'])
+
+        self.assertTrue(result['repo1']['sorted'])
+        self.assertTrue(result['repo1']['closures'])
+        self.assertTrue(result['repo1']['latest'])
+
     @mock.patch('web.ctx')
     @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
     @mock.patch('gdbm.open', autospec=True)
@@ -283,6 +876,31 @@ class TestGetRepoData(unittest.TestCase):
 
         self.assertTrue('repo1' in result)
         self.assertTrue('repo2' in result)
+        merged = result['repo1']['merged']
+        self.assertTrue(isinstance(merged, MergedDependencyData))
+        self.assertTrue(result['repo2']['merged'] is merged)
+
+    @mock.patch.object(releases, '_open_dependency_data', autospec=True)
+    @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+    def test_merged_data_cached(self, mock_find, mock_open_data):
+        releases._merged_data_cache.clear()
+        mock_find.return_value = [
+            {'repo_id':'repo1', 'config':{}},
+            {'repo_id':'repo2', 'config':{}}
+        ]
+        generations = {'repo1': 1, 'repo2': 1}
+        mock_open_data.side_effect = lambda path: ({}, generations[os.path.basename(path)])
+
+        first = releases.get_repo_data(['repo1', 'repo2'])['repo1']['merged']
+        second = releases.get_repo_data(['repo1', 'repo2'])['repo1']['merged']
+        # repo2 is published again
+        generations['repo2'] = 2
+        third = releases.get_repo_data(['repo1', 'repo2'])['repo1']['merged']
+        releases._merged_data_cache.clear()
+
+        self.assertTrue(second is first)
+        self.assertFalse(third is first)
+        self.assertFalse('merged' in releases.get_repo_data(['repo1'])['repo1'])
 
     @mock.patch('web.ctx')
     @mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
@@ -313,6 +931,134 @@ class TestGetRepoData(unittest.TestCase):
                                           'r')
 
 
+@mock.patch('pulp.server.managers.repo.distributor.RepoDistributorManager.find_by_repo_list')
+class TestGetETag(unittest.TestCase):
+    def setUp(self):
+        releases._distributors_cache.clear()
+        self.publish_dir = tempfile.mkdtemp(prefix='pulp-puppet-forge')
+        self.repo_dir = os.path.join(self.publish_dir, 'repo1')
+        os.mkdir(self.repo_dir)
+        self.distributor = {'repo_id': 'repo1',
+                            'config': {constants.CONFIG_HTTP_DIR: self.publish_dir}}
+
+    def tearDown(self):
+        releases._distributors_cache.clear()
+        shutil.rmtree(self.publish_dir)
+
+    def publish(self, filename, content):
+        # a publish replaces the file rather than modifying it
+        path = os.path.join(self.repo_dir, filename)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.rename(tmp_path, path)
+
+    def test_published(self, mock_find):
+        mock_find.return_value = [self.distributor]
+        self.publish(constants.REPO_DEPDATA_FILENAME, 'a')
+
+        etag = releases.get_etag('.', 'repo1', 'foo/bar')
+
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(releases.get_etag('.', 'repo1', 'foo/bar'), etag)
+        self.assertNotEqual(releases.get_etag('.', 'repo1', 'foo/baz'), etag)
+
+        self.publish(constants.REPO_DEPDATA_FILENAME, 'ab')
+        self.assertNotEqual(releases.get_etag('.', 'repo1', 'foo/bar'), etag)
+
+    @mock.patch.object(releases, '_open_cached')
+    def test_index_not_opened(self, mock_open_cached, mock_find):
+        mock_find.return_value = [self.distributor]
+        self.publish(constants.REPO_DEPDATA_FILENAME, 'a')
+        etag = releases.get_etag('.', 'repo1')
+
+        self.publish(constants.REPO_DEPINDEX_FILENAME, 'b')
+
+        self.assertNotEqual(releases.get_etag('.', 'repo1'), etag)
+        self.assertEqual(mock_open_cached.call_count, 0)
+
+    def test_pruned_config(self, mock_find):
+        mock_find.return_value = [self.distributor]
+        self.publish(constants.REPO_DEPDATA_FILENAME, 'a')
+        etag = releases.get_etag('.', 'repo1')
+
+        releases._distributors_cache.clear()
+        self.distributor['config'][constants.CONFIG_PRUNED_DEPENDENCIES] = True
+
+        self.assertNotEqual(releases.get_etag('.', 'repo1'), etag)
+
+    def test_not_published(self, mock_find):
+        mock_find.return_value = [self.distributor]
+
+        self.assertTrue(releases.get_etag('.', 'repo1') is None)
+
+    def test_no_repo(self, mock_find):
+        mock_find.return_value = []
+
+        self.assertTrue(releases.get_etag('.', 'repo1') is None)
+
+
+class TestOpenCached(unittest.TestCase):
+    def setUp(self):
+        releases._dependency_data_cache.clear()
+        self.publish_dir = tempfile.mkdtemp(prefix='pulp-puppet-forge')
+        self.index_path = os.path.join(self.publish_dir, constants.REPO_DEPINDEX_FILENAME)
+        dependency_index.write_index(self.index_path, {'me/mymodule': '[]'})
+
+    def tearDown(self):
+        releases._dependency_data_cache.clear()
+        shutil.rmtree(self.publish_dir)
+
+    def test_reused(self):
+        first, first_generation = releases._open_dependency_data(self.publish_dir)
+        second, second_generation = releases._open_dependency_data(self.publish_dir)
+
+        self.assertTrue(isinstance(first, DependencyIndex))
+        self.assertTrue(first is second)
+        self.assertEqual(first_generation, second_generation)
+
+    def test_reopened_after_publish(self):
+        first, first_generation = releases._open_dependency_data(self.publish_dir)
+
+        # a publish replaces the file with a new one
+        dependency_index.write_index(self.index_path, {'me/mymodule': '[{}]'})
+        second, second_generation = releases._open_dependency_data(self.publish_dir)
+
+        self.assertFalse(first is second)
+        self.assertNotEqual(first_generation, second_generation)
+        self.assertEqual(second['me/mymodule'], '[{}]')
+
+    def test_removed(self):
+        releases._open_dependency_data(self.publish_dir)
+        os.remove(self.index_path)
+
+        result = releases._open_cached(self.index_path, DependencyIndex, (IOError, ValueError))
+
+        self.assertEqual(result, (None, None))
+        self.assertFalse(self.index_path in releases._dependency_data_cache)
+
+    def test_not_cached_if_unreadable(self):
+        open_function = mock.MagicMock(side_effect=IOError)
+
+        result = releases._open_cached(self.index_path, open_function, (IOError,))
+
+        self.assertEqual(result, (None, None))
+        self.assertEqual(len(releases._dependency_data_cache), 0)
+
+
+class TestGetPrunedFromDistributor(unittest.TestCase):
+    def test_default(self):
+        self.assertFalse(releases._get_pruned_from_distributor({'config': {}}))
+
+    def test_true(self):
+        distributor = {'config': {constants.CONFIG_PRUNED_DEPENDENCIES: 'true'}}
+        self.assertTrue(releases._get_pruned_from_distributor(distributor))
+
+    def test_bool(self):
+        distributor = {'config': {constants.CONFIG_PRUNED_DEPENDENCIES: True}}
+        self.assertTrue(releases._get_pruned_from_distributor(distributor))
+
+
 class TestGetProtocol(unittest.TestCase):
     def test_default(self):
         result = releases._get_protocol_from_distributor({'config':{}})
@@ -351,6 +1097,29 @@ class TestGetHostAndProtocol(unittest.TestCase):
 
 
 class TestGetBoundRepos(unittest.TestCase):
+    def setUp(self):
+        releases._bindings_cache.clear()
+
+    def tearDown(self):
+        releases._bindings_cache.clear()
+
+    @mock.patch.object(BindManager, 'find_by_consumer', spec=BindManager().find_by_consumer)
+    def test_cached(self, mock_find):
+        mock_find.return_value = [{
+            'repo_id': 'repo1',
+            'distributor_id' : constants.DISTRIBUTOR_TYPE_ID
+        }]
+        stats = releases.lookup_cache_stats()['bindings']
+
+        releases.get_bound_repos('consumer1')
+        result = releases.get_bound_repos('consumer1')
+
+        mock_find.assert_called_once_with('consumer1')
+        self.assertEqual(result, ['repo1'])
+        new_stats = releases.lookup_cache_stats()['bindings']
+        self.assertEqual(new_stats['hits'], stats['hits'] + 1)
+        self.assertEqual(new_stats['misses'], stats['misses'] + 1)
+
     @mock.patch.object(BindManager, 'find_by_consumer', spec=BindManager().find_by_consumer)
     def test_only_puppet(self, mock_find):
         bindings =[{
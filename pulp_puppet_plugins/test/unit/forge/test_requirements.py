@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import semantic_version
+
+from pulp_puppet.forge import requirements
+
+
+class TestParse(unittest.TestCase):
+
+    def assertMatches(self, requirement, matching, not_matching):
+        parsed = requirements.parse(requirement)
+        for version in matching:
+            self.assertTrue(parsed.match(semantic_version.Version(version)),
+                            '%s should match %s' % (version, requirement))
+        for version in not_matching:
+            self.assertFalse(parsed.match(semantic_version.Version(version)),
+                             '%s should not match %s' % (version, requirement))
+
+    def test_comparison(self):
+        self.assertMatches('>= 1.2.0', ['1.2.0', '3.0.0'], ['1.1.9'])
+        self.assertMatches('>1.2.0', ['1.2.1'], ['1.2.0'])
+        self.assertMatches('< 1.2.0', ['1.1.9'], ['1.2.0'])
+        self.assertMatches('<=1.2.0', ['1.2.0'], ['1.2.1'])
+
+    def test_exact(self):
+        self.assertMatches('1.2.3', ['1.2.3'], ['1.2.4'])
+        self.assertMatches('=1.2.3', ['1.2.3'], ['1.2.2'])
+
+    def test_and(self):
+        self.assertMatches('>= 1.0.0 < 2.0.0', ['1.0.0', '1.9.9'], ['0.9.0', '2.0.0'])
+
+    def test_or(self):
+        self.assertMatches('1.x || >=3.0.0', ['1.5.0', '3.1.0'], ['2.0.0'])
+
+    def test_wildcards(self):
+        self.assertMatches('1.x', ['1.0.0', '1.9.0'], ['2.0.0', '0.9.0'])
+        self.assertMatches('1.2.x', ['1.2.0', '1.2.9'], ['1.3.0'])
+        self.assertMatches('*', ['0.0.1', '9.0.0'], [])
+
+    def test_partial_comparison(self):
+        self.assertMatches('>= 1.2', ['1.2.0'], ['1.1.9'])
+        self.assertMatches('> 1.2', ['1.3.0'], ['1.2.9'])
+        self.assertMatches('<= 1.2', ['1.2.9'], ['1.3.0'])
+
+    def test_tilde_caret(self):
+        self.assertMatches('~1.2.3', ['1.2.3', '1.2.9'], ['1.3.0', '1.2.2'])
+        self.assertMatches('~1.2', ['1.2.0', '1.2.9'], ['1.3.0'])
+        self.assertMatches('^1.2.3', ['1.2.3', '1.9.0'], ['2.0.0'])
+
+    def test_hyphen_range(self):
+        self.assertMatches('1.0.0 - 1.4.0', ['1.0.0', '1.4.0'], ['1.4.1'])
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, requirements.parse, '>= foo')
+
+
+class TestGet(unittest.TestCase):
+
+    def test_cached(self):
+        self.assertTrue(requirements.get('>= 1.0.0') is requirements.get('>= 1.0.0'))
+
+    def test_unsupported(self):
+        self.assertTrue(requirements.get('>= foo') is None)
+
+    def test_not_a_string(self):
+        self.assertTrue(requirements.get(None) is None)
+        self.assertTrue(requirements.get(100) is None)
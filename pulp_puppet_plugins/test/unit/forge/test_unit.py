@@ -16,8 +16,10 @@ import json
 import unittest
 
 import mock
+import semantic_version
 
-from pulp_puppet.forge.unit import Unit
+from pulp_puppet.common import constants
+from pulp_puppet.forge.unit import Unit, version_sort_key
 
 
 unit_generator = functools.partial(
@@ -120,6 +122,125 @@ class TestAddDepToMetadata(unittest.TestCase):
         self.assertEqual(root['foo/bar'], mock_list_of_module_metadata)
 
 
+class TestAddDepClosureToMetadata(unittest.TestCase):
+    def setUp(self):
+        def releases(name, *deps):
+            return json.dumps([{'file': '/path/to/%s' % name, 'version': '1.0.0',
+                                'dependencies': [{'name': d} for d in deps]}])
+
+        # you/yourmodule -> foo/bar -> you/yourmodule (a cycle) and foo/missing
+        self.db = {
+            'you/yourmodule': releases('you/yourmodule', 'foo/bar'),
+            'foo/bar': releases('foo/bar', 'you/yourmodule', 'foo/missing'),
+            'foo/unrelated': releases('foo/unrelated'),
+            constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX + 'you/yourmodule':
+                json.dumps(['foo/bar', 'foo/missing']),
+            constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX + 'foo/bar':
+                json.dumps(['foo/missing', 'you/yourmodule']),
+            constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX + 'foo/unrelated': json.dumps([]),
+        }
+
+    def test_matches_recursion(self):
+        recursive = unit_generator(db=self.db).build_dep_metadata()
+        unit = unit_generator(db=self.db, dep_closures=True)
+
+        with mock.patch.object(Unit, '_add_dep_to_metadata') as mock_add_dep:
+            result = unit.build_dep_metadata()
+
+        self.assertEqual(result, recursive)
+        self.assertEqual(set(result.keys()),
+                         set(['me/mymodule', 'you/yourmodule', 'foo/bar', 'foo/missing']))
+        self.assertEqual(result['foo/missing'], [])
+        self.assertEqual(mock_add_dep.call_count, 0)
+
+    def test_no_recurse_ignores_closures(self):
+        unit = unit_generator(db=self.db, dep_closures=True)
+
+        result = unit.build_dep_metadata(recurse_deps=False)
+
+        self.assertEqual(set(result.keys()), set(['me/mymodule', 'you/yourmodule']))
+
+
+class TestAddPrunedDepsToMetadata(unittest.TestCase):
+    def setUp(self):
+        def releases(*versions):
+            return json.dumps([
+                {'file': '/path/to/%s' % version, 'version': version,
+                 'dependencies': [{'name': name, 'version_requirement': requirement}
+                                  for name, requirement in deps]}
+                for version, deps in versions])
+
+        # me/mymodule requires you/yourmodule >= 2.1.0
+        self.db = {
+            'you/yourmodule': releases(('1.0.0', []),
+                                       ('2.1.0', [('foo/bar', '>= 2.0.0')]),
+                                       ('2.2.0', [('foo/bar', '1.5.x')]),
+                                       # no version of foo/baz satisfies this
+                                       ('3.0.0', [('foo/baz', '>= 1.0.0')])),
+            'foo/bar': releases(('1.0.0', []),
+                                ('1.5.0', []),
+                                ('2.0.0', []),
+                                # foo/missing is not in the repository
+                                ('3.0.0', [('foo/missing', '>= 1.0.0')])),
+            'foo/baz': releases(('0.5.0', [])),
+        }
+
+    @staticmethod
+    def versions(result):
+        return dict((name, [r['version'] for r in releases])
+                    for name, releases in result.iteritems())
+
+    def test_pruned(self):
+        result = unit_generator(db=self.db).build_dep_metadata(pruned=True)
+
+        self.assertEqual(self.versions(result), {
+            'me/mymodule': ['1.0.0'],
+            'you/yourmodule': ['2.1.0', '2.2.0'],
+            'foo/bar': ['1.5.0', '2.0.0', '3.0.0'],
+            'foo/missing': [],
+        })
+
+    def test_not_pruned(self):
+        result = unit_generator(db=self.db).build_dep_metadata()
+
+        self.assertEqual(len(result['you/yourmodule']), 4)
+        self.assertEqual(len(result['foo/bar']), 4)
+        self.assertEqual(len(result['foo/baz']), 1)
+
+    def test_unparsable_requirement(self):
+        unit = unit_generator(db=self.db, dependencies=[
+            {'name': 'foo/bar', 'version_requirement': 'not a requirement'}])
+
+        result = unit.build_dep_metadata(pruned=True)
+
+        self.assertEqual(self.versions(result)['foo/bar'], ['1.0.0', '1.5.0', '2.0.0', '3.0.0'])
+
+    def test_null_requirement(self):
+        unit = unit_generator(db=self.db, dependencies=[
+            {'name': 'foo/bar', 'version_requirement': None}])
+
+        result = unit.build_dep_metadata(pruned=True)
+
+        self.assertEqual(self.versions(result)['foo/bar'], ['1.0.0', '1.5.0', '2.0.0', '3.0.0'])
+
+    def test_unparsable_version_kept(self):
+        self.db['foo/bar'] = json.dumps([
+            {'file': '/path/to/%s' % version, 'version': version, 'dependencies': []}
+            for version in ('not-a-version', '1.0.0', '2.0.0')])
+        unit = unit_generator(db=self.db, dependencies=[
+            {'name': 'foo/bar', 'version_requirement': '>= 2.0.0'}])
+
+        result = unit.build_dep_metadata(pruned=True)
+
+        self.assertEqual(self.versions(result)['foo/bar'], ['not-a-version', '2.0.0'])
+
+    def test_no_recurse_ignores_pruned(self):
+        result = unit_generator(db=self.db).build_dep_metadata(recurse_deps=False, pruned=True)
+
+        self.assertEqual(self.versions(result)['you/yourmodule'],
+                         ['1.0.0', '2.1.0', '2.2.0', '3.0.0'])
+
+
 class TestDepsAsList(unittest.TestCase):
     def test_normal(self):
         unit = unit_generator()
@@ -168,15 +289,37 @@ class TestCmp(unittest.TestCase):
     thing. Thus these tests will do good spot-checking, but not an exhaustive
     exercise of every semver possibility.
     """
-    @mock.patch('semantic_version.Version.__cmp__', autospec=True)
+    @mock.patch('semantic_version.Version', wraps=semantic_version.Version)
     def test_uses_semver(self, mock_version):
         """
         If we ever stop using python-semantic_version, we should revisit the
         suite of tests below.
         """
-        unit_generator(version='1.2.0') > unit_generator(version='1.1.3')
-
-        self.assertEqual(mock_version.call_count, 1)
+        unit1 = unit_generator(version='1.2.0')
+        unit2 = unit_generator(version='1.1.3')
+        unit1 > unit2
+        unit1 < unit2
+
+        # each version is only parsed once
+        self.assertEqual(mock_version.call_count, 2)
+
+    @mock.patch('semantic_version.Version', wraps=semantic_version.Version)
+    def test_stored_version_key(self, mock_version):
+        unit1 = unit_generator(version='1.2.0', version_key=version_sort_key('1.2.0'))
+        unit2 = unit_generator(version='1.1.3', version_key=version_sort_key('1.1.3'))
+        mock_version.reset_mock()
+
+        self.assertTrue(unit1 > unit2)
+        self.assertEqual(mock_version.call_count, 0)
+
+    def test_invalid_lt(self):
+        self.assertTrue(unit_generator(version='bad') < unit_generator(version='0.0.1'))
+
+    def test_stored_version_key_from_json(self):
+        # keys read back from the database hold unicode strings
+        key = json.loads(json.dumps(version_sort_key('1.1.0-alpha')))
+        self.assertTrue(unit_generator(version='1.1.0-alpha', version_key=key) <
+                        unit_generator(version='1.1.0-beta'))
 
     def test_plain_gt(self):
         self.assertTrue(unit_generator(version='1.2.0') > unit_generator(version='1.1.3'))
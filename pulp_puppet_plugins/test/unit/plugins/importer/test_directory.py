@@ -512,8 +512,9 @@ class TestSynchronizeWithDirectory(TestCase):
         method._remove_missing([mock_unit], [])
         self.assertEqual(0, mock_conduit.remove_unit.call_count)
 
+    @patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
     @patch('pulp_puppet.plugins.importers.directory.shutil')
-    def test_add_module(self, mock_shutil):
+    def test_add_module(self, mock_shutil, mock_checksum):
         module_path = '/tmp/mod.tar.gz'
         feed_url = 'http://host/root/PULP_MANAFEST'
         unit_key = {'name': 'puppet-module'}
@@ -538,12 +539,15 @@ class TestSynchronizeWithDirectory(TestCase):
 
         # validation
 
+        mock_checksum.assert_called_once_with(module_path, constants.FILE_MD5_HASHLIB)
+        self.assertEqual(mock_module.file_md5, mock_checksum.return_value)
         mock_conduit.init_unit.assert_called_with(
             constants.TYPE_PUPPET_MODULE, unit_key, unit_metadata, mock_module.filename())
         mock_shutil.copy.assert_called_with(module_path, unit.storage_path)
 
+    @patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
     @patch('pulp_puppet.plugins.importers.directory.shutil')
-    def test_add_module_not_copied(self, mock_shutil):
+    def test_add_module_not_copied(self, mock_shutil, mock_checksum):
         module_path = '/tmp/mod.tar.gz'
         feed_url = 'http://host/root/PULP_MANAFEST'
         unit_key = {'name': 'puppet-module'}
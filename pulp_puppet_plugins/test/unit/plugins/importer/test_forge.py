@@ -295,6 +295,24 @@ class TestSynchronizeWithPuppetForge(unittest.TestCase):
         self.assertEqual(pr.metadata_state, constants.STATE_CANCELED)
         self.assertEqual(pr.modules_state, constants.STATE_NOT_STARTED)
 
+    @mock.patch('pulp_puppet.plugins.importers.downloaders.local.LocalDownloader.retrieve_metadata')
+    def test_parse_metadata_merges_queries(self, mock_retrieve):
+        # Setup
+        doc = open(os.path.join(DATA_DIR, 'repos', 'valid', 'modules.json')).read()
+        mock_retrieve.return_value = [doc, doc]
+
+        # Test
+        metadata = self.method._parse_metadata()
+
+        # Verify
+        self.assertEqual(2, len(metadata.modules))
+
+        pr = self.method.progress_report
+        self.assertEqual(pr.metadata_state, constants.STATE_SUCCESS)
+        self.assertEqual(pr.metadata_query_result_counts,
+                         [{'result_count': 2, 'new_count': 2},
+                          {'result_count': 2, 'new_count': 0}])
+
     @mock.patch('pulp_puppet.plugins.importers.downloaders.local.LocalDownloader.retrieve_metadata')
     def test_parse_metadata_parse_exception(self, mock_retrieve):
         # Setup
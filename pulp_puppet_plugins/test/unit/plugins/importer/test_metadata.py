@@ -136,6 +136,14 @@ class SuccessfulMetadataTests(unittest.TestCase):
         self.assertEquals(sample_checksum,
                           "108e8d1d9bb42c869344fc2d327c80e7f079d2ba0119da446a6a1c6659e0f0aa")
 
+    def test_checksums_calculation(self):
+        sample_module = os.path.join(self.module_dir, "jdob-valid-1.1.0.tar.gz")
+        sample_checksums = metadata.calculate_checksums(sample_module, ['sha256', 'md5'])
+        self.assertEquals(sample_checksums['sha256'],
+                          "108e8d1d9bb42c869344fc2d327c80e7f079d2ba0119da446a6a1c6659e0f0aa")
+        self.assertEquals(sample_checksums['md5'],
+                          metadata.calculate_checksum(sample_module, 'md5'))
+
 
 class NegativeMetadataTests(unittest.TestCase):
 
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+"""
+Tests for pulp_puppet.plugins.migrations.0003_puppet_module_unit_file_md5
+"""
+import unittest
+
+from mock import MagicMock, patch
+from pulp.server.db.migrate.models import _import_all_the_way
+
+from pulp_puppet.common import constants
+
+
+migration = _import_all_the_way('pulp_puppet.plugins.migrations.0003_puppet_'
+                                'module_unit_file_md5')
+
+
+def _cursor(units):
+    """
+    :return: mock database cursor over the given unit documents
+    """
+    cursor = MagicMock()
+    cursor.__iter__.return_value = iter(units)
+    return cursor
+
+
+class Test0003PuppetModuleUnitFileMD5(unittest.TestCase):
+    """
+    Test the migration of the puppet module content units adds the file MD5
+    """
+
+    @patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
+    @patch.object(migration, 'ContentQueryManager', autospec=True)
+    def test_migration(self, mock_query_manager, mock_calc_checksum):
+        storage_path = '/foo/storage'
+        mock_calc_checksum.return_value = "foo_md5"
+        unit = {'_id': 'unit_id', '_storage_path': storage_path}
+        collection = mock_query_manager.return_value.get_content_unit_collection.return_value
+        collection.find.return_value = _cursor([unit])
+
+        migration.migrate()
+
+        mock_calc_checksum.assert_called_once_with(storage_path, constants.FILE_MD5_HASHLIB)
+        collection.update.assert_called_once_with(
+            {'_id': 'unit_id'}, {'$set': {'file_md5': 'foo_md5'}}, safe=True)
+        collection.find.assert_called_once_with(
+            {'file_md5': {'$exists': False}}, fields=['_storage_path'], timeout=False)
+        collection.find.return_value.close.assert_called_once_with()
+
+    @patch.object(migration, 'HASHING_BATCH_SIZE', 2)
+    @patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
+    @patch.object(migration, 'ContentQueryManager', autospec=True)
+    def test_migration_batches(self, mock_query_manager, mock_calc_checksum):
+        mock_calc_checksum.side_effect = lambda path, hashlib: path + '_md5'
+        units = [{'_id': 'unit_%d' % i, '_storage_path': 'path_%d' % i} for i in range(5)]
+        collection = mock_query_manager.return_value.get_content_unit_collection.return_value
+        collection.find.return_value = _cursor(units)
+
+        migration.migrate()
+
+        updated = sorted(c[0][0]['_id'] for c in collection.update.call_args_list)
+        self.assertEqual(updated, ['unit_%d' % i for i in range(5)])
+        self.assertEqual(mock_calc_checksum.call_count, 5)
+
+    @patch('pulp_puppet.plugins.importers.metadata.calculate_checksum')
+    @patch.object(migration, 'ContentQueryManager', autospec=True)
+    def test_migration_missing_file(self, mock_query_manager, mock_calc_checksum):
+        mock_calc_checksum.side_effect = IOError()
+        unit = {'_id': 'unit_id', '_storage_path': '/foo/storage'}
+        collection = mock_query_manager.return_value.get_content_unit_collection.return_value
+        collection.find.return_value = _cursor([unit])
+
+        migration.migrate()
+
+        self.assertFalse(collection.update.called)
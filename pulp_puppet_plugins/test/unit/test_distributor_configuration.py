@@ -62,6 +62,97 @@ class HttpsTests(unittest.TestCase):
         self.assertTrue(constants.CONFIG_SERVE_HTTPS in msg)
 
 
+class StaticReleasesTests(unittest.TestCase):
+
+    def test_validate_static_releases(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_STATIC_RELEASES : 'true'}, {})
+        result, msg = configuration._validate_static_releases(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_static_releases_unspecified(self):
+        # Test
+        config = PluginCallConfiguration({}, {})
+        result, msg = configuration._validate_static_releases(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_static_releases_invalid(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_STATIC_RELEASES : 'foo'}, {})
+        result, msg = configuration._validate_static_releases(config)
+
+        # Verify
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_STATIC_RELEASES in msg)
+
+
+class PrunedDependenciesTests(unittest.TestCase):
+
+    def test_validate_pruned_dependencies(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_PRUNED_DEPENDENCIES : 'true'}, {})
+        result, msg = configuration._validate_pruned_dependencies(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_pruned_dependencies_unspecified(self):
+        # Test
+        config = PluginCallConfiguration({}, {})
+        result, msg = configuration._validate_pruned_dependencies(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_pruned_dependencies_invalid(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_PRUNED_DEPENDENCIES : 'foo'}, {})
+        result, msg = configuration._validate_pruned_dependencies(config)
+
+        # Verify
+        self.assertTrue(not result)
+        self.assertTrue(constants.CONFIG_PRUNED_DEPENDENCIES in msg)
+
+
+class SymlinkThreadsTests(unittest.TestCase):
+
+    def test_validate_symlink_threads(self):
+        # Test
+        config = PluginCallConfiguration({constants.CONFIG_SYMLINK_THREADS : '4'}, {})
+        result, msg = configuration._validate_symlink_threads(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_symlink_threads_unspecified(self):
+        # Test
+        config = PluginCallConfiguration({}, {})
+        result, msg = configuration._validate_symlink_threads(config)
+
+        # Verify
+        self.assertTrue(result)
+        self.assertTrue(msg is None)
+
+    def test_validate_symlink_threads_invalid(self):
+        for value in ('foo', '0', -1):
+            # Test
+            config = PluginCallConfiguration({constants.CONFIG_SYMLINK_THREADS : value}, {})
+            result, msg = configuration._validate_symlink_threads(config)
+
+            # Verify
+            self.assertTrue(not result)
+            self.assertTrue(constants.CONFIG_SYMLINK_THREADS in msg)
+
+
 class FullValidationTests(unittest.TestCase):
 
     @mock.patch('pulp_puppet.plugins.distributors.configuration._validate_http')
@@ -12,6 +12,7 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import gdbm
+import gzip
 import hashlib
 import json
 import os
@@ -24,6 +25,7 @@ from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.model import Repository, PublishReport, Unit
 
 from pulp_puppet.common import constants
+from pulp_puppet.common.dependency_index import DependencyIndex
 from pulp_puppet.plugins.distributors import publish
 
 # -- constants ----------------------------------------------------------------
@@ -33,6 +35,26 @@ FAKE_PULP_STORAGE_DIR = os.path.join(DATA_DIR, 'repos', 'valid')
 
 # -- test cases ---------------------------------------------------------------
 
+class FakeDB(dict):
+    """Fake version of gdbm database that counts writes"""
+    close_called = False
+    reorganized = False
+    writes = 0
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        dict.__setitem__(self, key, value)
+
+    def has_key(self, key):
+        return key in self
+
+    def reorganize(self):
+        self.reorganized = True
+
+    def close(self):
+        self.close_called = True
+
+
 class MockConduit(mock.MagicMock):
 
     def build_success_report(self, summary, details):
@@ -49,6 +71,7 @@ class PublishRunTests(unittest.TestCase):
         self.test_httpd_base = tempfile.mkdtemp(prefix='pulp-puppet-dist-publish')
         self.test_http_dir = os.path.join(self.test_httpd_base, 'http')
         self.test_https_dir = os.path.join(self.test_httpd_base, 'https')
+        self.test_master_dir = os.path.join(self.test_httpd_base, 'master')
 
         os.mkdir(self.test_http_dir)
         os.mkdir(self.test_https_dir)
@@ -76,6 +99,7 @@ class PublishRunTests(unittest.TestCase):
             {
                 constants.CONFIG_HTTP_DIR : self.test_http_dir,
                 constants.CONFIG_HTTPS_DIR : self.test_https_dir,
+                constants.CONFIG_MASTER_DIR : self.test_master_dir,
             },
             {
                 constants.CONFIG_SERVE_HTTP : True,
@@ -96,11 +120,6 @@ class PublishRunTests(unittest.TestCase):
 
     @mock.patch('gdbm.open')
     def test_generate_dep_data(self, mock_open):
-        class FakeDB(dict):
-            """Fake version of gdbm database"""
-            close_called = False
-            def close(self):
-                self.close_called = True
         mock_open.return_value = FakeDB()
         file_to_test = os.path.join(DATA_DIR, 'simple', 'xinetd-1.2.0.tar.gz')
         with open(file_to_test, 'r') as file_handle:
@@ -119,7 +138,9 @@ class PublishRunTests(unittest.TestCase):
                  {'dependencies': [{'name': 'me/foo', 'version_requirement': '>= 1.0.0'}]},
                  file_to_test),
         ]
-        self.run._generate_dependency_data(units)
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
 
         db = mock_open.return_value
         self.assertTrue(db.close_called)
@@ -133,6 +154,184 @@ class PublishRunTests(unittest.TestCase):
         self.assertEqual(bar_data[0]['dependencies'][0]['version_requirement'], '>= 1.0.0')
         self.assertEqual(bar_data[0]['file_md5'], md5_sum)
 
+    @mock.patch('gdbm.open')
+    def test_generate_dep_data_sorted(self, mock_open):
+        mock_open.return_value = FakeDB()
+
+        units = [
+            Unit(constants.TYPE_PUPPET_MODULE,
+                 {'name': 'foo', 'version': version, 'author': 'me'},
+                 {'dependencies': [], 'file_md5': 'md5'}, '/does/not/exist')
+            for version in ('1.10.0', '1.2.0', 'not-semver', '1.2.0-rc1')
+        ]
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        db = mock_open.return_value
+        foo_data = json.loads(db['me/foo'])
+        self.assertEqual([d['version'] for d in foo_data],
+                         ['not-semver', '1.2.0-rc1', '1.2.0', '1.10.0'])
+        self.assertEqual(foo_data[-1]['version_key'], [1, 1, 10, 0, [1]])
+        self.assertEqual(json.loads(db[constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/foo']),
+                         foo_data[-1])
+        self.assertEqual(db[constants.REPO_DEPDATA_FORMAT_KEY],
+                         constants.REPO_DEPDATA_FORMAT_VERSION)
+
+    def test_store_dependency_data_incremental(self):
+        def entry(version, file_md5='md5'):
+            return {'file': 'f', 'version': version, 'dependencies': [],
+                    'file_md5': file_md5,
+                    'version_key': publish.version_sort_key(version)}
+
+        db = FakeDB()
+        dict.__setitem__(db, 'me/foo', json.dumps([entry('1.0.0'), entry('2.0.0')]))
+        dict.__setitem__(db, 'me/bar', json.dumps([entry('1.0.0')]))
+        dict.__setitem__(db, constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/bar',
+                         json.dumps(entry('1.0.0')))
+        self.run.incremental = True
+        self.run.removed_entries = [{'author': 'me', 'name': 'bar', 'version': '1.0.0'}]
+
+        added_entries = {}
+        for version, file_md5 in (('1.5.0', 'md5'), ('1.0.0', 'new')):
+            unit = Unit(constants.TYPE_PUPPET_MODULE,
+                        {'name': 'foo', 'version': version, 'author': 'me'},
+                        {'dependencies': [], 'file_md5': file_md5}, '/does/not/exist')
+            self.run._add_dependency_entry(added_entries, unit)
+
+        changed_keys = self.run._store_dependency_data(db, added_entries)
+
+        self.assertEqual(changed_keys, set(['me/foo', 'me/bar']))
+        foo_data = json.loads(db['me/foo'])
+        self.assertEqual([d['version'] for d in foo_data], ['1.0.0', '1.5.0', '2.0.0'])
+        # the added release replaces the one of the same version
+        self.assertEqual(foo_data[0]['file_md5'], 'new')
+        self.assertEqual(json.loads(db[constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/foo']),
+                         foo_data[-1])
+        self.assertFalse('me/bar' in db)
+        self.assertFalse(constants.REPO_DEPDATA_LATEST_KEY_PREFIX + 'me/bar' in db)
+        # each list and latest release is written once
+        self.assertEqual(db.writes, 2)
+        self.assertTrue(db.reorganized)
+
+    @mock.patch('gdbm.open')
+    def test_generate_dep_data_stored_md5(self, mock_open):
+        mock_open.return_value = FakeDB()
+
+        units = [
+            Unit(constants.TYPE_PUPPET_MODULE,
+                 {'name': 'foo', 'version': '1.0.3', 'author': 'me'},
+                 {'dependencies': [], 'file_md5': 'stored_md5'}, '/does/not/exist'),
+        ]
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        foo_data = json.loads(mock_open.return_value['me/foo'])
+        self.assertEqual(foo_data[0]['file_md5'], 'stored_md5')
+
+    @mock.patch('gdbm.open')
+    def test_generate_dep_data_closures(self, mock_open):
+        mock_open.return_value = FakeDB()
+
+        def unit(name, *deps):
+            return Unit(constants.TYPE_PUPPET_MODULE,
+                        {'name': name, 'version': '1.0.0', 'author': 'me'},
+                        {'dependencies': [{'name': 'me/%s' % d} for d in deps],
+                         'file_md5': 'md5'}, '/does/not/exist')
+
+        units = [unit('a', 'b'), unit('b', 'c', 'missing'), unit('c', 'a'), unit('d')]
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        db = mock_open.return_value
+        prefix = constants.REPO_DEPDATA_CLOSURE_KEY_PREFIX
+        self.assertEqual(json.loads(db[prefix + 'me/a']), ['me/b', 'me/c', 'me/missing'])
+        self.assertEqual(json.loads(db[prefix + 'me/b']), ['me/a', 'me/c', 'me/missing'])
+        self.assertEqual(json.loads(db[prefix + 'me/d']), [])
+        self.assertFalse(prefix + 'me/missing' in db)
+
+    @mock.patch('gdbm.open')
+    def test_generate_dep_data_search_index(self, mock_open):
+        mock_open.return_value = FakeDB()
+
+        def unit(name, version, summary, tags):
+            return Unit(constants.TYPE_PUPPET_MODULE,
+                        {'name': name, 'version': version, 'author': 'me'},
+                        {'dependencies': [], 'file_md5': 'md5', 'summary': summary,
+                         'tag_list': tags}, '/does/not/exist')
+
+        units = [unit('a', '1.10.0', 'Web server', ['http']), unit('a', '1.2.0', 'Old', []),
+                 unit('b', '1.0.0', 'Database server', [])]
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        db = mock_open.return_value
+        self.assertEqual(json.loads(db[constants.REPO_DEPDATA_MODULES_KEY]), ['me/a', 'me/b'])
+        entry = json.loads(db[constants.REPO_DEPDATA_MODULE_KEY_PREFIX + 'me/a'])
+        self.assertEqual(entry['version'], '1.10.0')
+        self.assertEqual(entry['tag_list'], ['http'])
+        prefix = constants.REPO_DEPDATA_SEARCH_KEY_PREFIX
+        self.assertEqual(json.loads(db[prefix + 'server']), ['me/a', 'me/b'])
+        self.assertEqual(json.loads(db[prefix + 'http']), ['me/a'])
+        # only the latest release of a module is searched
+        self.assertFalse(prefix + 'old' in db)
+
+    def test_store_search_index_stale(self):
+        db = {constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + 'gone': '["me/gone"]',
+              constants.REPO_DEPDATA_MODULE_KEY_PREFIX + 'me/gone': '{}',
+              'me/a': '[]'}
+        entries = {'me/a': {'author': 'me', 'name': 'a', 'tag_list': []}}
+
+        self.assertTrue(self.run._store_search_index(db, entries))
+        self.assertEqual(sorted(db), sorted([
+            'me/a', constants.REPO_DEPDATA_MODULES_KEY,
+            constants.REPO_DEPDATA_MODULE_KEY_PREFIX + 'me/a',
+            constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + 'me',
+            constants.REPO_DEPDATA_SEARCH_KEY_PREFIX + 'a']))
+
+        # storing the same index again changes nothing
+        self.assertFalse(self.run._store_search_index(db, entries))
+
+    def test_generate_static_releases(self):
+        self.config.override_config[constants.CONFIG_STATIC_RELEASES] = True
+
+        def unit(name, version, *deps):
+            return Unit(constants.TYPE_PUPPET_MODULE,
+                        {'name': name, 'version': version, 'author': 'me'},
+                        {'dependencies': [{'name': 'me/%s' % d, 'version_requirement': '>= 1.0.0'}
+                                          for d in deps],
+                         'file_md5': 'md5'}, '/does/not/exist/me-%s-%s.tar.gz' % (name, version))
+
+        units = [unit('a', '1.0.0'), unit('a', '1.10.0', 'b'), unit('a', '1.2.0'),
+                 unit('b', '1.0.0', 'c'), unit('c', '1.0.0')]
+        self.conduit.get_units.return_value = units
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        releases_dir = os.path.join(self.run._build_dir(), constants.STATIC_RELEASES_RELATIVE_PATH)
+        self.assertEqual(sorted(os.listdir(os.path.join(releases_dir, 'me'))),
+                         ['a.json', 'b.json', 'c.json'])
+
+        releases = json.load(open(os.path.join(releases_dir, 'me', 'a.json')))
+        self.assertEqual(sorted(releases), ['me/a', 'me/b', 'me/c'])
+        self.assertEqual([r['version'] for r in releases['me/a']], ['1.10.0'])
+        self.assertEqual(releases['me/a'][0]['dependencies'], [['me/b', '>= 1.0.0']])
+        self.assertEqual(releases['me/a'][0]['file'],
+                         '/pulp/puppet/test-repo/system/releases/m/me/me-a-1.10.0.tar.gz')
+
+        releases = json.load(open(os.path.join(releases_dir, 'me', 'c.json')))
+        self.assertEqual(sorted(releases), ['me/c'])
+
+    def test_generate_static_releases_disabled(self):
+        self.run._init_build_dir()
+        self.run._generate_metadata()
+
+        releases_dir = os.path.join(self.run._build_dir(), constants.STATIC_RELEASES_RELATIVE_PATH)
+        self.assertFalse(os.path.exists(releases_dir))
+
     def test_perform_publish(self):
         # Test
         report = self.run.perform_publish()
@@ -153,8 +352,18 @@ class PublishRunTests(unittest.TestCase):
             self.assertTrue(os.path.exists(https_published_filename), msg='%s does not exist' % https_published_filename)
             self.assertTrue(os.path.islink(https_published_filename), msg='%s is not a symlink' % https_published_filename)
 
-        # Build directory was cleaned up
-        self.assertTrue(not os.path.exists(self.run._build_dir()))
+        # Both protocols serve the same published build through a symlink
+        http_repo_dir = os.path.join(self.test_http_dir, self.repo.id)
+        https_repo_dir = os.path.join(self.test_https_dir, self.repo.id)
+        self.assertTrue(os.path.islink(http_repo_dir))
+        self.assertEqual(os.readlink(http_repo_dir), os.readlink(https_repo_dir))
+        self.assertEqual(os.path.dirname(os.readlink(http_repo_dir)),
+                         os.path.join(self.test_master_dir, self.repo.id))
+
+        # Build directory was kept for the next publish along with its manifest
+        self.assertTrue(os.path.exists(self.run._build_dir()))
+        self.assertTrue(os.path.exists(self.run._manifest_path()))
+        self.assertFalse(self.run.incremental)
 
         # Dependency metadata was generated
         expected_dep_file = os.path.join(self.test_http_dir, self.repo.id, constants.REPO_DEPDATA_FILENAME)
@@ -169,6 +378,15 @@ class PublishRunTests(unittest.TestCase):
                 self.assertEqual(data[0]['version'], unit.unit_key['version'])
                 self.assertTrue(isinstance(data[0].get('dependencies'), list))
                 self.assertTrue('file' in data[0])
+
+        # Dependency index holds the same data
+        expected_index_file = os.path.join(self.test_http_dir, self.repo.id,
+                                           constants.REPO_DEPINDEX_FILENAME)
+        index = DependencyIndex(expected_index_file)
+        self.assertEqual(index.keys(), sorted(db.keys()))
+        for key in index.keys():
+            self.assertEqual(index[key], db[key])
+        index.close()
         db.close()
 
         self.assertTrue(os.path.exists(self.test_http_dir))
@@ -200,6 +418,198 @@ class PublishRunTests(unittest.TestCase):
         self.assertEqual(pr.publish_http, constants.STATE_SUCCESS)
         self.assertEqual(pr.publish_https, constants.STATE_SUCCESS)
 
+    def test_incremental_publish(self):
+        # Setup
+        self.run.perform_publish()
+        removed_unit = self.units.pop()
+        self.conduit.get_units.return_value = self.units
+
+        # Test
+        run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                             self.is_cancelled_call)
+        report = run.perform_publish()
+
+        # Verify
+        self.assertTrue(report.success_flag)
+        self.assertTrue(run.incremental)
+        self.assertEqual(run.added_module_keys, set())
+        self.assertEqual(len(run.removed_entries), 1)
+
+        author = removed_unit.unit_key['author']
+        relative_path = constants.HOSTED_MODULE_FILE_RELATIVE_PATH % (author[0], author)
+        removed_filename = os.path.join(self.test_http_dir, self.repo.id, relative_path,
+                                        os.path.basename(removed_unit.storage_path))
+        self.assertFalse(os.path.lexists(removed_filename))
+
+        expected_dep_file = os.path.join(self.test_http_dir, self.repo.id,
+                                         constants.REPO_DEPDATA_FILENAME)
+        db = gdbm.open(expected_dep_file)
+        try:
+            removed_key = '%s/%s' % (author, removed_unit.unit_key['name'])
+            self.assertFalse(db.has_key(removed_key))
+            self.assertFalse(db.has_key(constants.REPO_DEPDATA_LATEST_KEY_PREFIX + removed_key))
+            remaining = self.units[0].unit_key
+            remaining_key = '%s/%s' % (remaining['author'], remaining['name'])
+            self.assertTrue(db.has_key(remaining_key))
+            self.assertTrue(db.has_key(constants.REPO_DEPDATA_LATEST_KEY_PREFIX + remaining_key))
+        finally:
+            db.close()
+
+        manifest = json.load(open(run._manifest_path()))
+        self.assertEqual(len(manifest['modules']), 1)
+
+    def test_incremental_publish_repo_path_changed(self):
+        # Setup
+        self.run.perform_publish()
+        self.config.override_config = {constants.CONFIG_ABSOLUTE_PATH: '/other/'}
+
+        # Test
+        manifest = self.run._load_manifest()
+
+        # Verify
+        self.assertTrue(manifest is None)
+        self.assertFalse(os.path.exists(self.run._manifest_path()))
+
+    def test_publish_metadata_artifacts(self):
+        # Test
+        self.run.perform_publish()
+
+        # Verify
+        metadata_file = os.path.join(self.test_http_dir, self.repo.id,
+                                     constants.REPO_METADATA_FILENAME)
+        content = open(metadata_file).read()
+
+        compressed = gzip.open(metadata_file + constants.REPO_METADATA_GZIP_SUFFIX)
+        self.assertEqual(compressed.read(), content)
+        compressed.close()
+
+        checksum = open(metadata_file + constants.REPO_METADATA_CHECKSUM_SUFFIX).read().split()
+        self.assertEqual(checksum, [hashlib.sha256(content).hexdigest(),
+                                    constants.REPO_METADATA_FILENAME])
+
+    def test_republish_unchanged_metadata_keeps_mtime(self):
+        # Setup
+        self.run.perform_publish()
+        metadata_file = os.path.join(self.test_http_dir, self.repo.id,
+                                     constants.REPO_METADATA_FILENAME)
+        os.utime(os.path.realpath(metadata_file), (1000000000, 1000000000))
+
+        # Test
+        run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                             self.is_cancelled_call)
+        run.perform_publish()
+
+        # Verify
+        for suffix in ('', constants.REPO_METADATA_GZIP_SUFFIX,
+                       constants.REPO_METADATA_CHECKSUM_SUFFIX):
+            self.assertEqual(os.stat(metadata_file + suffix).st_mtime, 1000000000)
+
+    def test_republish_unchanged_metadata_same_gzip(self):
+        # Setup
+        self.run.perform_publish()
+        compressed_file = os.path.join(self.test_http_dir, self.repo.id,
+                                       constants.REPO_METADATA_FILENAME +
+                                       constants.REPO_METADATA_GZIP_SUFFIX)
+        compressed = open(compressed_file, 'rb').read()
+
+        # Test
+        run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                             self.is_cancelled_call)
+        run.perform_publish()
+
+        # Verify
+        self.assertEqual(open(compressed_file, 'rb').read(), compressed)
+        # no modification time in the gzip header
+        self.assertEqual(compressed[4:8], '\0\0\0\0')
+
+    def test_served_metadata_checksum_of_live_build(self):
+        # Setup
+        self.run.perform_publish()
+        metadata_file = os.path.join(self.test_http_dir, self.repo.id,
+                                     constants.REPO_METADATA_FILENAME)
+        served_checksum = open(metadata_file + constants.REPO_METADATA_CHECKSUM_SUFFIX).read()
+        # a newer build left behind by a publish that failed before going live
+        failed_build = os.path.join(self.test_master_dir, self.repo.id, '99999999999999999999')
+        os.makedirs(failed_build)
+        failed_file = os.path.join(failed_build, constants.REPO_METADATA_FILENAME)
+        open(failed_file, 'w').close()
+        with open(failed_file + constants.REPO_METADATA_CHECKSUM_SUFFIX, 'w') as f:
+            f.write('other  %s\n' % constants.REPO_METADATA_FILENAME)
+
+        # Test
+        result = self.run._served_metadata_checksum()
+
+        # Verify
+        self.assertEqual(result, (served_checksum.split()[0], os.stat(metadata_file).st_mtime))
+
+    def test_republish_changed_metadata_new_mtime(self):
+        # Setup
+        self.run.perform_publish()
+        metadata_file = os.path.join(self.test_http_dir, self.repo.id,
+                                     constants.REPO_METADATA_FILENAME)
+        os.utime(os.path.realpath(metadata_file), (1000000000, 1000000000))
+        self.units.pop()
+
+        # Test
+        run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                             self.is_cancelled_call)
+        run.perform_publish()
+
+        # Verify
+        self.assertNotEqual(os.stat(metadata_file).st_mtime, 1000000000)
+
+    def test_republish_removes_old_builds(self):
+        # Setup
+        builds_dir = os.path.join(self.test_master_dir, self.repo.id)
+
+        # Test
+        for i in range(3):
+            self.run.perform_publish()
+
+        # Verify
+        builds = sorted(os.listdir(builds_dir))
+        self.assertEqual(len(builds), 2)
+        current = os.readlink(os.path.join(self.test_http_dir, self.repo.id))
+        self.assertEqual(current, os.path.join(builds_dir, builds[-1]))
+
+    def test_republish_links_build_files(self):
+        # Setup
+        self.run.perform_publish()
+        first_build = os.readlink(os.path.join(self.test_http_dir, self.repo.id))
+        first_dep_file = os.path.join(first_build, constants.REPO_DEPDATA_FILENAME)
+        with open(first_dep_file) as f:
+            first_dep_data = f.read()
+        self.conduit.get_units.return_value = self.units[1:]
+
+        # Test
+        run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                             self.is_cancelled_call)
+        run.perform_publish()
+
+        # Verify
+        self.assertTrue(run.incremental)
+        second_build = os.readlink(os.path.join(self.test_http_dir, self.repo.id))
+        self.assertNotEqual(first_build, second_build)
+        # unchanged files are shared with the build directory
+        index_file = os.path.join(second_build, constants.REPO_DEPINDEX_FILENAME)
+        self.assertEqual(os.stat(index_file).st_nlink, 2)
+        # the previous build is not changed by the publish after it
+        with open(first_dep_file) as f:
+            self.assertEqual(f.read(), first_dep_data)
+        metadata_file = os.path.join(first_build, constants.REPO_METADATA_FILENAME)
+        self.assertEqual(os.stat(metadata_file).st_nlink, 1)
+
+    def test_publish_replaces_directory(self):
+        # Setup
+        old_repo_dir = os.path.join(self.test_http_dir, self.repo.id)
+        os.makedirs(old_repo_dir)
+
+        # Test
+        self.run.perform_publish()
+
+        # Verify
+        self.assertTrue(os.path.islink(old_repo_dir))
+
     def test_unpublish_http(self):
         """
         After a successful publish, run another without HTTP to make sure the
@@ -295,13 +705,19 @@ class PublishRunTests(unittest.TestCase):
         self.assertTrue(os.path.exists(build_dir))
         self.assertTrue(not os.path.exists(sample_file))
 
-    @mock.patch('os.symlink')
-    def test_failed_symlink(self, mock_symlink):
+    def test_failed_symlink(self):
         # Setup
-        mock_symlink.side_effect = Exception() # simulate write permission error
+        real_symlink = os.symlink
+
+        def symlink(source, link_name):
+            # simulate write permission error for the module symlinks only
+            if source.endswith('.tar.gz'):
+                raise Exception()
+            real_symlink(source, link_name)
 
         # Test
-        report = self.run.perform_publish()
+        with mock.patch('os.symlink', side_effect=symlink):
+            report = self.run.perform_publish()
 
         # Verify
         self.assertTrue(report.success_flag) # still an overall success
@@ -314,6 +730,115 @@ class PublishRunTests(unittest.TestCase):
 
         self.assertEqual(pr.metadata_state, constants.STATE_SUCCESS)
 
+    def test_failed_symlink_incremental(self):
+        # Setup
+        failed_unit = self.units[0]
+        failed_file = os.path.basename(failed_unit.storage_path)
+        real_symlink = os.symlink
+
+        def symlink(source, link_name):
+            # simulate write permission error for a single module
+            if source.endswith(failed_file):
+                raise Exception()
+            real_symlink(source, link_name)
+
+        # Test
+        with mock.patch('os.symlink', side_effect=symlink):
+            self.run.perform_publish()
+            for i in range(2):
+                run = publish.PuppetModulePublishRun(self.repo, self.conduit, self.config,
+                                                     self.is_cancelled_call)
+                report = run.perform_publish()
+
+        # Verify
+        self.assertTrue(report.success_flag)
+        self.assertTrue(run.incremental)
+        failed_key = publish._manifest_key(failed_unit.unit_key)
+        self.assertEqual(run.failed_module_keys, set([failed_key]))
+
+        expected_dep_file = os.path.join(self.test_http_dir, self.repo.id,
+                                         constants.REPO_DEPDATA_FILENAME)
+        db = gdbm.open(expected_dep_file)
+        try:
+            for unit in self.units:
+                key = '%s/%s' % (unit.unit_key['author'], unit.unit_key['name'])
+                versions = [] if unit is failed_unit else [unit.unit_key['version']]
+                module_list = json.loads(db[key]) if db.has_key(key) else []
+                self.assertEqual([m['version'] for m in module_list], versions)
+        finally:
+            db.close()
+
+    @mock.patch.object(publish, 'UNIT_PAGE_SIZE', 1)
+    def test_iterate_repo_modules_paged(self):
+        # Setup
+        def get_units(criteria):
+            return self.units[criteria.skip:criteria.skip + criteria.limit]
+        self.conduit.get_units.side_effect = get_units
+
+        # Test
+        modules = list(self.run._iterate_repo_modules(('_storage_path',)))
+
+        # Verify
+        self.assertEqual(modules, self.units)
+        # one page per unit, then an empty page
+        self.assertEqual(self.conduit.get_units.call_count, 3)
+        criteria = self.conduit.get_units.call_args[1]['criteria']
+        self.assertEqual(criteria.type_ids, [constants.TYPE_PUPPET_MODULE])
+        self.assertEqual(sorted(criteria.unit_fields),
+                         ['_storage_path', 'author', 'name', 'version'])
+
+    def test_symlink_modules_author_dirs_created_once(self):
+        # Setup
+        units = []
+        for i in range(4):
+            key = {'author' : 'jdob', 'name' : 'module%d' % i, 'version' : '1.0.0'}
+            storage_path = os.path.join(FAKE_PULP_STORAGE_DIR, 'jdob-module%d-1.0.0.tar.gz' % i)
+            units.append(Unit(constants.TYPE_PUPPET_MODULE, key, {}, storage_path))
+        self.run._init_build_dir()
+
+        # Test
+        with mock.patch('os.makedirs', side_effect=os.makedirs) as mock_makedirs:
+            self.run._symlink_modules(units)
+
+        # Verify
+        paths = [os.path.join(self.run._build_dir(), self.run._build_relative_path(u))
+                 for u in units]
+        author_dir = os.path.dirname(paths[0])
+        created = [c[0][0] for c in mock_makedirs.call_args_list]
+        self.assertEqual(created.count(author_dir), 1)
+        self.assertEqual(self.run.progress_report.modules_finished_count, 4)
+        for path in paths:
+            self.assertTrue(os.path.islink(path))
+
+    @mock.patch.object(publish, 'SYMLINK_BATCH_SIZE', 1)
+    def test_symlink_modules_progress_per_batch(self):
+        # Setup
+        self.run._init_build_dir()
+        self.run.progress_report.update_progress = mock.MagicMock()
+
+        # Test
+        self.run._symlink_modules(self.units)
+
+        # Verify
+        # one update for the initial counts, then one per batch
+        self.assertEqual(self.run.progress_report.update_progress.call_count, 3)
+        self.assertEqual(self.run.progress_report.modules_finished_count, 2)
+
+    def test_symlink_modules_threaded(self):
+        # Setup
+        self.config.override_config[constants.CONFIG_SYMLINK_THREADS] = 2
+        self.run._init_build_dir()
+
+        # Test
+        self.run._symlink_modules(self.units)
+
+        # Verify
+        self.assertEqual(self.run.progress_report.modules_finished_count, 2)
+        self.assertEqual(self.run.progress_report.modules_error_count, 0)
+        for unit in self.units:
+            path = os.path.join(self.run._build_dir(), self.run._build_relative_path(unit))
+            self.assertEqual(os.readlink(path), unit.storage_path)
+
     def test_unpublish_repo(self):
         # Setup
         os.makedirs(os.path.join(self.test_http_dir, self.repo.id))
@@ -325,3 +850,15 @@ class PublishRunTests(unittest.TestCase):
         # Verify
         self.assertTrue(not os.path.exists(os.path.join(self.test_http_dir, self.repo.id)))
         self.assertTrue(not os.path.exists(os.path.join(self.test_https_dir, self.repo.id)))
+
+    def test_unpublish_repo_published(self):
+        # Setup
+        self.run.perform_publish()
+
+        # Test
+        publish.unpublish_repo(self.repo, self.config)
+
+        # Verify
+        self.assertFalse(os.path.lexists(os.path.join(self.test_http_dir, self.repo.id)))
+        self.assertFalse(os.path.lexists(os.path.join(self.test_https_dir, self.repo.id)))
+        self.assertFalse(os.path.exists(os.path.join(self.test_master_dir, self.repo.id)))